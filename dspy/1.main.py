@@ -1,11 +1,13 @@
 import dspy
 import os
 # import logging
-import mlflow
-mlflow.dspy.autolog()
-mlflow.set_tracking_uri("http://127.0.0.1:5000")
-# Create a unique name for your experiment.
-mlflow.set_experiment("DspyPredict")
+from dspy_optimization.cache import install_cache
+from dspy_optimization.ratelimit import SERVING, scheduler_from_env
+from dspy_optimization.sentiment import SentimentClassifier
+from dspy_optimization.structured import StructuredOutputAdapter
+from dspy_optimization.tracing import setup_tracing
+# MLflow tracing, DSPY_TRACING=off|lazy|on (lazy: mlflow is imported on the first program call)
+setup_tracing("DspyPredict")
 
 # logging.basicConfig(level=logging.DEBUG)
 os.environ['DSPY_DEBUG'] = '1'
@@ -13,17 +15,14 @@ os.environ['DSPY_DEBUG'] = '1'
 key = os.getenv("AZURE_OPENAI_API_KEY")
 llm = dspy.LM(model=f"azure/{os.getenv('AZURE_OPENAI_MODEL')}", api_key=key, api_base=os.getenv(
     "AZURE_OPENAI_ENDPOINT"), api_version=os.getenv("AZURE_OPENAI_API_VERSION"))
+# client-side throttling and retries per deployment (LM_MAX_RPS, LM_MAX_CONCURRENCY)
+lm_scheduler = scheduler_from_env()
+llm = lm_scheduler.wrap(llm, priority=SERVING)
 
-dspy.settings.configure(lm=llm, trace=[])
-
-
-class SentimentClassifier(dspy.Signature):
-    """Classify the sentiment of a text."""
-
-    text: str = dspy.InputField(desc="input text to classify sentiment")
-    sentiment: int = dspy.OutputField(
-        desc="sentiment, the higher the more positive", ge=0, le=10
-    )
+# the output schema (int, 0 <= sentiment <= 10) goes to the model as a JSON-schema response_format, like traditional/1.main.py
+adapter = StructuredOutputAdapter()
+dspy.settings.configure(lm=llm, adapter=adapter, trace=[])
+lm_cache = install_cache()
 
 
 predict = dspy.Predict(SentimentClassifier)
@@ -33,3 +32,5 @@ output = predict(text="I am feeling pretty happy!")
 print(f"The sentiment is: {output.sentiment}")
 print("="*50)
 dspy.inspect_history(n=1)
+print(lm_cache.report())
+print(adapter.report())
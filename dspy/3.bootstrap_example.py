@@ -2,83 +2,31 @@ import dspy
 import os
 from dspy.evaluate import Evaluate
 #import logging
-import mlflow
-from dspy.teleprompt import BootstrapFewShot
-mlflow.dspy.autolog()
-mlflow.set_tracking_uri("http://127.0.0.1:5000")
-# Create a unique name for your experiment.
-mlflow.set_experiment("dspyfewshot")
+from dspy_optimization.artifact import export_artifact
+from dspy_optimization.cache import install_cache
+from dspy_optimization.checkpoint import CheckpointStore
+from dspy_optimization.distributed import CheckpointedDistributedBootstrapFewShot, DistributedEvaluate, executor_from_env
+from dspy_optimization.ensemble import SelfConsistentRouter
+from dspy_optimization.evaluation import PredictionSet, format_confusion_matrix
+from dspy_optimization.knn import DemoIndex, KNNTicketRouter
+from dspy_optimization.prerouter import CascadeTicketRouter
+from dspy_optimization.prompt_budget import PromptCompactor, format_profile, profile_program
+from dspy_optimization.ratelimit import OPTIMIZER, scheduler_from_env
+from dspy_optimization.tickets import TicketRouter, trainset, testset, exact_match, business_critical_match, team_wise_accuracy
+from dspy_optimization.tracing import setup_tracing
+# MLflow tracing, DSPY_TRACING=off|lazy|on (lazy: mlflow is imported on the first program call)
+setup_tracing("dspyfewshot")
 
 key = os.getenv("AZURE_OPENAI_API_KEY")
 llm = dspy.LM(model=f"azure/{os.getenv('AZURE_OPENAI_MODEL')}", api_key=key, api_base=os.getenv("AZURE_OPENAI_ENDPOINT"), api_version=os.getenv("AZURE_OPENAI_API_VERSION"))
+# client-side throttling and retries per deployment (LM_MAX_RPS, LM_MAX_CONCURRENCY)
+lm_scheduler = scheduler_from_env()
+llm = lm_scheduler.wrap(llm, priority=OPTIMIZER)
 
 dspy.settings.configure(lm=llm, trace=[])
-
-# Define signature
-class RouteTicket(dspy.Signature):
-    """Route support tickets to appropriate teams."""
-    ticket_text = dspy.InputField(desc="Customer support ticket content")
-    team = dspy.OutputField(desc="One of: Billing, Technical, Sales, Urgent, General")
-
-# Training Data (20 examples)
-trainset = [
-    dspy.Example(ticket_text="I was double charged this month, need refund", team="Billing").with_inputs('ticket_text'),
-    dspy.Example(ticket_text="API giving 500 errors since morning", team="Technical").with_inputs('ticket_text'),
-    dspy.Example(ticket_text="Website completely down, customers complaining", team="Urgent").with_inputs('ticket_text'),
-    dspy.Example(ticket_text="Want to upgrade to enterprise plan", team="Sales").with_inputs('ticket_text'),
-    dspy.Example(ticket_text="Where to download invoice?", team="Billing").with_inputs('ticket_text'),
-    dspy.Example(ticket_text="Database connection timeout errors", team="Technical").with_inputs('ticket_text'),
-    dspy.Example(ticket_text="Payment failed but money deducted", team="Billing").with_inputs('ticket_text'),
-    dspy.Example(ticket_text="Can't login, password reset not working", team="Urgent").with_inputs('ticket_text'),
-    dspy.Example(ticket_text="Need pricing for 100 users", team="Sales").with_inputs('ticket_text'),
-    dspy.Example(ticket_text="How to export user data?", team="General").with_inputs('ticket_text'),
-    dspy.Example(ticket_text="Subscription cancelled but still charged", team="Billing").with_inputs('ticket_text'),
-    dspy.Example(ticket_text="Mobile app crashing on iOS", team="Technical").with_inputs('ticket_text'),
-    dspy.Example(ticket_text="Server not responding, complete outage", team="Urgent").with_inputs('ticket_text'),
-    dspy.Example(ticket_text="Interested in API partnership", team="Sales").with_inputs('ticket_text'),
-    dspy.Example(ticket_text="Where is my order confirmation?", team="General").with_inputs('ticket_text'),
-    dspy.Example(ticket_text="Tax ID missing from invoice", team="Billing").with_inputs('ticket_text'),
-    dspy.Example(ticket_text="Slow response times from API", team="Technical").with_inputs('ticket_text'),
-    dspy.Example(ticket_text="Security breach suspected", team="Urgent").with_inputs('ticket_text'),
-    dspy.Example(ticket_text="Volume discount for startup?", team="Sales").with_inputs('ticket_text'),
-    dspy.Example(ticket_text="How to change company address?", team="General").with_inputs('ticket_text'),
-]
-
-# Test Data (10 examples)
-testset = [
-    dspy.Example(ticket_text="Credit card declined but it should work", team="Billing").with_inputs('ticket_text'),
-    dspy.Example(ticket_text="SSL certificate expired error", team="Technical").with_inputs('ticket_text'),
-    dspy.Example(ticket_text="All services down across regions", team="Urgent").with_inputs('ticket_text'),
-    dspy.Example(ticket_text="Want to discuss custom solution", team="Sales").with_inputs('ticket_text'),
-    dspy.Example(ticket_text="Where to find documentation?", team="General").with_inputs('ticket_text'),
-    dspy.Example(ticket_text="Invoice amount doesn't match agreement", team="Billing").with_inputs('ticket_text'),
-    dspy.Example(ticket_text="Database backup failing", team="Technical").with_inputs('ticket_text'),
-    dspy.Example(ticket_text="Unauthorized charges on my account", team="Billing").with_inputs('ticket_text'),
-    dspy.Example(ticket_text="Can't process any payments", team="Urgent").with_inputs('ticket_text'),
-    dspy.Example(ticket_text="Feature comparison between plans", team="Sales").with_inputs('ticket_text'),
-]
-
-# Build the program
-class TicketRouter(dspy.Module):
-    def __init__(self):
-        super().__init__()
-        self.router = dspy.ChainOfThought(RouteTicket)
-    
-    def forward(self, ticket_text):
-        return self.router(ticket_text=ticket_text)
-
-def exact_match(example, pred, trace=None):
-    return example.team.lower() == pred.team.lower()
-
-def business_critical_match(example, pred, trace=None):
-    """Urgent tickets must be correctly identified"""
-    if example.team == "Urgent":
-        return pred.team == "Urgent"
-    return example.team.lower() == pred.team.lower()
-
-def team_wise_accuracy(example, pred, trace=None):
-    """Returns team name if correct, else 'wrong' for analysis"""
-    return example.team if example.team.lower() == pred.team.lower() else "wrong"
+lm_cache = install_cache()
+# DSPY_WORKERS=4 runs evaluations and bootstrapping in worker processes (threads of this process when unset)
+executor = executor_from_env()
 
 # DEMO TIME!
 print("🚀 DSPy Optimization Demo: Ticket Routing System")
@@ -89,7 +37,8 @@ print("\n1️⃣ BASELINE EVALUATION (Zero-Shot):")
 baseline_router = TicketRouter()
 
 # Use built-in evaluator for baseline
-baseline_evaluator = Evaluate(
+baseline_evaluator = DistributedEvaluate(
+    executor=executor,
     devset=testset, 
     metric=exact_match, 
     num_threads=4, 
@@ -102,17 +51,24 @@ print(f"📊 Baseline Exact Match Accuracy: {baseline_accuracy}")
 print("=" * 40)
 print("2️⃣ OPTIMIZING with BootstrapFewShot...")
 
-teleprompter = BootstrapFewShot(
+# bootstrapped traces are checkpointed per example (and per model): a re-run after a crash or on a grown trainset
+# only bootstraps the examples it has not seen
+checkpoint = CheckpointStore("dspy/checkpoints/ticket_router.jsonl")
+teleprompter = CheckpointedDistributedBootstrapFewShot(
+    store=checkpoint,
+    executor=executor,
     metric=exact_match,
     max_bootstrapped_demos=5,
     max_rounds=2
 )
 
-optimized_router = teleprompter.compile(TicketRouter(), trainset=trainset)
+with lm_cache.pinned(), lm_scheduler.watch(interval_s=10):
+    optimized_router = teleprompter.compile(TicketRouter(), trainset=trainset)
 
 # Test optimized version
 print("3️⃣ OPTIMIZED - Few-Shot Performance:")
-optimized_evaluator = Evaluate(
+optimized_evaluator = DistributedEvaluate(
+    executor=executor,
     devset=testset, 
     metric=exact_match, 
     num_threads=4, 
@@ -125,36 +81,96 @@ print(f"📊 Optimized Exact Match Accuracy: {optimized_accuracy}")
 print("=" * 40)
 print("\n4️⃣ COMPREHENSIVE COMPARISON METRICS")
 
-# Evaluate both with multiple metrics
+# Reuse the predictions from steps 1 and 3: every metric below is scored without calling the LM again
+baseline_predictions = PredictionSet.from_evaluation(baseline_accuracy)
+optimized_predictions = PredictionSet.from_evaluation(optimized_accuracy)
+
 metrics = {
     "Exact Match": exact_match,
-    "Business Critical (Urgent Caught)": business_critical_match
+    "Business Critical (Urgent Caught)": business_critical_match,
+    "Team-wise Accuracy": team_wise_accuracy,
 }
 
-comparison_results = {}
+baseline_report = baseline_predictions.evaluate(metrics)
+optimized_report = optimized_predictions.evaluate(metrics)
 
-for metric_name, metric_func in metrics.items():
-    print(f"\n📈 Evaluating: {metric_name}")
-    
-    # Evaluate baseline
-    baseline_eval = Evaluate(devset=testset, metric=metric_func, num_threads=4)
-    baseline_score = baseline_eval(baseline_router)
-    
-    # Evaluate optimized
-    optimized_eval = Evaluate(devset=testset, metric=metric_func, num_threads=4)
-    optimized_score = optimized_eval(optimized_router)
-    
-    comparison_results[metric_name] = {
-        'baseline': baseline_score["score"],
-        'optimized': optimized_score["score"],
-        'improvement': optimized_score['score'] - baseline_score['score']
-    }
-    
 print("\n✅ Summary of Results:")
-for metric_name, results in comparison_results.items():
-    print(f"• {metric_name}: Baseline = {results['baseline']}, Optimized = {results['optimized']}, Improvement = {results['improvement']}")
+for metric_name, metric_func in metrics.items():
+    baseline, optimized = baseline_report[metric_name], optimized_report[metric_name]
+    if "score" not in baseline:
+        print(f"• {metric_name}: Baseline = {baseline['counts']}, Optimized = {optimized['counts']}")
+        continue
+    improvement = baseline_predictions.compare(optimized_predictions, metric_func)
+    print(f"• {metric_name}: Baseline = {baseline['score']} (95% CI {baseline['ci95']}), "
+          f"Optimized = {optimized['score']} (95% CI {optimized['ci95']}), "
+          f"Improvement = {improvement['improvement']} (95% CI {improvement['ci95']})")
+
+for name, predictions in [("Baseline", baseline_predictions), ("Optimized", optimized_predictions)]:
+    print(f"\n📊 {name} confusion matrix (team):")
+    print(format_confusion_matrix(*predictions.confusion_matrix("team")))
+    for team, stats in predictions.per_class("team").items():
+        print(f"   {team}: precision {stats['precision']}, recall {stats['recall']} (95% CI {stats['recall_ci95']}), n={stats['support']}")
+
+
+# 5. NEAREST-NEIGHBOUR DEMOS: only the k most similar demos go into each prompt
+print("=" * 40)
+print("\n5️⃣ NEAREST-NEIGHBOUR DEMO SELECTION")
+demo_index = DemoIndex.from_examples(optimized_router.router.predict.demos, trainset, key="ticket_text")
+knn_router = KNNTicketRouter(demo_index, k=2)
+knn_evaluator = Evaluate(
+    devset=testset,
+    metric=exact_match,
+    num_threads=4,
+    display_progress=True
+)
+knn_accuracy = knn_evaluator(knn_router)
+print(f"📊 kNN (k=2 of {len(demo_index.demos)} demos) Exact Match Accuracy: {knn_accuracy}")
+demo_index.save("dspy/ticket_demo_index")
 
+# 6. CASCADE: a local TF-IDF classifier answers confident tickets, the LM handles the rest
+print("=" * 40)
+print("\n6️⃣ LOCAL PRE-ROUTER CASCADE")
+cascade_router = CascadeTicketRouter.train(optimized_router, trainset, threshold=0.6, shadow_rate=0.2)
+cascade_accuracy = Evaluate(devset=testset, metric=exact_match, num_threads=4, display_progress=True)(cascade_router)
+cascade_stats = cascade_router.stats()
+print(f"📊 Cascade Exact Match Accuracy: {cascade_accuracy}")
+print(f"   Short-circuited {cascade_stats['short_circuit_rate']:.0%} of tickets, "
+      f"shadow agreement with the LM: {cascade_stats['shadow_agreement']}")
+cascade_router.classifier.save("dspy/ticket_prerouter.npz")
+
+# 7. PROMPT BUDGET: where the prompt tokens go, and which of them can go without losing accuracy
+print("=" * 40)
+print("\n7️⃣ PROMPT TOKEN BUDGET")
+print(format_profile(profile_program(optimized_router, **testset[0].inputs())))
+# steps are accepted on the trainset, so the testset stays held out for judging the compacted router
+compaction = PromptCompactor(exact_match, trainset).run(optimized_router)
+for step in compaction["steps"]:
+    print(f"   {'✅' if step['accepted'] else '❌'} {step['step']}: {step['tokens_per_call']} tokens/call, train score {step['score']}")
+compacted_accuracy = Evaluate(devset=testset, metric=exact_match, num_threads=4, display_progress=True)(compaction["program"])
+print(f"   {compaction['baseline']['tokens_per_call']} -> {compaction['compacted']['tokens_per_call']} prompt tokens per call "
+      f"({compaction['compacted']['saved']:.0%} saved) at no trainset accuracy loss; "
+      f"test accuracy {optimized_accuracy.score} -> {compacted_accuracy.score}")
+
+# 8. SELF-CONSISTENCY: majority vote over up to 5 samples, stopping once 3 agree
+print("=" * 40)
+print("\n8️⃣ SELF-CONSISTENCY VOTING")
+voting_router = SelfConsistentRouter(optimized_router, n=5, min_votes=3)
+voting_accuracy = Evaluate(devset=testset, metric=exact_match, num_threads=4, display_progress=True)(voting_router)
+voting_predictions = PredictionSet.from_evaluation(voting_accuracy)
+voting_report = voting_predictions.evaluate(metrics)
+for metric_name in ["Exact Match", "Business Critical (Urgent Caught)"]:
+    print(f"• {metric_name}: Optimized = {optimized_report[metric_name]['score']}, "
+          f"Self-consistent = {voting_report[metric_name]['score']} (95% CI {voting_report[metric_name]['ci95']})")
+print(f"   {voting_router.report()}")
 
 # saving both models
 baseline_router.save("dspy/baseline_ticket_router.json")
-optimized_router.save("dspy/optimized_ticket_router.json")
\ No newline at end of file
+optimized_router.save("dspy/optimized_ticket_router.json")
+# serving artifact: pre-rendered prompt + demos, loadable without dspy
+export_artifact(optimized_router, "dspy/optimized_ticket_router.artifact.json")
+print(lm_cache.report())
+print(lm_scheduler.report())
+print(checkpoint.report())
+if executor is not None:
+    print(executor.report())
+    executor.close()
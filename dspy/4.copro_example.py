@@ -1,91 +1,27 @@
 import dspy
 import os
 # import logging
-import mlflow
-from dspy.teleprompt import COPRO
-
-mlflow.dspy.autolog()
-mlflow.set_tracking_uri("http://127.0.0.1:5000")
-# Create a unique name for your experiment.
-mlflow.set_experiment("dspyfewshot")
+from dspy_optimization.copro import ParallelCOPRO
+from dspy_optimization.sales import SalesQualifier, trainset
+from dspy_optimization.artifact import export_artifact
+from dspy_optimization.cache import install_cache
+from dspy_optimization.checkpoint import CheckpointStore, warm_start
+from dspy_optimization.ratelimit import OPTIMIZER, scheduler_from_env
+from dspy_optimization.streaming import FieldStreamer, FieldUpdate
+from dspy_optimization.tracing import setup_tracing
+
+# MLflow tracing, DSPY_TRACING=off|lazy|on (lazy: mlflow is imported on the first program call)
+setup_tracing("dspyfewshot")
 
 key = os.getenv("AZURE_OPENAI_API_KEY")
 llm = dspy.LM(model=f"azure/{os.getenv('AZURE_OPENAI_MODEL')}", api_key=key, api_base=os.getenv(
     "AZURE_OPENAI_ENDPOINT"), api_version=os.getenv("AZURE_OPENAI_API_VERSION"))
+# client-side throttling and retries per deployment (LM_MAX_RPS, LM_MAX_CONCURRENCY)
+lm_scheduler = scheduler_from_env()
+llm = lm_scheduler.wrap(llm, priority=OPTIMIZER)
 
 dspy.settings.configure(lm=llm, trace=[])
-
-# 🔥 PROBLEM: Sales Email Qualification - Complex Multi-Factor Analysis
-class QualifySalesLead(dspy.Signature):
-    """Analyze sales emails and predict deal success probability."""
-    email_conversation = dspy.InputField(desc="Email exchange between sales and prospect")
-    company_tier = dspy.OutputField(desc="Startup, SMB, Mid-Market, Enterprise")
-    decision_maker_engaged = dspy.OutputField(desc="yes, no, or partially")
-    budget_alignment = dspy.OutputField(desc="below, within, or above our pricing")
-    urgency_level = dspy.OutputField(desc="low, medium, high, critical")
-    deal_stage = dspy.OutputField(desc="Discovery, Demo, Proposal, Negotiation, Closed-Won, Closed-Lost")
-    confidence_score = dspy.OutputField(desc="0-100% probability of closing")
-    next_best_action = dspy.OutputField(desc="Specific recommended sales action")
-    reasoning = dspy.OutputField(desc="Step-by-step analysis of all factors")
-
-class SalesQualifier(dspy.Module):
-    def __init__(self):
-        super().__init__()
-        self.qualify = dspy.ChainOfThought(QualifySalesLead)
-    
-    def forward(self, email_conversation):
-        return self.qualify(email_conversation=email_conversation)
-
-# 🎯 TRAINING DATA: Real-world sales scenarios
-trainset = [
-    dspy.Example(
-        email_conversation="""
-        Prospect: "We're a 50-person startup looking to scale. Can you send pricing?"
-        Sales: "Sure! Our growth plan is $299/month. Would you like a demo?"
-        Prospect: "That's higher than expected. We'll discuss internally."
-        """,
-        company_tier="Startup",
-        decision_maker_engaged="partially", 
-        budget_alignment="below",
-        urgency_level="low",
-        deal_stage="Discovery",
-        confidence_score="25%",
-        next_best_action="Send case studies showing ROI for similar startups",
-        reasoning="Startup with budget concerns, no decision maker engaged, early stage discussion"
-    ).with_inputs('email_conversation'),
-    
-    dspy.Example(
-        email_conversation="""
-        Prospect: "I'm the CTO at 500-employee company. We need this implemented before Q4."
-        Sales: "Understood. Our enterprise plan starts at $5K/month. Available for technical deep dive?"
-        Prospect: "Yes, bring your solutions architect. We have budget approved."
-        """,
-        company_tier="Mid-Market",
-        decision_maker_engaged="yes",
-        budget_alignment="within", 
-        urgency_level="high",
-        deal_stage="Demo",
-        confidence_score="75%",
-        next_best_action="Schedule technical deep dive with solutions architect",
-        reasoning="CTO engaged, budget approved, timeline urgency, mid-market company"
-    ).with_inputs('email_conversation'),
-    
-    dspy.Example(
-        email_conversation="""
-        Prospect: "We're evaluating vendors for $500K annual contract. Send security docs."
-        Sales: "Here's our SOC2 compliance. When can we discuss your requirements?"
-        Prospect: "Our procurement team will review. We're deciding in 30 days."
-        """,
-        company_tier="Enterprise", 
-        decision_maker_engaged="partially",
-        budget_alignment="above",
-        urgency_level="medium",
-        deal_stage="Proposal",
-        confidence_score="60%",
-        next_best_action="Engage procurement team directly with compliance documentation",
-        reasoning="Large contract, procurement process, security focus, longer sales cycle"
-    ).with_inputs('email_conversation'),
-]
+lm_cache = install_cache()
 
 print("🚀 **EXECUTIVE DEMO: AI-Powered Sales Intelligence**")
 print("=" * 55)
@@ -134,19 +70,24 @@ print("   • Testing strategic qualification approaches")
 print("   • Learning to identify buying signals")
 print("   • Optimizing for enterprise sales patterns")
 
-copro_optimizer = COPRO(
+copro_optimizer = ParallelCOPRO(
     metric=lambda example, pred, trace=None: 1.0,  # Simple metric for demo
     depth=2,           # Optimization rounds
     breadth=3,         # Candidate strategies
     verbose=True,      # Show the optimization process
+    num_threads=8,     # Score all candidates of a round concurrently
+    # scores and proposals survive a crash; re-runs only score new (candidate, example) pairs
+    checkpoint=CheckpointStore("dspy/checkpoints/sales_qualifier.jsonl"),
 )
 
 # Run COPRO - this is where the magic happens
-optimized_qualifier = copro_optimizer.compile(
-    SalesQualifier(),
-    trainset=trainset,
-    eval_kwargs={'num_threads': 1, 'display_progress': False}
-)
+with lm_cache.pinned(), lm_scheduler.watch(interval_s=10):
+    optimized_qualifier = copro_optimizer.compile(
+        # start from the previous run's instructions when there is one
+        warm_start(SalesQualifier(), "dspy/sales_qualifier_copro.json"),
+        trainset=trainset,
+        eval_kwargs={'num_threads': 8, 'display_progress': False}
+    )
 
 # 3. 🎯 THE TRANSFORMATION: Show Dramatic Improvement
 print("\n3️⃣ COPRO-OPTIMIZED: Enterprise Sales Intelligence")
@@ -164,6 +105,12 @@ print(f"   Confidence: {optimized_pred.confidence_score}")
 print(f"   Next Action: {optimized_pred.next_best_action}")
 print(f"   Strategic Reasoning: {optimized_pred.reasoning}")
 
+# Streaming: structured fields are usable (e.g. for CRM updates) while reasoning is still generating
+print("\n📡 Streaming the same analysis, fields as they complete:")
+for update in FieldStreamer(optimized_qualifier, answer_first=True).stream(email_conversation=complex_email):
+    if isinstance(update, FieldUpdate) and update.name != "reasoning":
+        print(f"   +{update.elapsed_s * 1000:6.0f} ms  {update.name}: {update.value}")
+
 # 4. 🎯 BUSINESS IMPACT: Show Concrete Value
 print("\n4️⃣ BUSINESS IMPACT DEMONSTRATION")
 print("-" * 35)
@@ -176,3 +123,7 @@ if optimized_pred.next_best_action != baseline_pred.next_best_action:
     print("✅ **COPRO discovered a better sales strategy!**")
 
 optimized_qualifier.save("dspy/sales_qualifier_copro.json")
+export_artifact(optimized_qualifier, "dspy/sales_qualifier_copro.artifact.json")
+print(lm_cache.report())
+print(lm_scheduler.report())
+print(copro_optimizer.checkpoint.report())
@@ -0,0 +1,5 @@
+"""Shared building blocks for the example scripts in this repo.
+
+Modules are imported explicitly (``from dspy_optimization.nps import NPSTopic``) so that
+loading one helper does not pull in the rest.
+"""
@@ -0,0 +1,233 @@
+"""Serving artifacts for compiled programs.
+
+``Module.save`` stores optimizer state; loading it back means importing dspy (and with it the
+teleprompt/optimizer stack), rebuilding the module and re-rendering every prompt. An artifact
+instead holds, per predictor, the fully rendered messages (instructions and demos included)
+with placeholders for the inputs, plus what is needed to request and parse the reply: a JSON
+adapter's ``response_format`` (the JSON schema of ``StructuredOutputAdapter``) is stored and
+sent with every call. Loading one only needs the standard library, so router replicas start
+fast and stay small.
+
+Build time (imports dspy):
+    export_artifact(optimized_router, "dspy/optimized_ticket_router.artifact.json")
+
+Serving time (no dspy import):
+    program = load_artifact("dspy/optimized_ticket_router.artifact.json")
+    program(openai_completer(client, "gpt-4o-mini"), ticket_text="Payment failed but money deducted").team
+
+Or from the command line, for programs saved by the example scripts:
+    python -m dspy_optimization.artifact ticket_router dspy/optimized_ticket_router.json dspy/optimized_ticket_router.artifact.json
+"""
+import argparse
+import hashlib
+import json
+import re
+import typing
+from typing import Any, Callable
+
+ARTIFACT_FORMAT = "dspy-optimization-artifact"
+# 2: per-predictor response_format
+ARTIFACT_VERSION = 2
+
+_PLACEHOLDER = re.compile(r"\{\{input:(\w+)\}\}")
+_CHAT_HEADER = re.compile(r"\[\[ ## (\w+) ## \]\]")
+
+
+class ArtifactParseError(ValueError):
+    """The LM reply did not contain every output field of the predictor."""
+
+
+def _digest(payload: dict[str, Any]) -> str:
+    body = {k: v for k, v in payload.items() if k != "sha256"}
+    return hashlib.sha256(json.dumps(body, sort_keys=True, ensure_ascii=False).encode()).hexdigest()
+
+
+def _field_kind(annotation) -> str:
+    if annotation in (str, int, float, bool):
+        return annotation.__name__
+    if typing.get_origin(annotation) is typing.Literal and all(isinstance(a, str) for a in typing.get_args(annotation)):
+        return "str"
+    return "json"
+
+
+def _extract_json_object(completion: str) -> dict[str, Any]:
+    # like JSONAdapter: the first JSON object in the reply, so text or code fences around it are fine
+    decoder = json.JSONDecoder()
+    for match in re.finditer(r"\{", completion):
+        try:
+            value, _ = decoder.raw_decode(completion, match.start())
+        except json.JSONDecodeError:
+            continue
+        if isinstance(value, dict):
+            return value
+    raise ArtifactParseError("reply does not contain a JSON object")
+
+
+def _response_format(adapter, signature) -> dict[str, Any] | None:
+    import dspy
+
+    from dspy_optimization.structured import StructuredOutputAdapter
+
+    if isinstance(adapter, StructuredOutputAdapter) and adapter.native is not False:
+        return adapter.response_format(signature)
+    if isinstance(adapter, dspy.JSONAdapter):
+        return {"type": "json_object"}
+    return None
+
+
+def export_artifact(program, path: str, adapter=None) -> dict[str, Any]:
+    """Render every predictor of `program` with `adapter` (default: the configured one, else ChatAdapter) and write the artifact."""
+    import dspy
+
+    adapter = adapter or dspy.settings.adapter or dspy.ChatAdapter()
+    adapter_kind = "json" if isinstance(adapter, dspy.JSONAdapter) else "chat"
+    predictors = {}
+    for name, predictor in program.named_predictors():
+        signature = predictor.signature
+        placeholders = {field: f"{{{{input:{field}}}}}" for field in signature.input_fields}
+        messages = adapter.format(signature, predictor.demos, placeholders)
+        predictors[name] = {
+            "messages": messages,
+            "inputs": {field: _field_kind(info.annotation) for field, info in signature.input_fields.items()},
+            "outputs": {field: _field_kind(info.annotation) for field, info in signature.output_fields.items()},
+            "lm_kwargs": {k: v for k, v in predictor.config.items() if isinstance(v, (int, float, str, bool))},
+            "response_format": _response_format(adapter, signature),
+            "num_demos": len(predictor.demos),
+        }
+
+    payload = {
+        "format": ARTIFACT_FORMAT,
+        "version": ARTIFACT_VERSION,
+        "program": type(program).__name__,
+        "adapter": adapter_kind,
+        "dspy_version": getattr(dspy, "__version__", None),
+        "predictors": predictors,
+    }
+    payload["sha256"] = _digest(payload)
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(payload, f, indent=2, ensure_ascii=False)
+    return payload
+
+
+class CompiledPredictor:
+    def __init__(self, name: str, spec: dict[str, Any], adapter: str):
+        self.name = name
+        self.messages = spec["messages"]
+        self.inputs = spec["inputs"]
+        self.outputs = spec["outputs"]
+        self.lm_kwargs = spec.get("lm_kwargs", {})
+        if spec.get("response_format"):
+            self.lm_kwargs = {**self.lm_kwargs, "response_format": spec["response_format"]}
+        self.adapter = adapter
+
+    def render(self, **inputs) -> list[dict[str, str]]:
+        missing = set(self.inputs) - set(inputs)
+        if missing:
+            raise ValueError(f"{self.name} is missing inputs: {sorted(missing)}")
+        values = {
+            field: value if self.inputs[field] == "str" and isinstance(value, str) else json.dumps(value, ensure_ascii=False)
+            for field, value in inputs.items()
+        }
+        return [
+            {**message, "content": _PLACEHOLDER.sub(lambda m: values[m.group(1)], message["content"])}
+            for message in self.messages
+        ]
+
+    def _cast(self, field: str, raw: Any) -> Any:
+        kind = self.outputs[field]
+        if not isinstance(raw, str) or kind == "str":
+            return raw
+        if kind == "bool":
+            return raw.strip().lower() in ("true", "yes", "1")
+        return json.loads(raw) if kind == "json" else {"int": int, "float": float}[kind](raw.strip())
+
+    def parse(self, completion: str) -> dict[str, Any]:
+        if self.adapter == "json":
+            try:
+                raw = _extract_json_object(completion)
+            except ArtifactParseError as e:
+                raise ArtifactParseError(f"{self.name}: {e}") from e
+        else:
+            parts = _CHAT_HEADER.split(completion)
+            raw = {parts[i]: parts[i + 1].strip() for i in range(1, len(parts) - 1, 2)}
+        missing = [field for field in self.outputs if field not in raw]
+        if missing:
+            raise ArtifactParseError(f"{self.name}: reply is missing fields {missing}")
+        try:
+            return {field: self._cast(field, raw[field]) for field in self.outputs}
+        except ValueError as e:
+            raise ArtifactParseError(f"{self.name}: {e}") from e
+
+
+class Prediction(dict):
+    """Parsed outputs with attribute access, like ``dspy.Prediction``."""
+
+    def __getattr__(self, name):
+        try:
+            return self[name]
+        except KeyError:
+            raise AttributeError(name) from None
+
+
+class CompiledProgram:
+    def __init__(self, payload: dict[str, Any]):
+        self.payload = payload
+        self.sha256 = payload["sha256"]
+        self.predictors = {name: CompiledPredictor(name, spec, payload["adapter"]) for name, spec in payload["predictors"].items()}
+
+    def predictor(self, name: str | None = None) -> CompiledPredictor:
+        if name is None:
+            if len(self.predictors) != 1:
+                raise ValueError(f"program has {len(self.predictors)} predictors, pick one of {sorted(self.predictors)}")
+            return next(iter(self.predictors.values()))
+        return self.predictors[name]
+
+    def __call__(self, complete: Callable[..., str], predictor: str | None = None, **inputs) -> Prediction:
+        """Render, call `complete(messages, **lm_kwargs)` and parse the reply of a single-predictor program."""
+        target = self.predictor(predictor)
+        return Prediction(target.parse(complete(target.render(**inputs), **target.lm_kwargs)))
+
+
+def load_artifact(path: str, expected_sha256: str | None = None) -> CompiledProgram:
+    """Load and verify an artifact; raises ValueError on an unknown format, newer version or hash mismatch."""
+    with open(path, "r", encoding="utf-8") as f:
+        payload = json.load(f)
+    if payload.get("format") != ARTIFACT_FORMAT:
+        raise ValueError(f"{path} is not a {ARTIFACT_FORMAT} file")
+    if payload.get("version", 0) > ARTIFACT_VERSION:
+        raise ValueError(f"{path} has artifact version {payload['version']}, this loader supports up to {ARTIFACT_VERSION}")
+    digest = _digest(payload)
+    if digest != payload.get("sha256") or (expected_sha256 and digest != expected_sha256):
+        raise ValueError(f"{path} failed its integrity check")
+    return CompiledProgram(payload)
+
+
+def openai_completer(client, model: str) -> Callable[..., str]:
+    """Adapt an ``openai.OpenAI``/``openai.AzureOpenAI`` client to the `complete` callable ``CompiledProgram`` expects."""
+
+    def complete(messages, **lm_kwargs):
+        kwargs = {k: v for k, v in lm_kwargs.items() if k in ("temperature", "max_tokens", "top_p", "response_format")}
+        response = client.chat.completions.create(model=model, messages=messages, **kwargs)
+        return response.choices[0].message.content
+
+    return complete
+
+
+def main():
+    from dspy_optimization.loadtest import PROGRAMS
+
+    parser = argparse.ArgumentParser(description="Convert a program saved with Module.save() into a serving artifact.")
+    parser.add_argument("program", choices=sorted(PROGRAMS))
+    parser.add_argument("saved", help="JSON written by Module.save()")
+    parser.add_argument("output", help="artifact file to write")
+    args = parser.parse_args()
+
+    make_program, make_adapter, _ = PROGRAMS[args.program]
+    program = make_program()
+    program.load(args.saved)
+    payload = export_artifact(program, args.output, adapter=make_adapter())
+    print(f"Wrote {args.output} (sha256 {payload['sha256']})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,231 @@
+"""Side-by-side cost benchmark of the DSPy programs and the hand-written prompts in traditional/.
+
+Each pair runs over the same inputs at the same concurrency and the report (JSON) has, per
+implementation: p50/p95 latency, prompt and completion tokens per request, requests per second
+and the parse-failure rate, plus dspy/traditional ratios.
+
+    python -m dspy_optimization.benchmark --concurrency 8 --requests 100 --output benchmark_report.json
+    python -m dspy_optimization.benchmark --backend azure        # same, against AZURE_OPENAI_* from the environment
+"""
+import argparse
+import json
+import os
+from typing import Any, Callable
+
+import dspy
+import openai
+from dspy.utils.exceptions import AdapterParseError
+from pydantic import BaseModel, ValidationError
+
+from dspy_optimization.business import BusinessAnalysisPipeline
+from dspy_optimization.loadtest import drive, percentile
+from dspy_optimization.mock_lm import MockLMServer
+from dspy_optimization.sentiment import SentimentClassifier
+from dspy_optimization.structured import StructuredOutputAdapter
+
+SENTIMENT_TEXTS = [
+    "I am feeling pretty happy!",
+    "The delivery was late again and nobody answered my emails.",
+    "It's fine, does what it says, nothing special.",
+    "Absolutely love the new dashboard, it saves me an hour a day.",
+    "I want a refund, this is the worst purchase I've made this year.",
+    "Support fixed my issue in five minutes, great experience.",
+]
+
+BUSINESS_CASES = [
+    {
+        "topic": "AI-powered customer support tool",
+        "market_data": "Market growing at 25% annually, current size $2B, competitors: Zendesk, Intercom, Freshdesk. Regulatory environment: Moderate",
+        "customer_feedback": "Users want faster response times, hate answering repetitive queries, willing to pay premium for quality support, want better integration with existing tools",
+    },
+    {
+        "topic": "Usage-based billing platform for SaaS startups",
+        "market_data": "Market growing at 18% annually, current size $900M, competitors: Stripe Billing, Chargebee, Metronome",
+        "customer_feedback": "Finance teams struggle with invoice disputes, want real-time usage visibility, price sensitive below $1M ARR",
+    },
+]
+
+
+# Hand-written baselines, same prompts and response models as traditional/1.main.py and traditional/2.multi.py
+class TraditionalSentiment(BaseModel):
+    text: str
+    sentiment: int
+
+
+class TraditionalBusinessAnalysis(BaseModel):
+    market_analysis: str
+    customer_analysis: str
+    strategic_recommendations: str
+
+
+SENTIMENT_SYSTEM_PROMPT = "You are a sentiment classifier. the sentiment, the higher the more positive is an integer between 0 and 10."
+
+BUSINESS_SYSTEM_PROMPT = """You are a business analyst. Analyze the business opportunity and provide three key analyses:
+1. Market Analysis: Size, growth potential, competitors, and revenue opportunity
+2. Customer Analysis: Pain points, needs, and willingness to pay
+3. Strategic Recommendations: Top recommendations with go-to-market strategy
+
+Return the analysis in the specified structured format."""
+
+
+def _business_user_prompt(topic: str, market_data: str, customer_feedback: str) -> str:
+    return f"""
+Analyze this business opportunity:
+
+TOPIC: {topic}
+
+MARKET DATA:
+{market_data}
+
+CUSTOMER FEEDBACK:
+{customer_feedback}
+
+Provide comprehensive analysis in the three required sections.
+"""
+
+
+class BaselineParseError(Exception):
+    """A traditional/ call whose reply did not parse into its response model."""
+
+
+def _traditional_call(client, model: str, system: str, user: str, response_format: type[BaseModel]) -> dict[str, int]:
+    try:
+        completion = client.chat.completions.parse(
+            model=model,
+            messages=[{"role": "system", "content": system}, {"role": "user", "content": user}],
+            response_format=response_format,
+        )
+    except (ValidationError, openai.LengthFinishReasonError) as e:
+        raise BaselineParseError(str(e)) from e
+    if completion.choices[0].message.parsed is None:
+        raise BaselineParseError(completion.choices[0].message.refusal or "no parsed output")
+    return {"prompt_tokens": completion.usage.prompt_tokens, "completion_tokens": completion.usage.completion_tokens}
+
+
+def _dspy_call(program: dspy.Module, **kwargs) -> dict[str, int]:
+    usage = program(**kwargs).get_lm_usage() or {}
+    return {
+        "prompt_tokens": sum(u.get("prompt_tokens", 0) for u in usage.values()),
+        "completion_tokens": sum(u.get("completion_tokens", 0) for u in usage.values()),
+    }
+
+
+def _is_parse_failure(error: Exception) -> bool:
+    return isinstance(error, (AdapterParseError, BaselineParseError))
+
+
+def summarize(records: list[dict[str, Any]], duration: float) -> dict[str, Any]:
+    succeeded = [r for r in records if "error" not in r]
+    parse_failures = [r for r in records if "error" in r and _is_parse_failure(r["error"])]
+    latencies = [r["latency"] for r in succeeded]
+    n = len(succeeded) or 1
+    return {
+        "requests": len(records),
+        "latency_ms": {"p50": round(1000 * percentile(latencies, 50), 1), "p95": round(1000 * percentile(latencies, 95), 1)},
+        "prompt_tokens_per_request": round(sum(r["result"]["prompt_tokens"] for r in succeeded) / n, 1),
+        "completion_tokens_per_request": round(sum(r["result"]["completion_tokens"] for r in succeeded) / n, 1),
+        "throughput_rps": round(len(succeeded) / duration, 2) if duration else 0.0,
+        "parse_failure_rate": round(len(parse_failures) / len(records), 4) if records else 0.0,
+        "error_rate": round((len(records) - len(succeeded) - len(parse_failures)) / len(records), 4) if records else 0.0,
+    }
+
+
+ADAPTERS = {"chat": dspy.ChatAdapter, "json": dspy.JSONAdapter, "structured": StructuredOutputAdapter}
+
+
+def _ratio(a: float, b: float) -> float | None:
+    return round(a / b, 2) if b else None
+
+
+def build_pairs(client, model: str) -> dict[str, dict[str, tuple[Callable[..., dict[str, int]], list[dict[str, Any]]]]]:
+    sentiment_inputs = [{"text": text} for text in SENTIMENT_TEXTS]
+    sentiment_program = dspy.Predict(SentimentClassifier)
+    business_program = BusinessAnalysisPipeline()
+    return {
+        "sentiment": {
+            "dspy": (lambda **kw: _dspy_call(sentiment_program, **kw), sentiment_inputs),
+            "traditional": (
+                lambda text: _traditional_call(client, model, SENTIMENT_SYSTEM_PROMPT, text, TraditionalSentiment),
+                sentiment_inputs,
+            ),
+        },
+        "business_analysis": {
+            "dspy": (lambda **kw: _dspy_call(business_program, **kw), BUSINESS_CASES),
+            "traditional": (
+                lambda **kw: _traditional_call(client, model, BUSINESS_SYSTEM_PROMPT, _business_user_prompt(**kw),
+                                               TraditionalBusinessAnalysis),
+                BUSINESS_CASES,
+            ),
+        },
+    }
+
+
+def run_benchmark(client, model: str, concurrency: int = 8, requests: int = 50) -> dict[str, Any]:
+    report = {"concurrency": concurrency, "requests_per_implementation": requests, "pairs": {}}
+    for pair, implementations in build_pairs(client, model).items():
+        results = {}
+        for name, (call, inputs) in implementations.items():
+            results[name] = summarize(*drive(call, inputs, concurrency, requests))
+        dspy_stats, traditional_stats = results["dspy"], results["traditional"]
+        results["dspy_vs_traditional"] = {
+            "latency_p50": _ratio(dspy_stats["latency_ms"]["p50"], traditional_stats["latency_ms"]["p50"]),
+            "latency_p95": _ratio(dspy_stats["latency_ms"]["p95"], traditional_stats["latency_ms"]["p95"]),
+            "prompt_tokens": _ratio(dspy_stats["prompt_tokens_per_request"], traditional_stats["prompt_tokens_per_request"]),
+            "completion_tokens": _ratio(dspy_stats["completion_tokens_per_request"], traditional_stats["completion_tokens_per_request"]),
+            "throughput": _ratio(dspy_stats["throughput_rps"], traditional_stats["throughput_rps"]),
+        }
+        report["pairs"][pair] = results
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark DSPy programs against the traditional/ baselines.")
+    parser.add_argument("--backend", choices=["mock", "azure"], default="mock")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--requests", type=int, default=50)
+    parser.add_argument("--mock-latency-ms", type=float, default=200.0)
+    parser.add_argument("--mock-ms-per-token", type=float, default=1.0)
+    parser.add_argument("--adapter", choices=sorted(ADAPTERS), default="chat",
+                        help="adapter for the DSPy side; 'structured' sends a JSON-schema response_format")
+    parser.add_argument("--output", help="write the JSON report here as well")
+    args = parser.parse_args()
+
+    mock = None
+    if args.backend == "mock":
+        mock = MockLMServer(port=0, latency_ms=args.mock_latency_ms, ms_per_token=args.mock_ms_per_token).start()
+        model = "mock-lm"
+        client = openai.OpenAI(base_url=mock.url, api_key="mock")
+        llm = dspy.LM(f"openai/{model}", api_base=mock.url, api_key="mock", cache=False)
+    else:
+        model = os.getenv("AZURE_OPENAI_MODEL")
+        client = openai.AzureOpenAI(
+            azure_deployment=model,
+            api_key=os.getenv("AZURE_OPENAI_API_KEY"),
+            azure_endpoint=os.getenv("AZURE_OPENAI_ENDPOINT"),
+            api_version=os.getenv("AZURE_OPENAI_API_VERSION"),
+        )
+        llm = dspy.LM(model=f"azure/{model}", api_key=os.getenv("AZURE_OPENAI_API_KEY"),
+                      api_base=os.getenv("AZURE_OPENAI_ENDPOINT"), api_version=os.getenv("AZURE_OPENAI_API_VERSION"),
+                      cache=False)
+    # litellm's capability table knows neither the mock model nor Azure deployment names; both accept
+    # the JSON-schema response_format the traditional/ side already sends
+    adapter = StructuredOutputAdapter(native=True) if args.adapter == "structured" else ADAPTERS[args.adapter]()
+    dspy.settings.configure(lm=llm, adapter=adapter, track_usage=True)
+
+    try:
+        report = {"backend": args.backend, "adapter": args.adapter,
+                  **run_benchmark(client, model, args.concurrency, args.requests)}
+    finally:
+        if mock:
+            mock.stop()
+    if isinstance(adapter, StructuredOutputAdapter):
+        report["structured_outputs"] = adapter.stats()
+
+    print(json.dumps(report, indent=2))
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,129 @@
+"""Multi-stage business analysis pipeline used by dspy/2.multi.py."""
+import asyncio
+import contextvars
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import List
+
+import dspy
+
+
+class MarketAnalysis(dspy.Signature):
+    topic: str = dspy.InputField(desc="Business topic to analyze")
+    market_data: str = dspy.InputField(desc="Available market information")
+    market_size: str = dspy.OutputField(desc="Market size and growth potential")
+    competitors: List[str] = dspy.OutputField(desc="Key competitors and differentiation")
+    revenue_opportunity: str = dspy.OutputField(desc="Revenue opportunity estimate")
+
+class CustomerAnalysis(dspy.Signature):
+    topic: str = dspy.InputField(desc="Business topic to analyze")
+    customer_feedback: str = dspy.InputField(desc="Customer feedback data")
+    pain_points: List[str] = dspy.OutputField(desc="Key customer pain points")
+    customer_needs: List[str] = dspy.OutputField(desc="Customer needs and preferences")
+    willingness_to_pay: str = dspy.OutputField(desc="Willingness to pay indicators")
+
+class StrategicRecommendations(dspy.Signature):
+    topic: str = dspy.InputField(desc="Business topic to analyze")
+    market_analysis: MarketAnalysis = dspy.InputField(desc="Market analysis results")
+    customer_analysis: CustomerAnalysis = dspy.InputField(desc="Customer analysis results")
+    recommendations: List[str] = dspy.OutputField(desc="Top 3 strategic recommendations")
+    go_to_market: str = dspy.OutputField(desc="Go-to-market strategy")
+    success_metrics: List[str] = dspy.OutputField(desc="Key success metrics")
+
+def compact_prediction(prediction: dspy.Prediction, drop: tuple[str, ...] = ("reasoning",)) -> str:
+    """Minified JSON of a prediction's output fields, without the upstream stage's reasoning."""
+    values = {k: v for k, v in prediction.items() if k not in drop}
+    return json.dumps(values, ensure_ascii=False, separators=(",", ":"), default=str)
+
+
+class BusinessAnalysisPipeline(dspy.Module):
+    """Market and customer analysis are independent, only the strategy stage needs both.
+
+    With `parallel=True` the two analysis stages run at the same time and the strategy
+    stage starts as soon as both are done, so a call costs two LM round trips instead of three.
+
+    By default the strategy stage sees the analyses as their ``Prediction`` repr, reasoning
+    included; `compact_inputs=True` passes them as minified JSON of the output fields instead.
+    """
+
+    def __init__(self, parallel: bool = True, compact_inputs: bool = False):
+        self.analyze_market = dspy.ChainOfThought(MarketAnalysis)
+        self.analyze_customers = dspy.ChainOfThought(CustomerAnalysis)
+        self.generate_strategy = dspy.ChainOfThought(StrategicRecommendations)
+        self.parallel = parallel
+        self.compact_inputs = compact_inputs
+
+    def _downstream(self, prediction: dspy.Prediction):
+        return compact_prediction(prediction) if self.compact_inputs else prediction
+
+    @staticmethod
+    def _timed(stage, **kwargs):
+        start = time.perf_counter()
+        output = stage(**kwargs)
+        return output, time.perf_counter() - start
+
+    @staticmethod
+    async def _atimed(stage, **kwargs):
+        start = time.perf_counter()
+        output = await stage.acall(**kwargs)
+        return output, time.perf_counter() - start
+
+    def forward(self, topic: str, market_data: str, customer_feedback: str) -> dspy.Prediction:
+        start = time.perf_counter()
+        if self.parallel:
+            # each worker runs in a copy of the caller's context so dspy.context(...) overrides still apply
+            with ThreadPoolExecutor(max_workers=2) as pool:
+                market_future = pool.submit(contextvars.copy_context().run, self._timed,
+                                            self.analyze_market, topic=topic, market_data=market_data)
+                customers_future = pool.submit(contextvars.copy_context().run, self._timed,
+                                               self.analyze_customers, topic=topic, customer_feedback=customer_feedback)
+                market, market_time = market_future.result()
+                customers, customers_time = customers_future.result()
+        else:
+            market, market_time = self._timed(self.analyze_market, topic=topic, market_data=market_data)
+            customers, customers_time = self._timed(self.analyze_customers, topic=topic, customer_feedback=customer_feedback)
+
+        strategy, strategy_time = self._timed(
+            self.generate_strategy,
+            topic=topic,
+            market_analysis=self._downstream(market),
+            customer_analysis=self._downstream(customers)
+        )
+
+        return dspy.Prediction(
+            market_analysis=market,
+            customer_analysis=customers,
+            recommendations=strategy,
+            timings={
+                "analyze_market": market_time,
+                "analyze_customers": customers_time,
+                "generate_strategy": strategy_time,
+                "total": time.perf_counter() - start,
+            }
+        )
+
+    async def aforward(self, topic: str, market_data: str, customer_feedback: str) -> dspy.Prediction:
+        start = time.perf_counter()
+        (market, market_time), (customers, customers_time) = await asyncio.gather(
+            self._atimed(self.analyze_market, topic=topic, market_data=market_data),
+            self._atimed(self.analyze_customers, topic=topic, customer_feedback=customer_feedback),
+        )
+        strategy, strategy_time = await self._atimed(
+            self.generate_strategy,
+            topic=topic,
+            market_analysis=self._downstream(market),
+            customer_analysis=self._downstream(customers)
+        )
+
+        return dspy.Prediction(
+            market_analysis=market,
+            customer_analysis=customers,
+            recommendations=strategy,
+            timings={
+                "analyze_market": market_time,
+                "analyze_customers": customers_time,
+                "generate_strategy": strategy_time,
+                "total": time.perf_counter() - start,
+            }
+        )
@@ -0,0 +1,227 @@
+"""Persistent LM response cache shared by all example scripts and optimizer runs.
+
+dspy looks up ``dspy.cache`` on every cached LM request, so installing an ``LMResponseCache``
+there is enough to route every script through it:
+
+    from dspy_optimization.cache import install_cache
+    lm_cache = install_cache()
+
+    with lm_cache.pinned():           # nothing expires or gets evicted while the optimizer runs
+        optimized = optimizer.compile(program, trainset=trainset)
+
+    print(lm_cache.report())
+"""
+import copy
+import hashlib
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any
+
+import dspy
+import orjson
+from cachetools import LRUCache
+from diskcache import FanoutCache
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CACHE_DIR = os.getenv("LM_CACHE_DIR", os.path.expanduser("~/.dspy_optimization_cache"))
+_IGNORED_ARGS = ("api_key", "api_base", "base_url")
+# llama.cpp prompt-cache hints (see prefix_cache.py): they pick a server slot, not the reply
+_ROUTING_BODY_ARGS = ("cache_prompt", "id_slot")
+
+
+def _normalize_text(text: str) -> str:
+    lines = text.replace("\r\n", "\n").split("\n")
+    return "\n".join(line.rstrip() for line in lines).strip()
+
+
+def _normalize(value: Any) -> Any:
+    if isinstance(value, str):
+        return _normalize_text(value)
+    if isinstance(value, dict):
+        return {k: _normalize(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_normalize(v) for v in value]
+    return value
+
+
+def _json_default(value: Any) -> Any:
+    # response_format can be a pydantic model class; key on its schema rather than its identity
+    if hasattr(value, "model_json_schema"):
+        return value.model_json_schema()
+    # functools.partial and callable instances have no __qualname__
+    if callable(value) and hasattr(value, "__qualname__"):
+        return f"{value.__module__}.{value.__qualname__}"
+    return repr(value)
+
+
+class LMResponseCache:
+    """Two-tier (in-memory LRU + on-disk) cache with the same interface dspy expects from ``dspy.cache``.
+
+    Keys hash the normalized prompt, the model and the remaining sampling parameters, so
+    whitespace-only differences in rendered prompts still hit. The disk tier is a sharded
+    SQLite store evicted least-recently-used once it grows past `size_limit_bytes`, with
+    `mmap_size_bytes` of each shard memory-mapped for reads. Entries older than `ttl_seconds`
+    count as misses unless the cache is pinned.
+    """
+
+    def __init__(
+        self,
+        directory: str = DEFAULT_CACHE_DIR,
+        size_limit_bytes: int = 2 * 1024**3,
+        memory_max_entries: int = 10_000,
+        ttl_seconds: float | None = None,
+        mmap_size_bytes: int = 256 * 1024**2,
+        shards: int = 8,
+    ):
+        self.directory = directory
+        self.ttl_seconds = ttl_seconds
+        self._disk = FanoutCache(
+            directory,
+            shards=shards,
+            size_limit=size_limit_bytes,
+            eviction_policy="least-recently-used",
+            sqlite_mmap_size=mmap_size_bytes,
+        )
+        self._cull_limit = self._disk.cull_limit
+        self._memory = LRUCache(maxsize=memory_max_entries)
+        self._lock = threading.Lock()
+        self._pinned = 0
+        self._stats = {"memory_hits": 0, "disk_hits": 0, "misses": 0, "expired": 0, "puts": 0}
+
+    def cache_key(self, request: dict[str, Any], ignored_args_for_cache_key: list[str] | None = None) -> str:
+        ignored = set(ignored_args_for_cache_key or _IGNORED_ARGS)
+        params = {k: v for k, v in request.items() if k not in ignored and k not in ("model", "messages", "prompt")}
+        if isinstance(params.get("extra_body"), dict):
+            params["extra_body"] = {k: v for k, v in params["extra_body"].items() if k not in _ROUTING_BODY_ARGS}
+        material = {
+            "model": request.get("model"),
+            "prompt": _normalize(request.get("messages", request.get("prompt"))),
+            "params": params,
+        }
+        payload = orjson.dumps(material, option=orjson.OPT_SORT_KEYS, default=_json_default)
+        return hashlib.sha256(payload).hexdigest()
+
+    def _expired(self, stored_at: float) -> bool:
+        return self.ttl_seconds is not None and not self._pinned and time.time() - stored_at > self.ttl_seconds
+
+    def _count(self, stat: str):
+        with self._lock:
+            self._stats[stat] += 1
+
+    def get(self, request: dict[str, Any], ignored_args_for_cache_key: list[str] | None = None) -> Any:
+        try:
+            key = self.cache_key(request, ignored_args_for_cache_key)
+        except Exception:
+            logger.debug(f"Failed to generate cache key for request: {request}")
+            return None
+        with self._lock:
+            entry = self._memory.get(key)
+        tier = "memory_hits"
+        if entry is None:
+            entry = self._disk.get(key)
+            tier = "disk_hits"
+        if entry is None:
+            self._count("misses")
+            return None
+
+        stored_at, response = entry
+        if self._expired(stored_at):
+            self._count("expired")
+            self._count("misses")
+            return None
+        if tier == "disk_hits":
+            with self._lock:
+                self._memory[key] = entry
+        self._count(tier)
+
+        response = copy.deepcopy(response)
+        if hasattr(response, "usage"):
+            # no LM call was made, so no tokens were spent
+            response.usage = {}
+            response.cache_hit = True
+        return response
+
+    def put(
+        self,
+        request: dict[str, Any],
+        value: Any,
+        ignored_args_for_cache_key: list[str] | None = None,
+        enable_memory_cache: bool = True,
+    ) -> None:
+        # like dspy's own Cache, a request that cannot be cached must not fail the LM call
+        try:
+            key = self.cache_key(request, ignored_args_for_cache_key)
+        except Exception:
+            logger.debug(f"Failed to generate cache key for request: {request}")
+            return
+        entry = (time.time(), value)
+        if enable_memory_cache:
+            with self._lock:
+                self._memory[key] = entry
+        try:
+            self._disk.set(key, entry)
+        except Exception as e:
+            # e.g. disk full or `value` is not picklable
+            logger.debug(f"Failed to put value in disk cache: {value}, {e}")
+            return
+        self._count("puts")
+
+    def reset_memory_cache(self) -> None:
+        with self._lock:
+            self._memory.clear()
+
+    @contextmanager
+    def pinned(self):
+        """Keep every entry valid for the duration of the block.
+
+        TTL expiry is ignored and disk eviction is suspended, so an optimizer never re-pays for a
+        prompt it already sent earlier in the same run. Eviction catches up when the block exits.
+        """
+        with self._lock:
+            self._pinned += 1
+            if self._pinned == 1:
+                self._disk.reset("cull_limit", 0)
+        try:
+            yield self
+        finally:
+            with self._lock:
+                self._pinned -= 1
+                resume = self._pinned == 0
+                if resume:
+                    self._disk.reset("cull_limit", self._cull_limit)
+            if resume:
+                self._disk.cull()
+
+    def stats(self) -> dict[str, int | float]:
+        with self._lock:
+            stats = dict(self._stats)
+        hits = stats["memory_hits"] + stats["disk_hits"]
+        lookups = hits + stats["misses"]
+        stats["hit_rate"] = hits / lookups if lookups else 0.0
+        stats["disk_bytes"] = self._disk.volume()
+        return stats
+
+    def report(self) -> str:
+        s = self.stats()
+        return (
+            f"LM cache: {s['hit_rate']:.1%} hit rate "
+            f"({s['memory_hits']} memory, {s['disk_hits']} disk, {s['misses']} misses, {s['expired']} expired), "
+            f"{s['disk_bytes'] / 1024**2:.1f} MiB on disk at {self.directory}"
+        )
+
+
+def install_cache(**kwargs) -> LMResponseCache:
+    """Create an ``LMResponseCache`` and make it the cache used by every ``dspy.LM`` call.
+
+    `LM_CACHE_DIR` and `LM_CACHE_TTL_SECONDS` environment variables override the defaults.
+    """
+    ttl = os.getenv("LM_CACHE_TTL_SECONDS")
+    if ttl and "ttl_seconds" not in kwargs:
+        kwargs["ttl_seconds"] = float(ttl)
+    cache = LMResponseCache(**kwargs)
+    dspy.cache = cache
+    return cache
@@ -0,0 +1,245 @@
+"""Checkpointed, resumable optimizer runs.
+
+A ``CheckpointStore`` is an append-only JSONL log of everything an optimizer paid LM calls
+for: per-example scores of each candidate program, bootstrapped demos per training example,
+proposed instruction candidates, and completed trials. Each record is flushed as soon as it is
+produced, so a crash or Ctrl-C loses at most the call in flight, and re-running the same
+script replays the log instead of calling the LM again.
+
+Records are keyed on content (a fingerprint of the program's instructions and demos, a hash
+of the example, the configured LM and adapter), not on positions, so switching the model or
+the adapter starts a fresh set of records instead of replaying the old model's:
+
+* ``CheckpointedEvaluate``: scores only examples the store has not seen for this program. The
+  prediction is stored with the score, so reports built from a resumed evaluation's predictions
+  (confusion matrices, multi-label reports) see the replayed ones too, as JSON values.
+* ``CheckpointedBootstrapFewShot``: bootstraps only examples it has not traced for this student.
+  Its records survive a grown trainset, so a re-run on a few more examples bootstraps only those.
+  Scores do not carry over as well: candidates whose demos come from the new trainset are new
+  programs, and are scored from scratch.
+* ``ParallelCOPRO(checkpoint=store)`` and ``RacingMIPROv2(checkpoint=store)`` use both, and
+  persist their instruction proposals.
+
+``warm_start(student, "dspy/optimized_ticket_router.json")`` seeds a new run with a previous
+result, so the search starts from yesterday's instructions instead of from scratch.
+"""
+import hashlib
+import json
+import os
+import threading
+import types
+from contextlib import contextmanager
+from typing import Any
+
+import dspy
+from dspy.evaluate import Evaluate
+from dspy.evaluate.evaluate import EvaluationResult
+from dspy.teleprompt import BootstrapFewShot
+from dspy.teleprompt import utils as teleprompt_utils
+
+from dspy_optimization.evaluation import is_failed
+
+
+def content_key(value: Any) -> str:
+    return hashlib.sha256(json.dumps(value, sort_keys=True, ensure_ascii=False, default=str).encode()).hexdigest()[:24]
+
+
+def example_key(example: dspy.Example) -> str:
+    return content_key(example.toDict())
+
+
+def _code_key(code: types.CodeType) -> str:
+    consts = [_code_key(const) if isinstance(const, types.CodeType) else repr(const) for const in code.co_consts]
+    return content_key([code.co_code.hex(), consts, code.co_names])
+
+
+def metric_key(metric) -> str:
+    """Name of a metric, so scores stored under one metric are never replayed for another.
+
+    Lambdas and nested functions do not have a unique name (every lambda is ``<lambda>``), so
+    their key also hashes their bytecode, constants, defaults and closure values.
+    """
+    name = getattr(metric, "__qualname__", None) or getattr(metric, "__name__", None) or type(metric).__name__
+    key = f"{getattr(metric, '__module__', '')}.{name}"
+    code = getattr(metric, "__code__", None)
+    if code is not None and ("<lambda>" in name or "<locals>" in name):
+        closure = [repr(cell.cell_contents) for cell in metric.__closure__ or ()]
+        key += f":{content_key([_code_key(code), repr(metric.__defaults__), closure])}"
+    return key
+
+
+def _json_value(value: Any) -> Any:
+    # pydantic models (structured output fields) are stored as their JSON data
+    return json.loads(json.dumps(value, ensure_ascii=False,
+                                 default=lambda v: v.model_dump(mode="json") if hasattr(v, "model_dump") else str(v)))
+
+
+def settings_state() -> dict[str, Any]:
+    """The configured LM (without its API key) and adapter, as plain data."""
+    lm, adapter = dspy.settings.lm, dspy.settings.adapter
+    lm_state = {k: v for k, v in lm.dump_state().items() if k != "api_key"} if lm is not None else None
+    adapter_path = f"{type(adapter).__module__}:{type(adapter).__qualname__}" if adapter is not None else None
+    return {"lm": lm_state, "adapter": adapter_path}
+
+
+def settings_key() -> str:
+    """Hash of ``settings_state()``, so results of one model or adapter are never replayed for another."""
+    return content_key(settings_state())
+
+
+def program_fingerprint(program: dspy.Module) -> str:
+    """Hash of every predictor's instructions, fields and demos; two programs with equal prompts share it."""
+    state = []
+    for name, predictor in program.named_predictors():
+        predictor_state = predictor.dump_state()
+        state.append((name, predictor_state.get("signature"), predictor_state.get("demos")))
+    return content_key(state)
+
+
+class CheckpointStore:
+    def __init__(self, path: str):
+        self.path = path
+        self._records: dict[str, dict[str, Any]] = {}
+        self._lock = threading.Lock()
+        self.stats = {"loaded": 0, "hits": 0, "writes": 0}
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        if os.path.exists(path):
+            self._load()
+
+    def _load(self):
+        good_bytes = 0
+        with open(self.path, "rb") as f:
+            for line in f:
+                # a crash mid-write leaves a partial last line; drop it and keep everything before
+                if not line.endswith(b"\n"):
+                    break
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    break
+                self._records.setdefault(record["kind"], {})[record["key"]] = record["value"]
+                self.stats["loaded"] += 1
+                good_bytes += len(line)
+        if good_bytes != os.path.getsize(self.path):
+            with open(self.path, "r+b") as f:
+                f.truncate(good_bytes)
+
+    def get(self, kind: str, key: str, default: Any = None) -> Any:
+        with self._lock:
+            value = self._records.get(kind, {}).get(key, default)
+            if value is not default:
+                self.stats["hits"] += 1
+            return value
+
+    def put(self, kind: str, key: str, value: Any) -> None:
+        line = json.dumps({"kind": kind, "key": key, "value": value}, ensure_ascii=False, default=str) + "\n"
+        with self._lock:
+            self._records.setdefault(kind, {})[key] = value
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(line)
+            self.stats["writes"] += 1
+
+    def items(self, kind: str) -> dict[str, Any]:
+        with self._lock:
+            return dict(self._records.get(kind, {}))
+
+    def report(self) -> str:
+        counts = ", ".join(f"{len(records)} {kind}" for kind, records in sorted(self._records.items()))
+        return (f"Checkpoint {self.path}: {counts or 'empty'}; "
+                f"{self.stats['hits']} replayed, {self.stats['writes']} new records")
+
+
+class CheckpointedEvaluate(Evaluate):
+    """``Evaluate`` that only runs the program on examples whose score for this program is not in the store."""
+
+    def __init__(self, *, store: CheckpointStore, **kwargs):
+        super().__init__(**kwargs)
+        self.store = store
+
+    def __call__(self, program, metric=None, devset=None, **kwargs):
+        devset = list(devset if devset is not None else self.devset)
+        fingerprint = f"{metric_key(metric or self.metric)}:{settings_key()}:{program_fingerprint(program)}"
+        keys = [example_key(example) for example in devset]
+        stored = {key: self.store.get("score", f"{fingerprint}:{key}") for key in keys}
+        # a bare score (no prediction to replay) counts as missing
+        stored = {key: value if isinstance(value, dict) else None for key, value in stored.items()}
+
+        fresh = {}
+        missing = [example for example, key in zip(devset, keys) if stored[key] is None]
+        if missing:
+            result = super().__call__(program, metric=metric, devset=missing, **kwargs)
+            for example, prediction, score in result.results:
+                key = example_key(example)
+                fresh[key] = (example, prediction, score)
+                # a failed row (an empty prediction) is left out so a resumed run retries it
+                if not is_failed(prediction):
+                    self.store.put("score", f"{fingerprint}:{key}",
+                                   {"score": float(score), "prediction": _json_value(dict(prediction.items()))})
+
+        results = [fresh.get(key) or (example, dspy.Prediction(**stored[key]["prediction"]), stored[key]["score"])
+                   for example, key in zip(devset, keys)]
+        score = round(100 * sum(float(s) for _, _, s in results) / len(results), 2) if results else 0.0
+        self.store.put("trial", f"{fingerprint}:{content_key(keys)}", {"score": score, "n": len(results)})
+        return EvaluationResult(score=score, results=results)
+
+
+class CheckpointedBootstrapFewShot(BootstrapFewShot):
+    """``BootstrapFewShot`` that replays stored traces for (teacher prompts, round, example) it has already bootstrapped."""
+
+    def __init__(self, *args, store: CheckpointStore, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.store = store
+        self._teacher_fingerprint: str | None = None
+
+    def _prepare_student_and_teacher(self, student, teacher):
+        # an uncompiled teacher is filled with LabeledFewShot demos sampled from the whole trainset, which
+        # change as soon as the trainset grows; key on the prompts it starts from, so old examples still replay
+        # (a stored trace was made with other labeled demos, but it passed the metric all the same)
+        source = teacher if teacher is not None else student
+        if self.max_labeled_demos and not getattr(source, "_compiled", False):
+            source = source.reset_copy()
+        self._teacher_fingerprint = program_fingerprint(source)
+        super()._prepare_student_and_teacher(student, teacher)
+
+    def _bootstrap_key(self, example, round_idx: int) -> str:
+        with dspy.settings.context(**self.teacher_settings):
+            settings = settings_key()
+        teacher = self._teacher_fingerprint or program_fingerprint(self.teacher)
+        return f"{metric_key(self.metric)}:{settings}:{teacher}:{round_idx}:{example_key(example)}"
+
+    def _bootstrap_one_example(self, example, round_idx=0):
+        key = self._bootstrap_key(example, round_idx)
+        stored = self.store.get("bootstrap", key)
+        if stored is not None:
+            for name, demos in stored["demos"].items():
+                self.name2traces[name].extend(dspy.Example(**demo) for demo in demos)
+            return stored["success"]
+
+        before = {name: len(traces) for name, traces in self.name2traces.items()}
+        errors = self.error_count
+        success = super()._bootstrap_one_example(example, round_idx)
+        if self.error_count > errors:
+            # the LM call failed rather than the metric; a resumed run should try again
+            return success
+        added = {name: [demo.toDict() for demo in traces[before.get(name, 0):]] for name, traces in self.name2traces.items()}
+        self.store.put("bootstrap", key, {"success": bool(success), "demos": {k: v for k, v in added.items() if v}})
+        return success
+
+
+@contextmanager
+def checkpointed_bootstrapping(store: CheckpointStore):
+    """Make optimizers that bootstrap demo sets internally (MIPROv2) use ``CheckpointedBootstrapFewShot``."""
+    original = teleprompt_utils.BootstrapFewShot
+    teleprompt_utils.BootstrapFewShot = lambda *args, **kwargs: CheckpointedBootstrapFewShot(*args, store=store, **kwargs)
+    try:
+        yield
+    finally:
+        teleprompt_utils.BootstrapFewShot = original
+
+
+def warm_start(student: dspy.Module, path: str) -> dspy.Module:
+    """A copy of `student` with the instructions and demos of a previously saved run, if `path` exists."""
+    program = student.deepcopy()
+    if os.path.exists(path):
+        program.load(path)
+    return program
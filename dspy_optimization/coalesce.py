@@ -0,0 +1,247 @@
+"""Request coalescing and micro-batching in front of a ``dspy.LM``.
+
+``Evaluate(num_threads=...)`` and the optimizers call the LM from many threads at once, and
+bootstrapping/candidate scoring often sends the very same prompt from several of them at the
+same moment. ``CoalescingLM`` wraps the configured LM without touching program code:
+
+* identical in-flight requests (same key as the response cache) are sent once and every
+  caller gets the reply (singleflight);
+* for backends with a real batch endpoint, `batch_fn` receives the request dicts of a
+  micro-batch and returns one response (or exception) per request, in order. New requests
+  are held for up to `max_wait_ms` until `max_batch_size` of them are pending, and at most
+  `max_concurrent_batches` batches are outstanding; while they all are, new requests keep
+  queueing and go out in the next batch.
+
+    llm = CoalescingLM(dspy.LM("ollama_chat/llama3.2:1b", api_base=...))
+    dspy.settings.configure(lm=llm)
+    ...
+    print(llm.report())
+
+Without `batch_fn` every request is sent as soon as it arrives, whatever `max_batch_size` says:
+Ollama (``OLLAMA_NUM_PARALLEL``) and vLLM already batch concurrent requests continuously, so
+holding requests back only adds latency.
+"""
+import asyncio
+import copy
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable
+
+import dspy
+
+
+class CoalescingLM(dspy.BaseLM):
+    def __init__(
+        self,
+        lm: dspy.LM,
+        max_batch_size: int = 1,
+        max_wait_ms: float = 5.0,
+        max_concurrent_batches: int = 4,
+        batch_fn: Callable[[list[dict[str, Any]]], list[Any]] | None = None,
+    ):
+        super().__init__(model=lm.model, model_type=lm.model_type, cache=lm.cache)
+        # share the wrapped LM's kwargs so history and copies see the real sampling parameters
+        self.kwargs = lm.kwargs
+        self.lm = lm
+        self.max_batch_size = max_batch_size
+        self.max_wait_ms = max_wait_ms
+        self.max_concurrent_batches = max_concurrent_batches
+        self.batch_fn = batch_fn
+        self._lock = threading.Condition()
+        self._inflight: dict[str, Future] = {}
+        self._pending: list[tuple[dict[str, Any], Future]] = []
+        self._dispatcher: threading.Thread | None = None
+        self._executor: ThreadPoolExecutor | None = None
+        self._batch_slots = threading.BoundedSemaphore(max_concurrent_batches)
+        self._stats = {"requests": 0, "coalesced": 0, "sent": 0, "batches": 0}
+
+    def _request(self, prompt, messages, kwargs) -> dict[str, Any]:
+        request = {"model": self.model, **self.lm.kwargs, **kwargs}
+        if messages is not None:
+            request["messages"] = messages
+        else:
+            request["prompt"] = prompt
+        return request
+
+    def _coalescable(self, request: dict[str, Any]) -> bool:
+        # sharing one reply is what the response cache would do anyway; without a cache, only for greedy decoding
+        if self.lm.cache and request.get("cache", True):
+            return True
+        return not request.get("temperature") and request.get("n", 1) == 1
+
+    def _join(self, request: dict[str, Any]) -> tuple[Future, bool]:
+        """Return the future for `request` and whether this caller has to send it."""
+        key = dspy.cache.cache_key(request) if self._coalescable(request) else None
+        with self._lock:
+            self._stats["requests"] += 1
+            if key is not None and key in self._inflight:
+                self._stats["coalesced"] += 1
+                self._inflight[key].waiters += 1
+                return self._inflight[key], False
+            future = Future()
+            future.waiters = 1
+            if key is not None:
+                self._inflight[key] = future
+                future.add_done_callback(lambda _: self._release(key))
+            return future, True
+
+    def _abandon(self, future: Future) -> bool:
+        """An async caller was cancelled while waiting on `future`; True if nobody else waits for it."""
+        with self._lock:
+            future.waiters -= 1
+            return future.waiters == 0
+
+    @staticmethod
+    def _settle(future: Future, task: asyncio.Task):
+        if task.cancelled():
+            future.cancel()
+        elif task.exception() is not None:
+            future.set_exception(task.exception())
+        else:
+            future.set_result(task.result())
+
+    def _release(self, key: str):
+        with self._lock:
+            self._inflight.pop(key, None)
+
+    @staticmethod
+    def _shared(response, leader: bool):
+        if leader:
+            return response
+        response = copy.deepcopy(response)
+        if hasattr(response, "usage"):
+            # only the leader's call spent tokens
+            response.usage = {}
+        return response
+
+    def _send(self, request: dict[str, Any]):
+        kwargs = {k: v for k, v in request.items() if k not in ("model", "messages", "prompt")}
+        return self.lm.forward(prompt=request.get("prompt"), messages=request.get("messages"), **kwargs)
+
+    # micro-batching, for backends with a batch endpoint
+
+    @property
+    def batching(self) -> bool:
+        return self.batch_fn is not None and self.max_batch_size > 1
+
+    def _enqueue(self, request: dict[str, Any], future: Future):
+        with self._lock:
+            if self._dispatcher is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.max_concurrent_batches)
+                self._dispatcher = threading.Thread(target=self._dispatch_loop, name="lm-micro-batcher", daemon=True)
+                self._dispatcher.start()
+            self._pending.append((request, future))
+            self._lock.notify()
+
+    def _next_batch(self) -> list[tuple[dict[str, Any], Future]]:
+        with self._lock:
+            while not self._pending:
+                self._lock.wait()
+            deadline = time.monotonic() + self.max_wait_ms / 1000
+            while len(self._pending) < self.max_batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._lock.wait(remaining)
+            batch, self._pending = self._pending[:self.max_batch_size], self._pending[self.max_batch_size:]
+            self._stats["batches"] += 1
+            self._stats["sent"] += len(batch)
+            return batch
+
+    def _dispatch_loop(self):
+        while True:
+            # a batch is only cut once a slot is free, so nothing waits in the executor's queue
+            self._batch_slots.acquire()
+            self._executor.submit(self._run_batch_fn, self._next_batch())
+
+    def _run_one(self, request: dict[str, Any], future: Future):
+        try:
+            future.set_result(self._send(request))
+        except Exception as e:
+            future.set_exception(e)
+
+    def _run_batch_fn(self, batch: list[tuple[dict[str, Any], Future]]):
+        try:
+            try:
+                responses = list(self.batch_fn([request for request, _ in batch]))
+                if len(responses) != len(batch):
+                    raise ValueError(f"batch_fn returned {len(responses)} responses for a batch of {len(batch)}")
+            except Exception as e:
+                responses = [e] * len(batch)
+            for (_, future), response in zip(batch, responses):
+                if isinstance(response, Exception):
+                    future.set_exception(response)
+                else:
+                    future.set_result(response)
+        finally:
+            # whatever happened above, no caller may be left waiting
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(RuntimeError("batch_fn did not answer this request"))
+            self._batch_slots.release()
+
+    # BaseLM interface
+
+    def forward(self, prompt=None, messages=None, **kwargs):
+        request = self._request(prompt, messages, kwargs)
+        future, leader = self._join(request)
+        if leader:
+            if self.batching:
+                self._enqueue(request, future)
+            else:
+                with self._lock:
+                    self._stats["sent"] += 1
+                self._run_one(request, future)
+        return self._shared(future.result(), leader)
+
+    async def aforward(self, prompt=None, messages=None, **kwargs):
+        request = self._request(prompt, messages, kwargs)
+        future, leader = self._join(request)
+        task = None
+        if leader and self.batching:
+            self._enqueue(request, future)
+        elif leader:
+            with self._lock:
+                self._stats["sent"] += 1
+            # the call runs as its own task: cancelling the leader must not cancel it for the followers
+            task = asyncio.ensure_future(self.lm.aforward(prompt=prompt, messages=messages, **kwargs))
+            task.add_done_callback(lambda t: self._settle(future, t))
+        try:
+            # shielded, because cancelling a wrapped future would cancel the shared one
+            response = await asyncio.shield(asyncio.wrap_future(future))
+        except asyncio.CancelledError:
+            if self._abandon(future) and task is not None:
+                task.cancel()
+            raise
+        return self._shared(response, leader)
+
+    def copy(self, **kwargs) -> "CoalescingLM":
+        return CoalescingLM(self.lm.copy(**kwargs), self.max_batch_size, self.max_wait_ms,
+                            self.max_concurrent_batches, self.batch_fn)
+
+    def __deepcopy__(self, memo):
+        # locks, futures and the dispatcher thread cannot be copied; a copy starts with fresh ones
+        return self.copy()
+
+    def dump_state(self):
+        return self.lm.dump_state()
+
+    def wrapper_config(self) -> dict[str, Any]:
+        """Arguments besides the wrapped LM, to wrap an equal LM elsewhere (distributed workers)."""
+        return {"max_batch_size": self.max_batch_size, "max_wait_ms": self.max_wait_ms,
+                "max_concurrent_batches": self.max_concurrent_batches, "batch_fn": self.batch_fn}
+
+    def stats(self) -> dict[str, int | float]:
+        with self._lock:
+            s = dict(self._stats)
+        s["coalesced_rate"] = s["coalesced"] / s["requests"] if s["requests"] else 0.0
+        s["mean_batch_size"] = s["sent"] / s["batches"] if s["batches"] else 0.0
+        return s
+
+    def report(self) -> str:
+        s = self.stats()
+        line = f"LM coalescing: {s['requests']} requests, {s['coalesced']} coalesced ({s['coalesced_rate']:.1%}), {s['sent']} sent"
+        if s["batches"]:
+            line += f" in {s['batches']} micro-batches (mean size {s['mean_batch_size']:.1f})"
+        return line
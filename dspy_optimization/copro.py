@@ -0,0 +1,202 @@
+"""COPRO with concurrent, memoized candidate scoring.
+
+Stock ``COPRO.compile`` scores one candidate instruction at a time. ``ParallelCOPRO`` follows the
+same search (breadth candidates per predictor, depth rounds of "propose given attempts"), but
+every (candidate, example) pair of a round goes into one worker pool, and scores are kept for
+the lifetime of the optimizer so an instruction that gets proposed again is never re-run.
+With `checkpoint` (a ``CheckpointStore``) scores and proposals are also persisted, so an
+interrupted run resumes where it stopped and a re-run on a grown trainset only scores the new
+examples. Stored scores and proposals are keyed on the configured LM and adapter as well.
+As with ``COPRO``, the returned program carries ``candidate_programs`` and ``total_calls``, plus
+``results_best`` and ``results_latest`` with `track_stats`.
+"""
+import contextvars
+import json
+import statistics
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import dspy
+from dspy.teleprompt import COPRO
+from dspy.teleprompt.copro_optimizer import BasicGenerateInstruction, GenerateInstructionGivenAttempts
+
+from dspy_optimization.checkpoint import CheckpointStore, content_key, metric_key, settings_key
+
+
+class ParallelCOPRO(COPRO):
+    def __init__(self, *args, num_threads: int = 8, failure_score: float = 0.0, verbose: bool = False,
+                 checkpoint: CheckpointStore | None = None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.verbose = verbose
+        self.checkpoint = checkpoint
+        self.num_threads = num_threads
+        self.failure_score = failure_score
+        self._scores: dict[tuple, float] = {}
+        self._scores_lock = threading.Lock()
+        self.scoring_stats = {"scored": 0, "reused": 0, "errors": 0}
+
+    @staticmethod
+    def _last_output_field(predictor):
+        return list(predictor.signature.output_fields.keys())[-1]
+
+    def _candidate(self, predictor):
+        field = self._last_output_field(predictor)
+        return predictor.signature.instructions, predictor.signature.output_fields[field].json_schema_extra["prefix"]
+
+    def _apply(self, predictor, instruction, prefix):
+        field = self._last_output_field(predictor)
+        predictor.signature = predictor.signature.with_instructions(instruction).with_updated_fields(field, prefix=prefix)
+
+    @staticmethod
+    def _example_key(example) -> str:
+        return json.dumps(example.toDict(), sort_keys=True, default=str)
+
+    def _score_example(self, program, key, example):
+        try:
+            prediction = program(**example.inputs())
+            score = float(self.metric(example, prediction))
+        except Exception as e:
+            if self.verbose:
+                print(f"Candidate failed on example: {type(e).__name__}: {e}")
+            score = self.failure_score
+            with self._scores_lock:
+                self.scoring_stats["errors"] += 1
+        else:
+            if self.checkpoint is not None:
+                self.checkpoint.put("score", content_key((metric_key(self.metric), settings_key(), key)), score)
+        with self._scores_lock:
+            self._scores[key] = score
+            self.scoring_stats["scored"] += 1
+        return score
+
+    def _score_round(self, module, name, candidates, trainset, num_threads):
+        """Score every candidate for predictor `name` on `trainset` in one pool; returns {candidate: score}."""
+        example_keys = [self._example_key(example) for example in trainset]
+        others = tuple(self._candidate(p) for n, p in module.named_predictors() if n != name)
+        settings = settings_key()
+        jobs = []
+        for candidate in candidates:
+            program = module.deepcopy()
+            self._apply(dict(program.named_predictors())[name], *candidate)
+            for example, example_key in zip(trainset, example_keys):
+                key = (name, candidate, others, example_key)
+                stored = (self.checkpoint.get("score", content_key((metric_key(self.metric), settings, key)))
+                          if self.checkpoint is not None else None)
+                with self._scores_lock:
+                    if stored is not None:
+                        self._scores.setdefault(key, stored)
+                    cached = key in self._scores
+                    if cached:
+                        self.scoring_stats["reused"] += 1
+                if not cached:
+                    jobs.append((program, key, example))
+
+        with ThreadPoolExecutor(max_workers=num_threads) as pool:
+            futures = [pool.submit(contextvars.copy_context().run, self._score_example, *job) for job in jobs]
+            for future in futures:
+                future.result()
+
+        results = {}
+        for candidate in candidates:
+            scores = [self._scores[(name, candidate, others, example_key)] for example_key in example_keys]
+            # same 0-100 scale as dspy.Evaluate
+            results[candidate] = round(100 * sum(scores) / len(scores), 2)
+        return results
+
+    @staticmethod
+    def _track(stats, depth, scores):
+        stats["depth"].append(depth)
+        stats["max"].append(max(scores))
+        stats["average"].append(sum(scores) / len(scores))
+        stats["min"].append(min(scores))
+        stats["std"].append(statistics.pstdev(scores))
+
+    def _propose(self, generator, n, **inputs):
+        with dspy.settings.context(lm=self.prompt_model or dspy.settings.lm):
+            key = content_key((generator.__name__, n, self.init_temperature, inputs, settings_key()))
+        stored = self.checkpoint.get("candidates", key) if self.checkpoint is not None else None
+        if stored is not None:
+            return [tuple(candidate) for candidate in stored]
+        with dspy.settings.context(lm=self.prompt_model or dspy.settings.lm):
+            proposals = dspy.Predict(generator, n=n, temperature=self.init_temperature)(**inputs)
+        candidates = list(zip(proposals.completions.proposed_instruction,
+                              proposals.completions.proposed_prefix_for_output_field))
+        if self.checkpoint is not None:
+            self.checkpoint.put("candidates", key, candidates)
+        return candidates
+
+    def compile(self, student, *, trainset, eval_kwargs=None):
+        eval_kwargs = eval_kwargs or {}
+        num_threads = eval_kwargs.get("num_threads") or self.num_threads
+        module = student.deepcopy()
+        evaluated: dict[str, dict[tuple[str, str], float]] = {}
+        first_depth: dict[str, dict[tuple[str, str], int]] = {}
+        candidates: dict[str, list[tuple[str, str]]] = {}
+        # same shape as COPRO's, keyed by id() of the returned program's predictors
+        results_best = {name: {"depth": [], "max": [], "average": [], "min": [], "std": []}
+                        for name, _ in module.named_predictors()}
+        results_latest = {name: {"depth": [], "max": [], "average": [], "min": [], "std": []}
+                          for name, _ in module.named_predictors()}
+        total_calls = 0
+
+        for name, predictor in module.named_predictors():
+            original = self._candidate(predictor)
+            candidates[name] = self._propose(BasicGenerateInstruction, self.breadth - 1, basic_instruction=original[0])
+            candidates[name].append(original)
+            evaluated[name] = {}
+            first_depth[name] = {}
+
+        for depth in range(self.depth):
+            for name, predictor in module.named_predictors():
+                pending = list(dict.fromkeys(c for c in candidates[name] if c not in evaluated[name]))
+                latest = self._score_round(module, name, pending, trainset, num_threads)
+                evaluated[name].update(latest)
+                total_calls += len(latest)
+                for candidate in latest:
+                    first_depth[name][candidate] = depth
+                if self.track_stats and latest:
+                    self._track(results_latest[name], depth, list(latest.values()))
+                best = max(evaluated[name], key=evaluated[name].get)
+                self._apply(predictor, *best)
+                if self.verbose:
+                    print(f"Depth {depth + 1}/{self.depth}, {name}: best score {evaluated[name][best]} "
+                          f"over {len(evaluated[name])} candidates")
+
+            if self.track_stats:
+                for name in candidates:
+                    self._track(results_best[name], depth, sorted(evaluated[name].values(), reverse=True)[:10])
+
+            if depth == self.depth - 1:
+                break
+
+            for name in candidates:
+                ranked = sorted(evaluated[name].items(), key=lambda item: item[1])[-self.breadth:]
+                attempts = []
+                for i, ((instruction, prefix), score) in enumerate(ranked, start=1):
+                    attempts.append(f"Instruction #{i}: {instruction}")
+                    attempts.append(f"Prefix #{i}: {prefix}")
+                    attempts.append(f"Resulting Score #{i}: {score}")
+                candidates[name] = self._propose(GenerateInstructionGivenAttempts, self.breadth,
+                                                 attempted_instructions=attempts)
+
+        if self.verbose:
+            print(f"Scored {self.scoring_stats['scored']} (candidate, example) pairs, "
+                  f"reused {self.scoring_stats['reused']}, {self.scoring_stats['errors']} errors")
+        module._compiled = True
+
+        candidate_programs = []
+        for name, scores in evaluated.items():
+            for (instruction, prefix), score in scores.items():
+                program = module.deepcopy()
+                self._apply(dict(program.named_predictors())[name], instruction, prefix)
+                program._compiled = True
+                candidate_programs.append({"score": score, "program": program, "instruction": instruction,
+                                           "prefix": prefix, "depth": first_depth[name][(instruction, prefix)]})
+        candidate_programs.sort(key=lambda candidate: candidate["score"], reverse=True)
+        module.candidate_programs = candidate_programs
+        module.total_calls = total_calls
+        if self.track_stats:
+            predictor_ids = {name: id(predictor) for name, predictor in module.named_predictors()}
+            module.results_best = {predictor_ids[name]: stats for name, stats in results_best.items()}
+            module.results_latest = {predictor_ids[name]: stats for name, stats in results_latest.items()}
+        return module
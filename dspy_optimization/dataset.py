@@ -0,0 +1,186 @@
+"""Columnar, memory-mapped labelled text datasets with lazy ``dspy.Example`` views.
+
+Loading ``data/nps_comments.json`` as a list of dicts and then a list of ``dspy.Example`` keeps
+every comment in memory two or three times over, for the whole optimizer run.
+``ColumnarDataset`` streams the file once (JSON array or JSONL, via ``iter_records``) into
+numpy columns:
+
+* all distinct comments as one UTF-8 byte blob plus offsets, so repeated comments are stored once;
+* one comment id per record;
+* the record's topics as a ``uint64`` bitset over the dataset's topic vocabulary.
+
+The columns are saved next to the data and memory-mapped on later runs, so loading costs
+little beyond opening the files and several processes share the same pages. ``split`` draws a
+seeded train/val split, stratified by topic combination, as views holding only record indices.
+A view builds a ``dspy.Example`` only when that record is accessed.
+
+    nps_data = ColumnarDataset.from_file("data/nps_comments.json", cache_dir="data/.nps_comments.columns")
+    trainset, valset = nps_data.split(val_fraction=0.5, seed=0)
+    len(trainset), trainset[0]                 # Example(comment=..., answer=[...]) built on access
+"""
+import hashlib
+import json
+import os
+from array import array
+from collections.abc import Sequence
+from typing import Any, Iterator
+
+import dspy
+import numpy as np
+
+from dspy_optimization.records import iter_records
+
+MAX_LABELS = 64
+_COLUMNS = ("text", "offsets", "comment_ids", "topics")
+
+
+class ColumnarDataset:
+    def __init__(self, text: np.ndarray, offsets: np.ndarray, comment_ids: np.ndarray, topics: np.ndarray,
+                 labels: tuple[str, ...], input_name: str = "comment", label_name: str = "answer"):
+        self.text = text
+        self.offsets = offsets
+        self.comment_ids = comment_ids
+        self.topics = topics
+        self.labels = labels
+        self.input_name = input_name
+        self.label_name = label_name
+
+    @classmethod
+    def from_records(cls, records, text_field: str = "comment", label_field: str = "topics",
+                     **kwargs) -> "ColumnarDataset":
+        blob, offsets, comment_ids, topics = bytearray(), array("q", [0]), array("i"), array("Q")
+        interned: dict[bytes, int] = {}
+        label_index: dict[str, int] = {}
+        for record in records:
+            encoded = record[text_field].encode("utf-8")
+            # keyed by digest, so the index does not keep a second copy of every comment alive
+            digest = hashlib.blake2b(encoded, digest_size=16).digest()
+            comment_id = interned.get(digest)
+            if comment_id is None:
+                comment_id = interned[digest] = len(offsets) - 1
+                blob += encoded
+                offsets.append(len(blob))
+            mask = 0
+            for label in record[label_field]:
+                if label not in label_index:
+                    if len(label_index) == MAX_LABELS:
+                        raise ValueError(f"more than {MAX_LABELS} distinct {label_field}; they no longer fit a uint64 bitset")
+                    label_index[label] = len(label_index)
+                mask |= 1 << label_index[label]
+            comment_ids.append(comment_id)
+            topics.append(mask)
+        return cls(np.frombuffer(bytes(blob), dtype=np.uint8), np.frombuffer(offsets, dtype=np.int64),
+                   np.frombuffer(comment_ids, dtype=np.int32), np.frombuffer(topics, dtype=np.uint64),
+                   tuple(label_index), **kwargs)
+
+    @classmethod
+    def from_file(cls, path: str, cache_dir: str | None = None, text_field: str = "comment",
+                  label_field: str = "topics", **kwargs) -> "ColumnarDataset":
+        """Stream `path` into columns; with `cache_dir`, reuse (memory-map) columns saved from the same file."""
+        source = {"path": os.path.abspath(path), "size": os.path.getsize(path), "mtime": os.path.getmtime(path),
+                  "text_field": text_field, "label_field": label_field}
+        if cache_dir is not None and os.path.exists(os.path.join(cache_dir, "meta.json")):
+            with open(os.path.join(cache_dir, "meta.json"), encoding="utf-8") as f:
+                if json.load(f).get("source") == source:
+                    return cls.load(cache_dir, **kwargs)
+        dataset = cls.from_records(iter_records(path), text_field, label_field, **kwargs)
+        if cache_dir is not None:
+            dataset.save(cache_dir, source=source)
+        return dataset
+
+    def save(self, directory: str, source: dict[str, Any] | None = None) -> None:
+        os.makedirs(directory, exist_ok=True)
+        for name in _COLUMNS:
+            np.save(os.path.join(directory, f"{name}.npy"), getattr(self, name))
+        # meta.json goes last: a crash mid-save leaves no meta matching the source, so the next run rebuilds
+        with open(os.path.join(directory, "meta.json"), "w", encoding="utf-8") as f:
+            json.dump({"labels": self.labels, "source": source}, f, indent=2, ensure_ascii=False)
+
+    @classmethod
+    def load(cls, directory: str, mmap: bool = True, **kwargs) -> "ColumnarDataset":
+        with open(os.path.join(directory, "meta.json"), encoding="utf-8") as f:
+            meta = json.load(f)
+        columns = [np.load(os.path.join(directory, f"{name}.npy"), mmap_mode="r" if mmap else None) for name in _COLUMNS]
+        return cls(*columns, tuple(meta["labels"]), **kwargs)
+
+    def __len__(self) -> int:
+        return len(self.comment_ids)
+
+    def comment(self, index: int) -> str:
+        comment_id = self.comment_ids[index]
+        return bytes(self.text[self.offsets[comment_id]:self.offsets[comment_id + 1]]).decode("utf-8")
+
+    def decode(self, mask: int) -> list[str]:
+        return [label for bit, label in enumerate(self.labels) if mask >> bit & 1]
+
+    def encode(self, labels) -> int:
+        index = {label: bit for bit, label in enumerate(self.labels)}
+        return sum(1 << index[label] for label in set(labels))
+
+    def example(self, index: int) -> dspy.Example:
+        values = {self.input_name: self.comment(index), self.label_name: self.decode(int(self.topics[index]))}
+        return dspy.Example(**values).with_inputs(self.input_name)
+
+    def label_counts(self, indices: np.ndarray | None = None) -> dict[str, int]:
+        topics = self.topics if indices is None else self.topics[indices]
+        bits = (topics[:, None] >> np.arange(len(self.labels), dtype=np.uint64)) & np.uint64(1)
+        return dict(zip(self.labels, bits.sum(axis=0).tolist()))
+
+    def view(self, indices: np.ndarray | None = None) -> "DatasetView":
+        return DatasetView(self, np.arange(len(self), dtype=np.int32) if indices is None else indices)
+
+    def split(self, val_fraction: float = 0.5, seed: int = 0, stratify: bool = True) -> tuple["DatasetView", "DatasetView"]:
+        """Seeded (train, val) views; with `stratify`, every topic combination is split in the same proportion."""
+        rng = np.random.default_rng(seed)
+        n = len(self)
+        strata = np.asarray(self.topics) if stratify else np.zeros(n, dtype=np.uint64)
+        # group records by stratum, in random order within each group
+        order = np.lexsort((rng.random(n), strata))
+        grouped = strata[order]
+        starts = np.flatnonzero(np.r_[True, grouped[1:] != grouped[:-1]]) if n else np.array([], dtype=np.int64)
+        sizes = np.diff(np.r_[starts, n])
+        rank = np.arange(n) - np.repeat(starts, sizes)
+        # systematic sampling with a random phase per group: exact proportions, rare groups split fairly
+        phase = np.repeat(rng.random(len(starts)), sizes)
+        is_val = np.floor((rank + 1) * val_fraction + phase) > np.floor(rank * val_fraction + phase)
+        return (DatasetView(self, np.sort(order[~is_val]).astype(np.int32)),
+                DatasetView(self, np.sort(order[is_val]).astype(np.int32)))
+
+    def nbytes(self) -> int:
+        return sum(getattr(self, name).nbytes for name in _COLUMNS)
+
+    def report(self) -> str:
+        return (f"{len(self)} records, {len(self.offsets) - 1} distinct comments, {len(self.labels)} topics, "
+                f"{self.nbytes() / 1024**2:.1f} MiB in columns")
+
+
+class DatasetView(Sequence):
+    """Read-only sequence of ``dspy.Example`` over some records of a ``ColumnarDataset``, built on access."""
+
+    def __init__(self, dataset: ColumnarDataset, indices: np.ndarray):
+        self.dataset = dataset
+        self.indices = indices
+
+    def __len__(self) -> int:
+        return len(self.indices)
+
+    def __getitem__(self, item):
+        if isinstance(item, slice):
+            return DatasetView(self.dataset, self.indices[item])
+        return self.dataset.example(int(self.indices[item]))
+
+    def __iter__(self) -> Iterator[dspy.Example]:
+        for index in self.indices:
+            yield self.dataset.example(int(index))
+
+    def __add__(self, other):
+        return list(self) + list(other)
+
+    def __radd__(self, other):
+        return list(other) + list(self)
+
+    def label_counts(self) -> dict[str, int]:
+        return self.dataset.label_counts(self.indices)
+
+    def __repr__(self):
+        return f"DatasetView({len(self)} of {len(self.dataset)} records)"
@@ -0,0 +1,833 @@
+"""Optimizer work spread over worker processes, on this machine or several.
+
+``Evaluate(num_threads=24)`` and bootstrapping run every program call, metric and adapter parse
+in threads of one process, so past a few threads the GIL, not the LM, sets the pace. A
+``DistributedExecutor`` hands that work to worker processes instead:
+
+* a ``Broker`` holds the work queue: tasks are leased to workers, kept alive by heartbeats, and
+  put back in the queue (up to `max_attempts` times) when a worker dies or stops answering;
+* it also stores the results, keyed by content (LM and adapter, program fingerprint, metric,
+  examples), so a task already computed in this run is never sent twice (results that record
+  failed LM calls are handed out once and computed again when resubmitted), and a shared tier of
+  the LM response cache for workers on other machines. Pickled programs stay on the broker
+  while a queued or running task refers to them; past `max_blobs`, the least recently used of
+  the others are dropped;
+* workers are ``python -m dspy_optimization.distributed worker`` processes. They rebuild the
+  coordinator's LM (minus its API key, which they take from their own environment) with the
+  same wrappers and settings (``PrefixCachingLM``, ``ThrottledLM`` and its limits,
+  ``CoalescingLM``) and its adapter, and run several tasks at a time.
+
+``DistributedEvaluate`` scores chunks of the devset on the workers, counting examples that raised
+there against `max_errors` like ``Evaluate``; ``DistributedBootstrapFewShot``
+bootstraps upcoming training examples ahead of the sequential loop that consumes them.
+``RacingMIPROv2(executor=...)`` uses both. Both fall back to the threaded dspy code when
+`executor` is None, so scripts can take ``executor_from_env()`` unconditionally.
+
+    executor = DistributedExecutor.local(workers=8, threads=4)    # or DSPY_WORKERS=8
+    optimizer = RacingMIPROv2(metric=topic_jaccard, auto="light", executor=executor)
+    ...
+    print(executor.report())
+
+Across machines, run a broker and point workers and the optimizer script at it (the same
+`DSPY_BROKER_AUTHKEY` everywhere):
+
+    python -m dspy_optimization.distributed broker --host 0.0.0.0 --port 5555
+    python -m dspy_optimization.distributed worker --broker broker-host:5555 --threads 8   # on each node
+    DSPY_BROKER=broker-host:5555 python maintwo.py
+"""
+import argparse
+import importlib
+import logging
+import math
+import os
+import socket
+import subprocess
+import sys
+import threading
+import time
+import traceback
+import uuid
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+from multiprocessing.managers import BaseManager
+from typing import Any
+
+import cloudpickle
+import dspy
+from dspy.evaluate import Evaluate
+from dspy.evaluate.evaluate import EvaluationResult
+from dspy.teleprompt import BootstrapFewShot
+from dspy.teleprompt import utils as teleprompt_utils
+
+from dspy_optimization.cache import LMResponseCache, install_cache
+from dspy_optimization.checkpoint import (CheckpointedBootstrapFewShot, CheckpointStore, content_key, example_key,
+                                          metric_key, program_fingerprint, settings_state)
+from dspy_optimization.coalesce import CoalescingLM
+from dspy_optimization.evaluation import FailedPrediction
+from dspy_optimization.prefix_cache import PrefixCachingLM
+from dspy_optimization.ratelimit import LMScheduler, ThrottledLM
+
+AUTHKEY_ENV = "DSPY_BROKER_AUTHKEY"
+# LM wrappers a worker rebuilds around its own dspy.LM; each has a ``wrapper_config()``
+_LM_WRAPPERS = (CoalescingLM, ThrottledLM, PrefixCachingLM)
+# task arguments that are keys of blobs on the broker
+_BLOB_ARGS = ("program", "teacher")
+
+logger = logging.getLogger(__name__)
+
+
+class TaskFailed(RuntimeError):
+    pass
+
+
+class Broker:
+    """Work queue with leases, plus the result, blob and LM-cache stores. Thread-safe; served by ``BrokerManager``."""
+
+    def __init__(self, lease_s: float = 60.0, max_attempts: int = 3, max_results: int = 100_000,
+                 cache_max_entries: int = 100_000, max_blobs: int = 256):
+        self.lease_s = lease_s
+        self.max_attempts = max_attempts
+        self.max_results = max_results
+        self.cache_max_entries = cache_max_entries
+        self.max_blobs = max_blobs
+        self._cond = threading.Condition()
+        self._ready: deque[str] = deque()
+        self._tasks: dict[str, dict[str, Any]] = {}
+        self._results: OrderedDict[str, tuple[bool, Any]] = OrderedDict()
+        # results handed to whoever waits for them, but computed again when the task is submitted anew
+        self._once: set[str] = set()
+        # blob key -> (bytes, last used); least recently used first
+        self._blobs: OrderedDict[str, tuple[bytes, float]] = OrderedDict()
+        self._blob_refs: dict[str, int] = {}
+        self._cache: OrderedDict[str, Any] = OrderedDict()
+        self._workers: dict[str, dict[str, Any]] = {}
+        self._stats = {"submitted": 0, "deduplicated": 0, "completed": 0, "failed": 0, "redispatched": 0,
+                       "cache_hits": 0, "cache_misses": 0}
+
+    def config(self) -> dict[str, Any]:
+        return {"lease_s": self.lease_s, "max_attempts": self.max_attempts}
+
+    # blobs (pickled programs and LM settings)
+
+    def _touch_blob(self, key: str) -> bytes | None:
+        entry = self._blobs.get(key)
+        if entry is None:
+            return None
+        self._blobs[key] = (entry[0], time.monotonic())
+        self._blobs.move_to_end(key)
+        return entry[0]
+
+    def _evict_blobs(self) -> None:
+        # a blob put or read within the last lease is about to be referenced by a submit; keep it too
+        cutoff = time.monotonic() - self.lease_s
+        for key in [k for k, (_, used) in self._blobs.items() if used < cutoff and not self._blob_refs.get(k)]:
+            if len(self._blobs) <= self.max_blobs:
+                break
+            del self._blobs[key]
+
+    def put_blob(self, key: str, blob: bytes) -> None:
+        with self._cond:
+            if self._touch_blob(key) is None:
+                self._blobs[key] = (blob, time.monotonic())
+                self._evict_blobs()
+
+    def has_blob(self, key: str) -> bool:
+        with self._cond:
+            return self._touch_blob(key) is not None
+
+    def get_blob(self, key: str) -> bytes | None:
+        with self._cond:
+            return self._touch_blob(key)
+
+    def _release_blobs(self, task: dict[str, Any]) -> None:
+        for key in task["blobs"]:
+            self._blob_refs[key] -= 1
+            if not self._blob_refs[key]:
+                del self._blob_refs[key]
+        self._evict_blobs()
+
+    # work queue
+
+    def submit(self, tasks: list[tuple[str, str, bytes, list[str]]]) -> int:
+        """Queue (task id, kind, payload, blob keys) tasks; ids already queued, running or done are not queued again.
+
+        The blobs a task names are kept until it finishes.
+        """
+        queued = 0
+        with self._cond:
+            for task_id, kind, payload, blobs in tasks:
+                if task_id in self._results and (not self._results[task_id][0] or task_id in self._once):
+                    # failed or lost before: try again rather than replay the failure
+                    del self._results[task_id]
+                    self._once.discard(task_id)
+                if task_id in self._tasks or task_id in self._results:
+                    self._stats["deduplicated"] += 1
+                    continue
+                self._tasks[task_id] = {"kind": kind, "payload": payload, "blobs": list(blobs), "attempts": 0,
+                                        "worker": None, "deadline": None}
+                for key in blobs:
+                    self._blob_refs[key] = self._blob_refs.get(key, 0) + 1
+                self._ready.append(task_id)
+                queued += 1
+            self._stats["submitted"] += queued
+            self._cond.notify_all()
+        return queued
+
+    def _requeue_expired(self) -> None:
+        now = time.monotonic()
+        for task_id, task in self._tasks.items():
+            if task["worker"] is None or task["deadline"] > now:
+                continue
+            if task["attempts"] >= self.max_attempts:
+                self._finish(task_id, False, f"lost {task['attempts']} times (last on worker {task['worker']})")
+                self._release_blobs(task)
+                self._stats["failed"] += 1
+            else:
+                # the worker died or hangs; someone else gets it, ahead of the queue
+                task["worker"] = task["deadline"] = None
+                self._ready.appendleft(task_id)
+                self._stats["redispatched"] += 1
+        for task_id in [t for t in self._tasks if t in self._results]:
+            del self._tasks[task_id]
+
+    def lease(self, worker_id: str, wait_s: float = 1.0) -> tuple[str, str, bytes, int] | None:
+        """Next task for `worker_id`, waiting up to `wait_s` for one; the lease lasts `lease_s` unless renewed."""
+        deadline = time.monotonic() + wait_s
+        with self._cond:
+            while True:
+                self._requeue_expired()
+                while self._ready:
+                    task_id = self._ready.popleft()
+                    task = self._tasks.get(task_id)
+                    if task is None or task["worker"] is not None:
+                        continue
+                    task["worker"] = worker_id
+                    task["attempts"] += 1
+                    task["deadline"] = time.monotonic() + self.lease_s
+                    return task_id, task["kind"], task["payload"], task["attempts"]
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return None
+                self._cond.wait(min(remaining, self.lease_s))
+
+    def heartbeat(self, worker_id: str, task_ids: list[str], threads: int = 1, host: str = "") -> None:
+        with self._cond:
+            self._workers[worker_id] = {"seen": time.monotonic(), "threads": threads, "host": host}
+            for task_id in task_ids:
+                task = self._tasks.get(task_id)
+                if task is not None and task["worker"] == worker_id:
+                    task["deadline"] = time.monotonic() + self.lease_s
+
+    def _finish(self, task_id: str, ok: bool, value: Any) -> None:
+        self._results[task_id] = (ok, value)
+        while len(self._results) > self.max_results:
+            self._once.discard(self._results.popitem(last=False)[0])
+        self._cond.notify_all()
+
+    def complete(self, task_id: str, worker_id: str, ok: bool, value: Any, reusable: bool = True) -> None:
+        """Store a task's result; one that is not `reusable` (it records failed calls) is not replayed to later submits."""
+        with self._cond:
+            if task_id in self._results:
+                # a re-dispatched task finished twice; the first result stands
+                return
+            task = self._tasks.pop(task_id, None)
+            self._finish(task_id, ok, value)
+            if not reusable:
+                self._once.add(task_id)
+            if task is not None:
+                self._release_blobs(task)
+            self._stats["completed" if ok else "failed"] += 1
+
+    def wait(self, task_ids: list[str], timeout_s: float = 1.0) -> dict[str, tuple[bool, Any]]:
+        """Results of the `task_ids` that are done, waiting up to `timeout_s` for at least one."""
+        deadline = time.monotonic() + timeout_s
+        with self._cond:
+            while True:
+                self._requeue_expired()
+                done = {task_id: self._results[task_id] for task_id in task_ids if task_id in self._results}
+                remaining = deadline - time.monotonic()
+                if done or remaining <= 0:
+                    return done
+                self._cond.wait(remaining)
+
+    # shared LM response cache tier
+
+    def cache_get(self, key: str) -> Any:
+        with self._cond:
+            entry = self._cache.get(key)
+            self._stats["cache_hits" if entry is not None else "cache_misses"] += 1
+            if entry is not None:
+                self._cache.move_to_end(key)
+            return entry
+
+    def cache_put(self, key: str, entry: Any) -> None:
+        with self._cond:
+            self._cache[key] = entry
+            self._cache.move_to_end(key)
+            while len(self._cache) > self.cache_max_entries:
+                self._cache.popitem(last=False)
+
+    def stats(self) -> dict[str, Any]:
+        with self._cond:
+            s = dict(self._stats)
+            now = time.monotonic()
+            live = {w: info for w, info in self._workers.items() if now - info["seen"] <= 2 * self.lease_s}
+            s["queued"] = len(self._ready)
+            s["running"] = sum(1 for task in self._tasks.values() if task["worker"] is not None)
+            s["workers"] = len(live)
+            s["worker_threads"] = sum(info["threads"] for info in live.values())
+            s["hosts"] = len({info["host"] for info in live.values()})
+            s["cached_responses"] = len(self._cache)
+            s["blobs"] = len(self._blobs)
+        return s
+
+
+_served_broker: Broker | None = None
+
+
+def _get_broker() -> Broker:
+    return _served_broker
+
+
+class BrokerManager(BaseManager):
+    pass
+
+
+BrokerManager.register("broker", callable=_get_broker)
+
+
+def serve_broker(broker: Broker, host: str = "127.0.0.1", port: int = 0, authkey: bytes | None = None):
+    """Serve `broker` from a background thread; returns the manager server (its ``address`` is the bound one)."""
+    global _served_broker
+    _served_broker = broker
+    server = BrokerManager(address=(host, port), authkey=authkey).get_server()
+    threading.Thread(target=server.serve_forever, name="dspy-broker", daemon=True).start()
+    return server
+
+
+def connect_broker(address: str, authkey: bytes | None = None):
+    """Proxy of the broker served at ``host:port``."""
+    host, port = address.rsplit(":", 1)
+    manager = BrokerManager(address=(host, int(port)), authkey=authkey or _authkey_from_env())
+    manager.connect()
+    return manager.broker()
+
+
+def _authkey_from_env() -> bytes:
+    authkey = os.getenv(AUTHKEY_ENV)
+    if not authkey:
+        raise RuntimeError(f"set {AUTHKEY_ENV} to the broker's authkey")
+    return authkey.encode()
+
+
+class SharedResponseCache(LMResponseCache):
+    """``LMResponseCache`` that falls back to the broker's cache tier, so every node reuses every node's LM replies."""
+
+    def __init__(self, broker, **kwargs):
+        super().__init__(**kwargs)
+        self.broker = broker
+        self._stats["shared_hits"] = 0
+
+    def get(self, request: dict[str, Any], ignored_args_for_cache_key: list[str] | None = None) -> Any:
+        response = super().get(request, ignored_args_for_cache_key)
+        if response is not None:
+            return response
+        key = self.cache_key(request, ignored_args_for_cache_key)
+        entry = self.broker.cache_get(key)
+        if entry is None or self._expired(entry[0]):
+            return None
+        with self._lock:
+            self._memory[key] = entry
+        self._disk.set(key, entry)
+        self._count("shared_hits")
+        response = entry[1]
+        if hasattr(response, "usage"):
+            response.usage = {}
+            response.cache_hit = True
+        return response
+
+    def put(self, request: dict[str, Any], value: Any, ignored_args_for_cache_key: list[str] | None = None,
+            enable_memory_cache: bool = True) -> None:
+        super().put(request, value, ignored_args_for_cache_key, enable_memory_cache)
+        self.broker.cache_put(self.cache_key(request, ignored_args_for_cache_key), (time.time(), value))
+
+
+# tasks, as run on the workers
+
+
+def _evaluate_task(program, metric, examples: list[dspy.Example],
+                   failure_score: float) -> list[tuple[dict | None, float, str | None]]:
+    """(prediction, score, traceback) per example; an example whose call or metric raised scores `failure_score`."""
+    results = []
+    for example in examples:
+        try:
+            prediction = program(**example.inputs())
+            score = metric(example, prediction)
+            results.append((dict(prediction.items()), float(score), None))
+        except Exception:
+            results.append((None, failure_score, traceback.format_exc()))
+    return results
+
+
+def _bootstrap_task(teacher, metric, settings: dict[str, Any], example: dspy.Example, round_idx: int) -> dict[str, Any]:
+    """One ``BootstrapFewShot._bootstrap_one_example`` on a fresh bootstrapper, returning the demos it traced."""
+    bootstrapper = BootstrapFewShot(metric=metric, **settings)
+    # bootstrapping edits the teacher's demos while it runs, and other threads share the cached teacher
+    teacher = teacher.deepcopy()
+    bootstrapper.student = teacher.reset_copy()
+    bootstrapper.teacher = teacher
+    bootstrapper._prepare_predictor_mappings()
+    bootstrapper.name2traces = {name: [] for name in bootstrapper.name2predictor}
+    success = bootstrapper._bootstrap_one_example(example, round_idx)
+    return {"success": bool(success), "errors": bootstrapper.error_count,
+            "demos": {name: [demo.toDict() for demo in demos] for name, demos in bootstrapper.name2traces.items() if demos}}
+
+
+_TASKS = {"evaluate": _evaluate_task, "bootstrap": _bootstrap_task}
+
+
+def _reusable(kind: str, value: Any) -> bool:
+    """Whether a task's result holds no failed LM calls, so a later submit may replay it."""
+    if kind == "evaluate":
+        return not any(error for _, _, error in value)
+    return not value["errors"]
+
+
+def _class_path(cls) -> str:
+    return f"{cls.__module__}:{cls.__qualname__}"
+
+
+def _load_attr(path: str):
+    module, _, name = path.partition(":")
+    return getattr(importlib.import_module(module), name)
+
+
+def context_state() -> dict[str, Any]:
+    """The configured LM and adapter as plain data: the ``dspy.LM`` state (without its API key), the wrappers
+    around it (outermost first, each with its ``wrapper_config()``) and the adapter class."""
+    lm, wrappers = dspy.settings.lm, []
+    while isinstance(lm, _LM_WRAPPERS):
+        wrappers.append({"type": _class_path(type(lm)), "config": lm.wrapper_config()})
+        lm = lm.lm
+    # the wrappers' dump_state() is the wrapped LM's, so this is the innermost dspy.LM
+    return {**settings_state(), "wrappers": wrappers}
+
+
+class Worker:
+    def __init__(self, broker, threads: int = 4, worker_id: str | None = None):
+        self.broker = broker
+        self.threads = threads
+        self.worker_id = worker_id or f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:6]}"
+        self.lease_s = broker.config()["lease_s"]
+        self._running: set[str] = set()
+        self._blobs: OrderedDict[str, Any] = OrderedDict()
+        self._settings: dict[str, dict[str, Any]] = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        # limiters are made from the coordinator's settings, one per deployment like on the coordinator
+        self.scheduler = LMScheduler()
+
+    def _blob(self, key: str):
+        with self._lock:
+            if key in self._blobs:
+                self._blobs.move_to_end(key)
+                return self._blobs[key]
+        blob = self.broker.get_blob(key)
+        if blob is None:
+            raise KeyError(f"blob {key} is not on the broker")
+        value = cloudpickle.loads(blob)
+        with self._lock:
+            self._blobs[key] = value
+            while len(self._blobs) > 64:
+                self._blobs.popitem(last=False)
+        return value
+
+    def _lm(self, state: dict[str, Any]) -> dspy.BaseLM:
+        """The coordinator's LM, rebuilt from ``context_state()`` from the inside out."""
+        lm = dspy.LM(**state["lm"])
+        for wrapper in reversed(state["wrappers"]):
+            cls, config = _load_attr(wrapper["type"]), dict(wrapper["config"])
+            if issubclass(cls, ThrottledLM):
+                config["limiter"] = self.scheduler.limiter(lm, **config["limiter"])
+            lm = cls(lm, **config)
+        return lm
+
+    def _context(self, key: str) -> dict[str, Any]:
+        with self._lock:
+            settings = self._settings.get(key)
+        if settings is None:
+            state = self._blob(key)
+            settings = {"lm": self._lm(state)}
+            if state["adapter"]:
+                settings["adapter"] = _load_attr(state["adapter"])()
+            with self._lock:
+                settings = self._settings.setdefault(key, settings)
+        return settings
+
+    def _run(self, kind: str, payload: bytes) -> Any:
+        task = cloudpickle.loads(payload)
+        args = {name: self._blob(value) if name in _BLOB_ARGS else value for name, value in task["args"].items()}
+        with dspy.context(**self._context(task["context"])):
+            return _TASKS[kind](**args)
+
+    def _loop(self):
+        while not self._stop.is_set():
+            try:
+                leased = self.broker.lease(self.worker_id, wait_s=1.0)
+            except (EOFError, OSError):
+                # the broker (or the optimizer hosting it) is gone
+                self._stop.set()
+                return
+            if leased is None:
+                continue
+            task_id, kind, payload, _ = leased
+            with self._lock:
+                self._running.add(task_id)
+            try:
+                ok, value = True, self._run(kind, payload)
+            except Exception:
+                ok, value = False, traceback.format_exc()
+            finally:
+                with self._lock:
+                    self._running.discard(task_id)
+            try:
+                self.broker.complete(task_id, self.worker_id, ok, value, reusable=ok and _reusable(kind, value))
+            except (EOFError, OSError):
+                self._stop.set()
+
+    def _heartbeat(self):
+        with self._lock:
+            running = list(self._running)
+        try:
+            self.broker.heartbeat(self.worker_id, running, self.threads, socket.gethostname())
+        except (EOFError, OSError):
+            self._stop.set()
+
+    def run(self):
+        self._heartbeat()
+        loops = [threading.Thread(target=self._loop, name=f"worker-{i}", daemon=True) for i in range(self.threads)]
+        for thread in loops:
+            thread.start()
+        while not self._stop.wait(self.lease_s / 3):
+            self._heartbeat()
+        for thread in loops:
+            thread.join(timeout=self.lease_s)
+
+    def stop(self):
+        self._stop.set()
+
+
+# coordinator side
+
+
+class DistributedExecutor:
+    def __init__(self, broker, address: str, chunk_size: int = 8, server=None, authkey: bytes | None = None,
+                 max_restarts: int = 8):
+        self.broker = broker
+        self.address = address
+        self.chunk_size = chunk_size
+        self.server = server
+        self.authkey = authkey
+        self.max_restarts = max_restarts
+        self._processes: list[subprocess.Popen] = []
+        self._worker_args: list[str] = []
+        self._lock = threading.Lock()
+        self._stats = {"tasks": 0, "reused": 0, "lost": 0, "restarted_workers": 0}
+
+    @classmethod
+    def local(cls, workers: int | None = None, threads: int = 4, host: str = "127.0.0.1", port: int = 0,
+              chunk_size: int = 8, shared_cache: bool = False, **broker_kwargs) -> "DistributedExecutor":
+        """Serve a broker from this process and start `workers` worker processes against it.
+
+        Bind `host` to ``0.0.0.0`` (and set `DSPY_BROKER_AUTHKEY`) to let workers on other machines join too.
+        """
+        authkey = (os.getenv(AUTHKEY_ENV) or uuid.uuid4().hex).encode()
+        broker = Broker(**broker_kwargs)
+        server = serve_broker(broker, host, port, authkey)
+        executor = cls(broker, f"{host}:{server.address[1]}", chunk_size, server, authkey)
+        executor.start_workers(workers if workers is not None else os.cpu_count() or 1, threads, shared_cache)
+        return executor
+
+    @classmethod
+    def connect(cls, address: str, workers: int = 0, threads: int = 4, chunk_size: int = 8,
+                shared_cache: bool = True) -> "DistributedExecutor":
+        """Use the broker at ``host:port`` (see ``python -m dspy_optimization.distributed broker``)."""
+        executor = cls(connect_broker(address), address, chunk_size, authkey=_authkey_from_env())
+        executor.start_workers(workers, threads, shared_cache)
+        return executor
+
+    def start_workers(self, workers: int, threads: int = 4, shared_cache: bool = False) -> None:
+        self._worker_args = ["--broker", self.address, "--threads", str(threads)] + (["--shared-cache"] if shared_cache else [])
+        for _ in range(workers):
+            self._spawn()
+
+    def _spawn(self) -> None:
+        # a fresh interpreter rather than a fork or spawn of the script, which would re-run its top-level code
+        env = {**os.environ, AUTHKEY_ENV: self.authkey.decode()}
+        self._processes.append(subprocess.Popen(
+            [sys.executable, "-m", "dspy_optimization.distributed", "worker", *self._worker_args], env=env))
+
+    def _check_workers(self) -> None:
+        for index, process in enumerate(self._processes):
+            if process.poll() is not None:
+                if self._stats["restarted_workers"] >= self.max_restarts:
+                    raise TaskFailed(f"worker processes keep exiting (last exit code {process.returncode})")
+                # its leased tasks come back to the queue when their leases run out
+                self._processes.pop(index)
+                self._stats["restarted_workers"] += 1
+                self._spawn()
+                return
+
+    @property
+    def capacity(self) -> int:
+        return max(1, self.broker.stats()["worker_threads"])
+
+    def put_program(self, program: dspy.Module) -> str:
+        key = f"program:{type(program).__qualname__}:{program_fingerprint(program)}"
+        if not self.broker.has_blob(key):
+            self.broker.put_blob(key, cloudpickle.dumps(program))
+        return key
+
+    def context(self) -> str:
+        """Key of a blob with the current LM (without its API key), its wrappers and the adapter, for the workers
+        to rebuild. Part of every task id, so results under one LM are never handed out for another."""
+        state = context_state()
+        key = f"context:{content_key(state)}"
+        if not self.broker.has_blob(key):
+            self.broker.put_blob(key, cloudpickle.dumps(state))
+        return key
+
+    def submit(self, kind: str, tasks: dict[str, dict[str, Any]], context: str | None = None) -> None:
+        context = context or self.context()
+        queued = self.broker.submit([
+            (task_id, kind, cloudpickle.dumps({"context": context, "args": args}),
+             [context] + [value for name, value in args.items() if name in _BLOB_ARGS])
+            for task_id, args in tasks.items()
+        ])
+        with self._lock:
+            self._stats["tasks"] += len(tasks)
+            self._stats["reused"] += len(tasks) - queued
+
+    def gather(self, task_ids: list[str]) -> dict[str, Any]:
+        """Results of `task_ids`, waiting for all of them; a task that raised on a worker raises ``TaskFailed`` here."""
+        pending, results = list(task_ids), {}
+        while pending:
+            done = self.broker.wait(pending, timeout_s=1.0)
+            for task_id, (ok, value) in done.items():
+                if not ok and not value.startswith("lost "):
+                    raise TaskFailed(f"task {task_id} failed on a worker:\n{value}")
+                if not ok:
+                    with self._lock:
+                        self._stats["lost"] += 1
+                results[task_id] = value if ok else None
+            pending = [task_id for task_id in pending if task_id not in done]
+            if pending and self._processes:
+                self._check_workers()
+        return results
+
+    def run(self, kind: str, tasks: dict[str, dict[str, Any]], context: str | None = None) -> dict[str, Any]:
+        self.submit(kind, tasks, context)
+        return self.gather(list(tasks))
+
+    def close(self) -> None:
+        for process in self._processes:
+            process.terminate()
+        for process in self._processes:
+            try:
+                process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                process.kill()
+        self._processes.clear()
+        if self.server is not None:
+            self.server.stop_event.set()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def stats(self) -> dict[str, Any]:
+        with self._lock:
+            s = dict(self._stats)
+        s["broker"] = self.broker.stats()
+        return s
+
+    def report(self) -> str:
+        s = self.stats()
+        b = s["broker"]
+        return (f"Distributed: {b['workers']} workers ({b['worker_threads']} threads on {b['hosts']} hosts), "
+                f"{s['tasks']} tasks ({s['reused']} reused from the result store), {b['redispatched']} re-dispatched, "
+                f"{s['lost']} lost, {s['restarted_workers']} workers restarted; shared LM cache {b['cache_hits']} hits "
+                f"/ {b['cache_misses']} misses")
+
+
+def executor_from_env() -> DistributedExecutor | None:
+    """Executor configured from `DSPY_BROKER` (``host:port`` of a running broker) and `DSPY_WORKERS`
+    (worker processes to start here, default 0 with a broker); None when neither is set."""
+    address, workers = os.getenv("DSPY_BROKER"), os.getenv("DSPY_WORKERS")
+    threads = int(os.getenv("DSPY_WORKER_THREADS", "4"))
+    if address:
+        return DistributedExecutor.connect(address, workers=int(workers or 0), threads=threads)
+    if workers:
+        return DistributedExecutor.local(workers=int(workers), threads=threads)
+    return None
+
+
+class DistributedEvaluate(Evaluate):
+    """``Evaluate`` that scores the devset in chunks on the executor's workers (threads in-process without one)."""
+
+    def __init__(self, *, executor: DistributedExecutor | None = None, **kwargs):
+        super().__init__(**kwargs)
+        self.executor = executor
+
+    def __call__(self, program, metric=None, devset=None, **kwargs):
+        if self.executor is None:
+            return super().__call__(program, metric=metric, devset=devset, **kwargs)
+        metric = metric or self.metric
+        devset = list(devset if devset is not None else self.devset)
+        context = self.executor.context()
+        program_key = self.executor.put_program(program)
+        chunk_size = min(self.executor.chunk_size, max(1, math.ceil(len(devset) / self.executor.capacity)))
+        chunks = [devset[start:start + chunk_size] for start in range(0, len(devset), chunk_size)]
+        tasks = {
+            f"evaluate:{context}:{metric_key(metric)}:{program_key}:{content_key([example_key(e) for e in chunk])}":
+                {"program": program_key, "metric": metric, "examples": chunk, "failure_score": self.failure_score}
+            for chunk in chunks
+        }
+        done = self.executor.run("evaluate", tasks, context)
+
+        results, errors = [], 0
+        for task_id, chunk in zip(tasks, chunks):
+            # a chunk lost on every attempt scores like examples whose calls failed
+            lost = (None, self.failure_score, f"chunk {task_id} was lost on every attempt")
+            scored = done[task_id] or [lost] * len(chunk)
+            for example, (prediction, score, error) in zip(chunk, scored):
+                if error is not None:
+                    if not errors:
+                        logger.error(f"Error for {example} on a worker:\n{error}")
+                    errors += 1
+                results.append((example, FailedPrediction(error) if prediction is None else dspy.Prediction(**prediction), score))
+        max_errors = self.max_errors if self.max_errors is not None else dspy.settings.max_errors
+        if errors >= max_errors:
+            raise TaskFailed(f"{errors} examples failed on the workers (max_errors={max_errors}); the first error is logged")
+        if errors:
+            logger.warning(f"{errors} of {len(results)} examples failed on the workers and score {self.failure_score}")
+        score = round(100 * sum(float(s) for _, _, s in results) / len(results), 2) if results else 0.0
+        return EvaluationResult(score=score, results=results)
+
+
+class DistributedBootstrapFewShot(BootstrapFewShot):
+    """``BootstrapFewShot`` whose examples are bootstrapped on the executor's workers, up to `prefetch` ahead."""
+
+    def __init__(self, *args, executor: DistributedExecutor | None = None, prefetch: int | None = None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.executor = executor
+        self.prefetch = prefetch
+        self._submitted: set[str] = set()
+        self._teacher_key: str | None = None
+
+    def _task_id(self, context: str, example, round_idx: int) -> str:
+        return f"bootstrap:{context}:{metric_key(self.metric)}:{self._teacher_key}:{round_idx}:{example_key(example)}"
+
+    def _settings(self) -> dict[str, Any]:
+        return {"metric_threshold": self.metric_threshold, "teacher_settings": self.teacher_settings,
+                "max_errors": self.max_errors}
+
+    def _submit_ahead(self, context: str, example, round_idx: int) -> None:
+        if self._teacher_key is None:
+            self._teacher_key = self.executor.put_program(self.teacher)
+        # the sequential loop stops once it has enough demos, so only a window ahead of it is worth sending
+        start = next((i for i, e in enumerate(self.trainset) if e is example), None)
+        window = self.prefetch or max(2 * self.max_bootstrapped_demos, self.executor.capacity)
+        upcoming_examples = [example] + (self.trainset[start + 1:start + window] if start is not None else [])
+        tasks = {}
+        for upcoming in upcoming_examples:
+            task_id = self._task_id(context, upcoming, round_idx)
+            if task_id not in self._submitted:
+                self._submitted.add(task_id)
+                tasks[task_id] = {"teacher": self._teacher_key, "metric": self.metric, "settings": self._settings(),
+                                  "example": upcoming, "round_idx": round_idx}
+        if tasks:
+            self.executor.submit("bootstrap", tasks, context)
+
+    def _bootstrap_one_example(self, example, round_idx=0):
+        if self.executor is None:
+            return super()._bootstrap_one_example(example, round_idx)
+        context = self.executor.context()
+        self._submit_ahead(context, example, round_idx)
+        task_id = self._task_id(context, example, round_idx)
+        result = self.executor.gather([task_id])[task_id] or {"success": False, "errors": 1, "demos": {}}
+        for name, demos in result["demos"].items():
+            self.name2traces[name].extend(dspy.Example(**demo) for demo in demos)
+        if result["errors"]:
+            with self.error_lock:
+                self.error_count += result["errors"]
+                max_errors = self.max_errors if self.max_errors is not None else dspy.settings.max_errors
+                if self.error_count >= max_errors:
+                    raise TaskFailed(f"{self.error_count} bootstrapping errors on the workers (max_errors={max_errors})")
+        return result["success"]
+
+
+class CheckpointedDistributedBootstrapFewShot(CheckpointedBootstrapFewShot, DistributedBootstrapFewShot):
+    """Replays stored traces, and bootstraps only the rest on the workers."""
+
+
+@contextmanager
+def distributed_bootstrapping(executor: DistributedExecutor, store: CheckpointStore | None = None):
+    """Make optimizers that bootstrap demo sets internally (MIPROv2) bootstrap on `executor`'s workers."""
+    original = teleprompt_utils.BootstrapFewShot
+    if store is not None:
+        teleprompt_utils.BootstrapFewShot = lambda *args, **kwargs: CheckpointedDistributedBootstrapFewShot(
+            *args, store=store, executor=executor, **kwargs)
+    else:
+        teleprompt_utils.BootstrapFewShot = lambda *args, **kwargs: DistributedBootstrapFewShot(*args, executor=executor, **kwargs)
+    try:
+        yield
+    finally:
+        teleprompt_utils.BootstrapFewShot = original
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Broker and worker processes for distributed optimizer runs.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    broker_parser = commands.add_parser("broker", help="run a stand-alone broker that workers and optimizers connect to")
+    broker_parser.add_argument("--host", default="0.0.0.0")
+    broker_parser.add_argument("--port", type=int, default=5555)
+    broker_parser.add_argument("--lease-s", type=float, default=60.0, help="re-dispatch tasks whose worker is silent this long")
+    broker_parser.add_argument("--max-attempts", type=int, default=3)
+    worker_parser = commands.add_parser("worker", help="run tasks from a broker")
+    worker_parser.add_argument("--broker", required=True, help="host:port")
+    worker_parser.add_argument("--threads", type=int, default=4, help="tasks run at a time")
+    worker_parser.add_argument("--shared-cache", action="store_true", help="back the local LM cache with the broker's")
+    args = parser.parse_args()
+
+    if args.command == "broker":
+        broker = Broker(lease_s=args.lease_s, max_attempts=args.max_attempts)
+        server = serve_broker(broker, args.host, args.port, _authkey_from_env())
+        print(f"Broker listening on {args.host}:{server.address[1]}")
+        try:
+            while True:
+                time.sleep(30)
+                s = broker.stats()
+                print(f"{s['workers']} workers ({s['worker_threads']} threads), {s['queued']} queued, "
+                      f"{s['running']} running, {s['completed']} completed, {s['redispatched']} re-dispatched")
+        except KeyboardInterrupt:
+            pass
+        return
+
+    broker = connect_broker(args.broker)
+    if args.shared_cache:
+        ttl = os.getenv("LM_CACHE_TTL_SECONDS")
+        dspy.cache = SharedResponseCache(broker, ttl_seconds=float(ttl) if ttl else None)
+    else:
+        install_cache()
+    worker = Worker(broker, threads=args.threads)
+    try:
+        worker.run()
+    except KeyboardInterrupt:
+        worker.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+"""Self-consistency voting that stops as soon as the samples agree.
+
+Majority voting over N samples of ``RouteTicket`` is more reliable on high-stakes tickets, but
+naively costs N calls per ticket. ``SelfConsistentRouter`` draws samples concurrently in waves
+just large enough to reach `min_votes` for the current leader, and stops the moment one label
+has them: on an easy ticket the first `min_votes` samples agree and the rest are never sent.
+
+Sample 0 is the router's ordinary call, so it shares the response cache with single-call
+routing. Sample i > 0 runs with ``rollout_id=i`` at `temperature`, so every sample is a
+distinct but cacheable request and re-running a ticket replays its samples from the cache.
+
+    voter = SelfConsistentRouter(optimized_router, n=5, min_votes=3)
+    prediction = voter(ticket_text="All services down across regions")
+    prediction.team, prediction.votes, prediction.samples      # "Urgent", {"urgent": 3}, 3
+"""
+import contextvars
+import threading
+import weakref
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+import dspy
+
+
+class SelfConsistentRouter(dspy.Module):
+    def __init__(self, router: dspy.Module, n: int = 5, min_votes: int = 3, temperature: float = 0.7,
+                 field: str = "team", num_threads: int | None = None):
+        super().__init__()
+        if not 1 <= min_votes <= n:
+            raise ValueError(f"min_votes must be between 1 and n={n}, got {min_votes}")
+        self.router = router
+        self.n = n
+        self.min_votes = min_votes
+        self.temperature = temperature
+        self.field = field
+        self.num_threads = num_threads or min_votes
+        # lm -> {sample index: copy}; weak, so a replaced LM and its copies go away with it
+        self._sample_lms: weakref.WeakKeyDictionary = weakref.WeakKeyDictionary()
+        self._lock = threading.Lock()
+        self._stats = {"calls": 0, "samples": 0, "early_stops": 0, "failed_samples": 0}
+
+    def _sample_lm(self, index: int):
+        lm = dspy.settings.lm
+        with self._lock:
+            # one copy per (lm, sample index), so wrapped LMs are not re-created on every call
+            copies = self._sample_lms.setdefault(lm, {})
+            if index not in copies:
+                copies[index] = lm.copy(rollout_id=index, temperature=self.temperature)
+            return copies[index]
+
+    def _sample(self, index: int, inputs: dict):
+        if index == 0:
+            return self.router(**inputs)
+        with dspy.context(lm=self._sample_lm(index)):
+            return self.router(**inputs)
+
+    def _label(self, prediction) -> str:
+        return str(getattr(prediction, self.field, "")).strip().lower()
+
+    def forward(self, **inputs):
+        votes, first_seen, errors = Counter(), {}, []
+        issued = 0
+        with ThreadPoolExecutor(max_workers=self.num_threads) as pool:
+            while issued < self.n:
+                leader = votes.most_common(1)[0][1] if votes else 0
+                if leader >= self.min_votes:
+                    break
+                wave = range(issued, min(self.n, issued + self.min_votes - leader))
+                futures = [pool.submit(contextvars.copy_context().run, self._sample, i, inputs) for i in wave]
+                issued = wave.stop
+                for future in futures:
+                    try:
+                        prediction = future.result()
+                    except Exception as e:
+                        errors.append(e)
+                        continue
+                    label = self._label(prediction)
+                    votes[label] += 1
+                    first_seen.setdefault(label, prediction)
+
+        with self._lock:
+            self._stats["calls"] += 1
+            self._stats["samples"] += issued
+            self._stats["early_stops"] += int(issued < self.n)
+            self._stats["failed_samples"] += len(errors)
+        if not votes:
+            raise errors[-1]
+
+        label, count = votes.most_common(1)[0]
+        # a new prediction: sample 0 is the router's own, which callers and traces may still hold
+        return dspy.Prediction(**first_seen[label].toDict(), votes=dict(votes), samples=issued,
+                               agreement=count / sum(votes.values()))
+
+    def stats(self) -> dict[str, int | float]:
+        with self._lock:
+            s = dict(self._stats)
+        s["samples_per_call"] = s["samples"] / s["calls"] if s["calls"] else 0.0
+        return s
+
+    def report(self) -> str:
+        s = self.stats()
+        return (f"Self-consistency: {s['samples']} samples over {s['calls']} calls "
+                f"({s['samples_per_call']:.2f} per call, max {self.n}), {s['early_stops']} stopped early")
@@ -0,0 +1,175 @@
+"""Score many metrics over one set of stored predictions.
+
+``dspy.Evaluate`` runs the program every time it is called, so comparing two programs on N
+metrics costs 2N passes over the devset. ``PredictionSet`` keeps the predictions of a single
+pass (its own, or the ``results`` of an ``Evaluate`` call that already ran) and applies any
+number of metrics to them without further LM calls:
+
+    baseline = PredictionSet.from_evaluation(baseline_evaluator(baseline_router))
+    report = baseline.evaluate({"Exact Match": exact_match, "Team-wise": team_wise_accuracy})
+    labels, matrix = baseline.confusion_matrix("team")
+"""
+from collections import Counter
+from typing import Any, Callable
+
+import dspy
+import numpy as np
+
+Z_95 = 1.959963984540054
+
+
+class FailedPrediction(dspy.Prediction):
+    """Row of an evaluation whose program call or metric raised; it has no fields, and `error` says why."""
+
+    def __init__(self, error: str | None = None):
+        super().__init__()
+        self._error = error
+
+    @property
+    def error(self) -> str | None:
+        return self._error
+
+
+def is_failed(prediction) -> bool:
+    """Whether an evaluation row failed; ``dspy.Evaluate`` leaves an empty ``dspy.Prediction()`` for those."""
+    return prediction is None or isinstance(prediction, FailedPrediction) or not list(prediction.keys())
+
+
+def wilson_interval(successes: float, n: int, z: float = Z_95) -> tuple[float, float]:
+    """Wilson score interval for a proportion; well-behaved for small n and scores near 0 or 1."""
+    if n == 0:
+        return 0.0, 0.0
+    p = successes / n
+    denom = 1 + z**2 / n
+    center = (p + z**2 / (2 * n)) / denom
+    half = z * np.sqrt(p * (1 - p) / n + z**2 / (4 * n**2)) / denom
+    return float(center - half), float(center + half)
+
+
+def mean_interval(values: np.ndarray, z: float = Z_95) -> tuple[float, float]:
+    """Normal-approximation interval for the mean of arbitrary per-example scores."""
+    if len(values) < 2:
+        mean = float(values.mean()) if len(values) else 0.0
+        return mean, mean
+    half = z * values.std(ddof=1) / np.sqrt(len(values))
+    return float(values.mean() - half), float(values.mean() + half)
+
+
+class PredictionSet:
+    def __init__(self, devset: list[dspy.Example], predictions: list[dspy.Prediction | None]):
+        self.devset = devset
+        self.predictions = predictions
+
+    @classmethod
+    def collect(cls, program: dspy.Module, devset: list[dspy.Example], num_threads: int = 4) -> "PredictionSet":
+        """Run `program` over `devset` once; failed examples are kept as ``None``."""
+        predictions = program.batch(devset, num_threads=num_threads)
+        return cls(devset, predictions)
+
+    @classmethod
+    def from_evaluation(cls, result) -> "PredictionSet":
+        """Reuse the (example, prediction, score) triples of a ``dspy.Evaluate`` run; failed rows are kept as ``None``."""
+        examples, predictions = [], []
+        for example, prediction, _ in result.results:
+            examples.append(example)
+            predictions.append(None if is_failed(prediction) else prediction)
+        return cls(examples, predictions)
+
+    @property
+    def failed(self) -> int:
+        return sum(prediction is None for prediction in self.predictions)
+
+    def scores(self, metric: Callable, failure_score: Any = 0.0) -> list[Any]:
+        """Per-example metric values; examples whose prediction failed or whose metric raised get `failure_score`."""
+        values = []
+        for example, prediction in zip(self.devset, self.predictions):
+            try:
+                values.append(failure_score if prediction is None else metric(example, prediction))
+            except Exception:
+                values.append(failure_score)
+        return values
+
+    def evaluate(self, metrics: dict[str, Callable]) -> dict[str, dict[str, Any]]:
+        """Score every metric in one pass over the stored predictions.
+
+        Numeric (or boolean) metrics report the mean as a percentage with a 95% interval; metrics that
+        return labels, like ``team_wise_accuracy``, report how often each label occurred.
+        """
+        report = {}
+        for name, metric in metrics.items():
+            values = self.scores(metric)
+            if all(isinstance(v, (bool, int, float, np.number)) for v in values):
+                array = np.asarray(values, dtype=float)
+                binary = bool(np.isin(array, (0.0, 1.0)).all())
+                low, high = wilson_interval(array.sum(), len(array)) if binary else mean_interval(array)
+                report[name] = {
+                    "score": round(100 * float(array.mean()), 2) if len(array) else 0.0,
+                    "ci95": (round(100 * low, 2), round(100 * high, 2)),
+                    "n": len(array),
+                    "failed": self.failed,
+                }
+            else:
+                report[name] = {"counts": dict(Counter(str(v) for v in values)), "n": len(values), "failed": self.failed}
+        return report
+
+    def labels(self, field: str) -> tuple[np.ndarray, np.ndarray]:
+        """Gold and predicted values of `field`, with predictions mapped onto the gold spelling case-insensitively."""
+        gold = np.asarray([str(getattr(example, field)).strip() for example in self.devset])
+        canonical = {label.lower(): label for label in gold}
+        predicted = []
+        for prediction in self.predictions:
+            value = str(getattr(prediction, field, "") or "").strip() if prediction is not None else ""
+            predicted.append(canonical.get(value.lower(), value or "<failed>"))
+        return gold, np.asarray(predicted)
+
+    def confusion_matrix(self, field: str) -> tuple[list[str], np.ndarray]:
+        """Rows are gold labels, columns are predicted labels (including any label the program invented)."""
+        gold, predicted = self.labels(field)
+        labels = sorted(set(gold.tolist())) + sorted(set(predicted.tolist()) - set(gold.tolist()))
+        index = {label: i for i, label in enumerate(labels)}
+        matrix = np.zeros((len(labels), len(labels)), dtype=int)
+        np.add.at(matrix, ([index[g] for g in gold], [index[p] for p in predicted]), 1)
+        return labels, matrix
+
+    def per_class(self, field: str) -> dict[str, dict[str, float]]:
+        labels, matrix = self.confusion_matrix(field)
+        true_positives = np.diag(matrix)
+        support = matrix.sum(axis=1)
+        predicted = matrix.sum(axis=0)
+        report = {}
+        for i, label in enumerate(labels):
+            if support[i] == 0:
+                continue
+            low, high = wilson_interval(true_positives[i], int(support[i]))
+            report[label] = {
+                "precision": round(float(true_positives[i] / predicted[i]), 3) if predicted[i] else 0.0,
+                "recall": round(float(true_positives[i] / support[i]), 3),
+                "recall_ci95": (round(low, 3), round(high, 3)),
+                "support": int(support[i]),
+            }
+        return report
+
+    def multilabel(self, field: str, labels) -> dict[str, Any]:
+        """Jaccard, micro/macro and per-label scores of a list-valued `field`; failed predictions predict no labels."""
+        # imported here because multilabel uses this module's intervals
+        from dspy_optimization.multilabel import LabelCodec, multilabel_report
+
+        codec = LabelCodec(labels)
+        gold = codec.encode_many(getattr(example, field) for example in self.devset)
+        predicted = codec.encode_many(getattr(prediction, field, None) if prediction is not None else None
+                                      for prediction in self.predictions)
+        return {**multilabel_report(gold, predicted, codec.labels), "failed": self.failed}
+
+    def compare(self, other: "PredictionSet", metric: Callable) -> dict[str, Any]:
+        """Paired difference `other - self` on the same devset, with a 95% interval."""
+        diff = np.asarray(other.scores(metric), dtype=float) - np.asarray(self.scores(metric), dtype=float)
+        low, high = mean_interval(diff)
+        return {"improvement": round(100 * float(diff.mean()), 2), "ci95": (round(100 * low, 2), round(100 * high, 2))}
+
+
+def format_confusion_matrix(labels: list[str], matrix: np.ndarray) -> str:
+    width = max(len(label) for label in labels) + 2
+    lines = ["gold \\ pred".ljust(width) + "".join(label[:width - 1].rjust(width) for label in labels)]
+    for label, row in zip(labels, matrix):
+        lines.append(label.ljust(width) + "".join(str(count).rjust(width) for count in row))
+    return "\n".join(lines)
@@ -0,0 +1,114 @@
+"""Per-request nearest-neighbour demo selection.
+
+``BootstrapFewShot`` freezes the same demos into every prompt. ``KNNTicketRouter`` instead keeps
+a small on-disk vector index of the bootstrapped and training demos and, for each ticket, puts
+only the `k` most similar ones in the prompt: fewer demo tokens per call, and the demos that are
+used are the relevant ones. Unlike ``dspy.KNNFewShot`` nothing is re-compiled per request.
+
+The default embedder is a signed feature-hashing bag of words and character n-grams, so the
+index needs no model or network; any callable mapping a list of strings to a 2-D array
+(``dspy.Embedder`` for instance) can be passed instead.
+"""
+import json
+import os
+import zlib
+from typing import Callable
+
+import dspy
+import numpy as np
+
+from dspy_optimization.tickets import RouteTicket
+
+
+class HashingEmbedder:
+    def __init__(self, dim: int = 1024, ngram_range: tuple[int, int] = (3, 5)):
+        self.dim = dim
+        self.ngram_range = ngram_range
+
+    def _features(self, text: str) -> list[str]:
+        text = " ".join(text.lower().split())
+        features = text.split()
+        padded = f" {text} "
+        for n in range(self.ngram_range[0], self.ngram_range[1] + 1):
+            features.extend(padded[i:i + n] for i in range(len(padded) - n + 1))
+        return features
+
+    def __call__(self, texts: list[str]) -> np.ndarray:
+        vectors = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for row, text in enumerate(texts):
+            for feature in self._features(text):
+                h = zlib.crc32(feature.encode())
+                vectors[row, h % self.dim] += 1.0 if h & 0x80000000 else -1.0
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        return vectors / np.where(norms == 0, 1.0, norms)
+
+    def config(self) -> dict:
+        return {"type": "hashing", "dim": self.dim, "ngram_range": list(self.ngram_range)}
+
+
+class DemoIndex:
+    """Cosine-similarity index over demos, keyed on one input field."""
+
+    def __init__(self, demos: list[dict], key: str, embedder: Callable[[list[str]], np.ndarray] | None = None,
+                 embeddings: np.ndarray | None = None):
+        self.demos = demos
+        self.key = key
+        self.embedder = embedder or HashingEmbedder()
+        self.embeddings = embeddings if embeddings is not None else self._embed([d[key] for d in demos])
+
+    def _embed(self, texts: list[str]) -> np.ndarray:
+        vectors = np.asarray(self.embedder(texts), dtype=np.float32)
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        return vectors / np.where(norms == 0, 1.0, norms)
+
+    @classmethod
+    def from_examples(cls, *demo_sets: list, key: str, embedder=None) -> "DemoIndex":
+        """Build from several demo lists; earlier lists win on duplicate `key` values (pass bootstrapped demos first)."""
+        demos, seen = [], set()
+        for demo_set in demo_sets:
+            for demo in demo_set:
+                record = demo.toDict() if hasattr(demo, "toDict") else dict(demo)
+                if record[key] not in seen:
+                    seen.add(record[key])
+                    demos.append(record)
+        return cls(demos, key, embedder)
+
+    def search(self, text: str, k: int) -> list[dict]:
+        if not self.demos or k <= 0:
+            return []
+        similarities = self.embeddings @ self._embed([text])[0]
+        k = min(k, len(self.demos))
+        top = np.argpartition(-similarities, k - 1)[:k]
+        # most similar demo last, closest to the actual input in the prompt
+        return [self.demos[i] for i in top[np.argsort(similarities[top])]]
+
+    def save(self, directory: str) -> None:
+        os.makedirs(directory, exist_ok=True)
+        np.save(os.path.join(directory, "embeddings.npy"), self.embeddings)
+        meta = {"key": self.key, "embedder": self.embedder.config() if hasattr(self.embedder, "config") else None}
+        with open(os.path.join(directory, "demos.json"), "w", encoding="utf-8") as f:
+            json.dump({"meta": meta, "demos": self.demos}, f, indent=2, ensure_ascii=False)
+
+    @classmethod
+    def load(cls, directory: str, embedder=None, mmap: bool = True) -> "DemoIndex":
+        """Load a saved index; embeddings are memory-mapped so replicas share the page cache."""
+        with open(os.path.join(directory, "demos.json"), encoding="utf-8") as f:
+            stored = json.load(f)
+        config = stored["meta"].get("embedder") or {}
+        if embedder is None and config.get("type") == "hashing":
+            embedder = HashingEmbedder(config["dim"], tuple(config["ngram_range"]))
+        embeddings = np.load(os.path.join(directory, "embeddings.npy"), mmap_mode="r" if mmap else None)
+        return cls(stored["demos"], stored["meta"]["key"], embedder, embeddings)
+
+
+class KNNTicketRouter(dspy.Module):
+    def __init__(self, index: DemoIndex, k: int = 3):
+        super().__init__()
+        self.router = dspy.ChainOfThought(RouteTicket)
+        self.index = index
+        self.k = k
+
+    def forward(self, ticket_text):
+        demos = [dspy.Example(**demo) for demo in self.index.search(ticket_text, self.k)]
+        # demos passed per call override the predictor's own, so concurrent calls never share state
+        return self.router(ticket_text=ticket_text, demos=demos)
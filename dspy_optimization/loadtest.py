@@ -0,0 +1,228 @@
+"""Closed-loop load driver for the example programs.
+
+Without ``--api-base`` it starts a ``MockLMServer`` in-process, so throughput and latency numbers
+are reproducible offline (e.g. in CI):
+
+    python -m dspy_optimization.loadtest ticket_router --concurrency 8 --requests 200 --mock-latency-ms 300
+    python -m dspy_optimization.loadtest ticket_router --concurrency 16 --coalesce
+    python -m dspy_optimization.loadtest business_pipeline --profile business_pipeline.folded   # per-stage tail latency
+    python -m dspy_optimization.loadtest nps_classifier --api-base http://host.docker.internal:11434 --model ollama_chat/llama3.2:1b
+
+With ``--http`` the program is served by an in-process ``ProgramServer`` and driven over HTTP,
+so per-program concurrency limits, 503s and deadlines show up in the numbers; ``--server-url``
+drives an already running ``python -m dspy_optimization.server`` instead:
+
+    python -m dspy_optimization.loadtest ticket_router --http --concurrency 32 --server-concurrency 8 --timeout-s 2
+"""
+import argparse
+import contextvars
+import itertools
+import json
+import math
+import threading
+import time
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable
+
+import dspy
+
+from dspy_optimization import business, nps, sales, tickets
+from dspy_optimization.coalesce import CoalescingLM
+from dspy_optimization.mock_lm import MockLMServer
+from dspy_optimization.profiler import install_profiler
+from dspy_optimization.server import SERVED_PROGRAMS, ProgramServer, ServedProgram
+
+BUSINESS_SAMPLE = {
+    "topic": "AI-powered customer support tool",
+    "market_data": "Market growing at 25% annually, current size $2B, competitors: Zendesk, Intercom",
+    "customer_feedback": "Users want faster response times, hate repetitive queries, willing to pay premium",
+}
+
+NPS_SAMPLE_COMMENTS = [
+    "Absolutely frustrated! Every time I find something I love, it's sold out in my size. What's the point of having a wishlist if nothing is ever available?",
+    "My parcel took three weeks and arrived with a crushed box and the wrong shade.",
+    "The app keeps logging me out at checkout and support just sends canned replies.",
+    "I was charged import fees on delivery that nobody mentioned when I ordered.",
+]
+
+# name -> (program factory, adapter factory, inputs)
+PROGRAMS: dict[str, tuple[Callable[[], dspy.Module], Callable[[], Any], Callable[[], list[dict[str, Any]]]]] = {
+    "ticket_router": (
+        tickets.TicketRouter,
+        dspy.ChatAdapter,
+        lambda: [example.inputs().toDict() for example in tickets.trainset + tickets.testset],
+    ),
+    "sales_qualifier": (
+        sales.SalesQualifier,
+        dspy.ChatAdapter,
+        lambda: [example.inputs().toDict() for example in sales.trainset],
+    ),
+    "business_pipeline": (
+        business.BusinessAnalysisPipeline,
+        dspy.ChatAdapter,
+        lambda: [BUSINESS_SAMPLE],
+    ),
+    "nps_classifier": (
+        lambda: dspy.ChainOfThought(nps.NPSTopic),
+        dspy.JSONAdapter,
+        lambda: [{"comment": comment} for comment in NPS_SAMPLE_COMMENTS],
+    ),
+}
+
+
+def percentile(values: list[float], q: float) -> float:
+    """Nearest-rank percentile, q in [0, 100]."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(0, min(len(ordered) - 1, math.ceil(q / 100 * len(ordered)) - 1))
+    return ordered[rank]
+
+
+def drive(call: Callable[..., Any], inputs: list[dict[str, Any]], concurrency: int = 8,
+          total_requests: int = 100) -> tuple[list[dict[str, Any]], float]:
+    """Keep `concurrency` calls in flight until `total_requests` have completed, cycling through `inputs`.
+
+    Returns one record per call (``latency`` in seconds plus ``result`` or ``error``) and the wall time.
+    """
+    pending = iter(itertools.islice(itertools.cycle(inputs), total_requests))
+    pending_lock = threading.Lock()
+    records = []
+    records_lock = threading.Lock()
+
+    def worker():
+        while True:
+            with pending_lock:
+                kwargs = next(pending, None)
+            if kwargs is None:
+                return
+            start = time.perf_counter()
+            try:
+                record = {"result": call(**kwargs)}
+            except Exception as e:
+                record = {"error": e}
+            record["latency"] = time.perf_counter() - start
+            with records_lock:
+                records.append(record)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        for future in [pool.submit(contextvars.copy_context().run, worker) for _ in range(concurrency)]:
+            future.result()
+    return records, time.perf_counter() - start
+
+
+def http_caller(url: str, timeout_s: float) -> Callable[..., Any]:
+    """Call a served program at `url`; non-200 responses raise ``HTTPError``."""
+    def call(**inputs):
+        body = json.dumps({"inputs": inputs, "timeout_s": timeout_s}).encode()
+        request = urllib.request.Request(url, data=body, headers={"Content-Type": "application/json"})
+        with urllib.request.urlopen(request, timeout=timeout_s + 5) as response:
+            return json.loads(response.read())
+    return call
+
+
+def run_load(program: Callable[..., Any], inputs: list[dict[str, Any]], concurrency: int = 8, total_requests: int = 100) -> dict[str, Any]:
+    """Throughput and latency percentiles of `program` under a closed-loop load of `concurrency` callers."""
+    records, duration = drive(program, inputs, concurrency, total_requests)
+    latencies = [r["latency"] for r in records if "error" not in r]
+    errors = [f"{type(r['error']).__name__}: {r['error']}" for r in records if "error" in r]
+
+    return {
+        "requests": total_requests,
+        "concurrency": concurrency,
+        "succeeded": len(latencies),
+        "errors": len(errors),
+        "sample_errors": errors[:5],
+        "duration_s": round(duration, 3),
+        "throughput_rps": round(len(latencies) / duration, 2) if duration else 0.0,
+        "latency_ms": {
+            "p50": round(1000 * percentile(latencies, 50), 1),
+            "p95": round(1000 * percentile(latencies, 95), 1),
+            "p99": round(1000 * percentile(latencies, 99), 1),
+            "mean": round(1000 * sum(latencies) / len(latencies), 1) if latencies else 0.0,
+        },
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure throughput and latency of an example program.")
+    parser.add_argument("program", choices=sorted(PROGRAMS))
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--requests", type=int, default=100)
+    parser.add_argument("--load", help="saved program state to load before the run")
+    parser.add_argument("--api-base", help="real endpoint; a local mock LM is started when omitted")
+    parser.add_argument("--model", default="openai/mock-lm")
+    parser.add_argument("--mock-latency-ms", type=float, default=200.0)
+    parser.add_argument("--mock-ms-per-token", type=float, default=0.0)
+    parser.add_argument("--mock-error-rate", type=float, default=0.0)
+    parser.add_argument("--mock-rate-limit-rate", type=float, default=0.0)
+    parser.add_argument("--mock-replay", help="replay file for the mock LM")
+    parser.add_argument("--coalesce", action="store_true", help="wrap the LM in CoalescingLM")
+    parser.add_argument("--http", action="store_true", help="serve the program in-process and drive it over HTTP")
+    parser.add_argument("--server-url", help="drive a running dspy_optimization.server instead")
+    parser.add_argument("--server-concurrency", type=int, default=8, help="per-program concurrency of the --http server")
+    parser.add_argument("--server-queue", type=int, default=64)
+    parser.add_argument("--timeout-s", type=float, default=30.0, help="request deadline sent to the server")
+    parser.add_argument("--profile", help="profile every module call and write collapsed stacks (flame graph) here")
+    parser.add_argument("--json", help="write the report to this file as well")
+    args = parser.parse_args()
+    if (args.http or args.server_url) and args.program not in SERVED_PROGRAMS:
+        parser.error(f"{args.program} is not served; choose one of {', '.join(SERVED_PROGRAMS)}")
+
+    mock = None
+    api_base = args.api_base
+    if api_base is None and not args.server_url:
+        mock = MockLMServer(port=0, latency_ms=args.mock_latency_ms, ms_per_token=args.mock_ms_per_token,
+                            error_rate=args.mock_error_rate, rate_limit_rate=args.mock_rate_limit_rate,
+                            replay_path=args.mock_replay).start()
+        api_base = mock.url
+
+    make_program, make_adapter, make_inputs = PROGRAMS[args.program]
+    llm = dspy.LM(args.model, api_base=api_base, api_key="mock", cache=False)
+    if args.coalesce:
+        llm = CoalescingLM(llm)
+    dspy.settings.configure(lm=llm, adapter=make_adapter())
+    profiler = install_profiler() if args.profile else None
+    program = make_program()
+    if args.load:
+        program.load(args.load)
+
+    server = None
+    call = program
+    if args.http:
+        served = {args.program: ServedProgram(args.program, program, make_adapter(), args.server_concurrency,
+                                              args.server_queue, source=args.load)}
+        server = ProgramServer(lambda: served, port=0, default_timeout_s=args.timeout_s).start()
+        server.wait_ready()
+        call = http_caller(f"{server.url}/v1/programs/{args.program}", args.timeout_s)
+    elif args.server_url:
+        call = http_caller(f"{args.server_url.rstrip('/')}/v1/programs/{args.program}", args.timeout_s)
+
+    try:
+        report = {"program": args.program, **run_load(call, make_inputs(), args.concurrency, args.requests)}
+    finally:
+        if server:
+            server.stop()
+        if mock:
+            mock.stop()
+    if server:
+        report["server"] = server.metrics.snapshot()
+    if profiler:
+        report["stages"] = profiler.summary()
+        profiler.write_flamegraph(args.profile)
+        print(profiler.report())
+    if mock:
+        report["mock_lm"] = dict(mock.stats)
+    if isinstance(llm, CoalescingLM):
+        report["coalescing"] = llm.stats()
+
+    print(json.dumps(report, indent=2))
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,380 @@
+"""Local OpenAI-compatible stand-in for the Azure / Ollama endpoints, for offline benchmarks.
+
+Responses come from a replay file recorded off a real ``dspy.LM`` (see ``record_history``)
+when the exact prompt was seen before, and are otherwise generated from the request's JSON
+schema (``response_format``) or from the output fields that the dspy adapter describes in the
+system prompt, so ChatAdapter, JSONAdapter and plain structured-output clients all parse
+them. A JSON object is returned whenever the request asks for one, with or without a
+``response_format``. Latency is log-normal around a median plus a per-token cost; 429s and
+500s are injected at configurable rates. ``"stream": true`` requests get server-sent-event chunks, with the
+median latency before the first chunk and `ms_per_token` between chunks.
+
+Usage:
+    python -m dspy_optimization.mock_lm --port 8089 --latency-ms 300 --rate-limit-rate 0.02
+
+    lm = dspy.LM("openai/mock-lm", api_base="http://127.0.0.1:8089/v1", api_key="mock", cache=False)
+"""
+import argparse
+import hashlib
+import json
+import math
+import random
+import re
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any
+
+_FIELD_LINE = re.compile(r"^\d+\. `(\w+)` \((.*?)\):?(.*)$")
+_STREAM_PIECE = re.compile(r"\s*\S{1,4}|\s+$")
+_QUOTED = re.compile(r"'((?:[^'\\]|\\.)*)'|\"((?:[^\"\\]|\\.)*)\"")
+
+
+def prompt_key(messages: list[dict[str, Any]]) -> str:
+    """Replay key of a chat request: hash of its messages, ignoring model and sampling params."""
+    return hashlib.sha256(json.dumps(messages, sort_keys=True).encode()).hexdigest()
+
+
+def count_tokens(text: str) -> int:
+    # ~4 characters per token for English prose; good enough for relative cost comparisons
+    return max(1, len(text) // 4)
+
+
+def record_history(lm, path: str) -> int:
+    """Append every call in ``lm.history`` to a replay file; returns the number of records written."""
+    written = 0
+    with open(path, "a", encoding="utf-8") as f:
+        for entry in lm.history:
+            if not entry.get("messages") or not entry.get("outputs"):
+                continue
+            output = entry["outputs"][0]
+            content = output["text"] if isinstance(output, dict) else output
+            f.write(json.dumps({"key": prompt_key(entry["messages"]), "content": content}) + "\n")
+            written += 1
+    return written
+
+
+def parse_output_fields(system_prompt: str) -> list[tuple[str, str, str]]:
+    """(name, type, description) of each output field, as rendered by dspy's ChatAdapter/JSONAdapter."""
+    fields, in_outputs = [], False
+    for line in system_prompt.splitlines():
+        if line.startswith("Your output fields are:"):
+            in_outputs = True
+            continue
+        if in_outputs:
+            match = _FIELD_LINE.match(line.strip())
+            if match:
+                fields.append((match.group(1), match.group(2), match.group(3).strip()))
+            elif fields and not line.startswith(" "):
+                break
+    return fields
+
+
+def _options(type_: str, desc: str) -> list[str]:
+    if "Literal[" in type_:
+        return [a or b for a, b in _QUOTED.findall(type_)]
+    if type_ != "str":
+        return []
+    # descriptions like "Startup, SMB, Mid-Market, Enterprise" or "One of: Billing, Technical, ..."
+    desc = desc.split(":", 1)[1] if desc.lower().startswith("one of:") else desc
+    parts = [re.sub(r"^(or|and)\s+", "", p.strip()) for p in desc.split(",")]
+    if len(parts) >= 2 and all(0 < len(p.split()) <= 3 for p in parts):
+        return parts
+    return []
+
+
+def generate_value(name: str, type_: str, desc: str, rng: random.Random, words: int) -> Any:
+    options = _options(type_, desc)
+    is_list = type_.lower().startswith(("list[", "typing.list["))
+    if options:
+        if is_list:
+            return rng.sample(options, k=min(len(options), rng.randint(1, 2)))
+        return rng.choice(options)
+    if is_list:
+        return [f"{name} item {i + 1}" for i in range(3)]
+    if type_ == "int":
+        return rng.randint(0, 10)
+    if type_ == "float":
+        return round(rng.random(), 2)
+    if type_ == "bool":
+        return rng.random() < 0.5
+    return " ".join([f"Mock {name.replace('_', ' ')}"] + rng.choices(
+        ["the", "customer", "request", "team", "analysis", "signal", "because", "priority", "plan"], k=words))
+
+
+def generate_from_schema(schema: dict[str, Any], rng: random.Random, words: int = 12, name: str = "value", defs=None) -> Any:
+    """A value that validates against `schema`, for structured-output (json_schema) requests."""
+    defs = defs if defs is not None else schema.get("$defs", {})
+    if "$ref" in schema:
+        return generate_from_schema(defs[schema["$ref"].split("/")[-1]], rng, words, name, defs)
+    for key in ("anyOf", "oneOf"):
+        if key in schema:
+            options = [s for s in schema[key] if s.get("type") != "null"] or schema[key]
+            return generate_from_schema(options[0], rng, words, name, defs)
+    if "enum" in schema:
+        return rng.choice(schema["enum"])
+    type_ = schema.get("type", "string")
+    if type_ == "object":
+        return {key: generate_from_schema(sub, rng, words, key, defs) for key, sub in schema.get("properties", {}).items()}
+    if type_ == "array":
+        return [generate_from_schema(schema.get("items", {}), rng, words, name, defs) for _ in range(2)]
+    if type_ == "integer":
+        return rng.randint(int(schema.get("minimum", 0)), int(schema.get("maximum", 10)))
+    if type_ == "number":
+        return round(rng.uniform(schema.get("minimum", 0.0), schema.get("maximum", 1.0)), 2)
+    if type_ == "boolean":
+        return rng.random() < 0.5
+    return generate_value(name, "str", "", rng, words)
+
+
+def _text(content: Any) -> str:
+    if isinstance(content, list):
+        return " ".join(part.get("text", "") for part in content)
+    return content or ""
+
+
+def generate_completion(messages: list[dict[str, Any]], json_mode: bool, rng: random.Random, words: int = 12) -> str:
+    system = _text(next((m["content"] for m in messages if m.get("role") == "system"), ""))
+    fields = parse_output_fields(system)
+    values = {name: generate_value(name, type_, desc, rng, words) for name, type_, desc in fields}
+    # JSONAdapter renders its inputs with "[[ ## " markers too, but asks for a JSON object
+    asks_for_json = any("JSON object" in _text(m.get("content")) for m in messages)
+    if json_mode or asks_for_json or "[[ ## " not in system:
+        return json.dumps(values)
+    sections = []
+    for name, value in values.items():
+        rendered = value if isinstance(value, str) else json.dumps(value)
+        sections.append(f"[[ ## {name} ## ]]\n{rendered}")
+    sections.append("[[ ## completed ## ]]")
+    return "\n\n".join(sections)
+
+
+class MockLMServer:
+    def __init__(
+        self,
+        host: str = "127.0.0.1",
+        port: int = 8089,
+        latency_ms: float = 0.0,
+        latency_sigma: float = 0.3,
+        ms_per_token: float = 0.0,
+        error_rate: float = 0.0,
+        rate_limit_rate: float = 0.0,
+        replay_path: str | None = None,
+        replay_only: bool = False,
+        seed: int = 0,
+    ):
+        """
+        Args:
+            latency_ms: Median time to first byte; actual latency is log-normal with `latency_sigma`.
+            ms_per_token: Extra delay per completion token, to mimic generation speed.
+            error_rate: Fraction of requests answered with HTTP 500.
+            rate_limit_rate: Fraction of requests answered with HTTP 429 and a Retry-After header.
+            replay_path: JSONL file written by ``record_history``.
+            replay_only: Return 404 for prompts missing from the replay file instead of generating.
+            seed: Seed for latency/error sampling; generated content is seeded by the prompt itself.
+        """
+        self.latency_ms = latency_ms
+        self.latency_sigma = latency_sigma
+        self.ms_per_token = ms_per_token
+        self.error_rate = error_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.replay_only = replay_only
+        self.replay: dict[str, str] = {}
+        if replay_path:
+            with open(replay_path, encoding="utf-8") as f:
+                for line in f:
+                    if line.strip():
+                        record = json.loads(line)
+                        self.replay[record["key"]] = record["content"]
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self.stats = {"requests": 0, "replayed": 0, "generated": 0, "errors": 0, "rate_limited": 0}
+        self._httpd = ThreadingHTTPServer((host, port), self._handler())
+        self._httpd.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self) -> str:
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def _count(self, stat: str):
+        with self._lock:
+            self.stats[stat] += 1
+
+    def _sample(self) -> tuple[float, float]:
+        with self._lock:
+            return self._rng.random(), self._rng.gauss(0, self.latency_sigma)
+
+    def _generate(self, body: dict[str, Any]) -> tuple[int, dict[str, Any] | str, dict[str, str], float]:
+        """Pick the reply content; returns (status, content or error payload, extra headers, latency noise)."""
+        self._count("requests")
+        roll, noise = self._sample()
+        if roll < self.rate_limit_rate:
+            self._count("rate_limited")
+            return 429, {"error": {"message": "Rate limit exceeded", "type": "rate_limit_error"}}, {"Retry-After": "1"}, noise
+        if roll < self.rate_limit_rate + self.error_rate:
+            self._count("errors")
+            return 500, {"error": {"message": "Injected server error", "type": "server_error"}}, {}, noise
+
+        messages = body.get("messages", [])
+        key = prompt_key(messages)
+        if key in self.replay:
+            content = self.replay[key]
+            self._count("replayed")
+        elif self.replay_only:
+            return 404, {"error": {"message": "Prompt not in replay file", "type": "not_found"}}, {}, noise
+        else:
+            response_format = body.get("response_format") or {}
+            schema = (response_format.get("json_schema") or {}).get("schema")
+            if schema:
+                content = json.dumps(generate_from_schema(schema, random.Random(key)))
+            else:
+                json_mode = response_format.get("type") in ("json_object", "json_schema")
+                content = generate_completion(messages, json_mode, random.Random(key))
+            self._count("generated")
+        return 200, content, {}, noise
+
+    @staticmethod
+    def _usage(body: dict[str, Any], content: str) -> dict[str, int]:
+        prompt_tokens = count_tokens(json.dumps(body.get("messages", [])))
+        completion_tokens = count_tokens(content)
+        return {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+                "total_tokens": prompt_tokens + completion_tokens}
+
+    def complete(self, body: dict[str, Any]) -> tuple[int, dict[str, Any], dict[str, str]]:
+        """Handle one chat-completions request; returns (status, payload, extra headers)."""
+        status, content, headers, noise = self._generate(body)
+        if status != 200:
+            return status, content, headers
+        usage = self._usage(body, content)
+        delay_ms = self.latency_ms * math.exp(noise) + self.ms_per_token * usage["completion_tokens"]
+        time.sleep(delay_ms / 1000)
+        return 200, {
+            "id": f"chatcmpl-{uuid.uuid4().hex}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": body.get("model", "mock-lm"),
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+            "usage": usage,
+        }, {}
+
+    def complete_stream(self, body: dict[str, Any]) -> tuple[int, Any, dict[str, str]]:
+        """Like ``complete`` but, on success, the payload is an iterator of chat.completion.chunk dicts."""
+        status, content, headers, noise = self._generate(body)
+        if status != 200:
+            return status, content, headers
+
+        def chunks():
+            chunk_id, created = f"chatcmpl-{uuid.uuid4().hex}", int(time.time())
+            base = {"id": chunk_id, "object": "chat.completion.chunk", "created": created, "model": body.get("model", "mock-lm")}
+            time.sleep(self.latency_ms * math.exp(noise) / 1000)
+            for piece in _STREAM_PIECE.findall(content):
+                yield {**base, "choices": [{"index": 0, "delta": {"content": piece}, "finish_reason": None}]}
+                time.sleep(self.ms_per_token * count_tokens(piece) / 1000)
+            final = {**base, "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}]}
+            if (body.get("stream_options") or {}).get("include_usage"):
+                final["usage"] = self._usage(body, content)
+            yield final
+
+        return 200, chunks(), {}
+
+    def _handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def _send(self, status, payload, headers=None):
+                data = json.dumps(payload).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                for name, value in (headers or {}).items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(data)
+
+            def _send_stream(self, chunks):
+                self.send_response(200)
+                self.send_header("Content-Type", "text/event-stream")
+                self.send_header("Cache-Control", "no-cache")
+                self.end_headers()
+                for chunk in chunks:
+                    self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode())
+                    self.wfile.flush()
+                self.wfile.write(b"data: [DONE]\n\n")
+                self.close_connection = True
+
+            def do_GET(self):
+                if self.path.rstrip("/").endswith("/models"):
+                    self._send(200, {"object": "list", "data": [{"id": "mock-lm", "object": "model"}]})
+                elif self.path == "/health":
+                    self._send(200, {"status": "ok", **server.stats})
+                else:
+                    self._send(404, {"error": {"message": "Not found"}})
+
+            def do_POST(self):
+                if not self.path.rstrip("/").endswith("/chat/completions"):
+                    self._send(404, {"error": {"message": "Not found"}})
+                    return
+                length = int(self.headers.get("Content-Length", 0))
+                body = json.loads(self.rfile.read(length) or b"{}")
+                if not body.get("stream"):
+                    self._send(*server.complete(body))
+                    return
+                status, payload, headers = server.complete_stream(body)
+                if status == 200:
+                    self._send_stream(payload)
+                else:
+                    self._send(status, payload, headers)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+    def serve_forever(self):
+        self._httpd.serve_forever()
+
+    def start(self) -> "MockLMServer":
+        """Serve from a daemon thread, for use inside benchmarks and tests."""
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run a local OpenAI-compatible mock LM.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8089)
+    parser.add_argument("--latency-ms", type=float, default=0.0)
+    parser.add_argument("--latency-sigma", type=float, default=0.3)
+    parser.add_argument("--ms-per-token", type=float, default=0.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0)
+    parser.add_argument("--replay", help="JSONL replay file written by record_history()")
+    parser.add_argument("--replay-only", action="store_true")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    server = MockLMServer(args.host, args.port, args.latency_ms, args.latency_sigma, args.ms_per_token,
+                          args.error_rate, args.rate_limit_rate, args.replay, args.replay_only, args.seed)
+    print(f"Mock LM listening on {server.url}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,136 @@
+"""Multi-label scoring on bitmasks: a graded per-example metric and a vectorized report.
+
+An NPS comment can carry several topics, and an all-or-nothing set comparison scores "two of
+three topics right" the same as "all wrong", which gives MIPROv2 a flat, noisy signal.
+``LabelCodec`` encodes a label list as an integer bitmask over a fixed label set (the 10
+``NPSTopicLabel`` literals). Labels outside the set go to one extra "invented" bit, so they
+still count as wrong.
+
+* ``JaccardMetric`` scores one example as |gold ∧ predicted| / |gold ∨ predicted| with two
+  popcounts. It is a drop-in graded metric for ``Evaluate`` and the optimizers. When a trace is
+  passed (bootstrapping a demo) it only accepts exact matches.
+* ``multilabel_report`` scores a whole evaluation set in one numpy pass: mean Jaccard,
+  exact-match rate, Hamming loss, micro/macro precision/recall/F1 and per-label
+  precision/recall/F1.
+
+    evaluate = Evaluate(devset=valset, metric=topic_jaccard, num_threads=24)
+    report = PredictionSet.from_evaluation(evaluate(program)).multilabel("answer", NPS_TOPICS)
+    print(format_multilabel_report(report))
+"""
+from typing import Any, Iterable
+
+import numpy as np
+
+from dspy_optimization.evaluation import mean_interval
+
+
+class LabelCodec:
+    def __init__(self, labels: Iterable[str]):
+        self.labels = tuple(labels)
+        if len(self.labels) > 63:
+            raise ValueError("at most 63 labels fit a uint64 mask next to the invented-label bit")
+        self.index = {label.lower(): bit for bit, label in enumerate(self.labels)}
+        self.invented_bit = 1 << len(self.labels)
+
+    def encode(self, values: Any) -> int:
+        """Bitmask of a label list (or a single label); unknown labels set the invented bit."""
+        if values is None:
+            return 0
+        if isinstance(values, str):
+            values = [values]
+        mask = 0
+        for value in values:
+            bit = self.index.get(str(value).strip().lower())
+            mask |= self.invented_bit if bit is None else 1 << bit
+        return mask
+
+    def encode_many(self, rows: Iterable[Any]) -> np.ndarray:
+        return np.fromiter((self.encode(values) for values in rows), dtype=np.uint64)
+
+    def decode(self, mask: int) -> list[str]:
+        return [label for bit, label in enumerate(self.labels) if mask >> bit & 1]
+
+
+def jaccard(gold: int, predicted: int) -> float:
+    union = (gold | predicted).bit_count()
+    return 1.0 if union == 0 else (gold & predicted).bit_count() / union
+
+
+class JaccardMetric:
+    def __init__(self, field: str, labels: Iterable[str]):
+        self.field = field
+        self.codec = LabelCodec(labels)
+        # named, so checkpoints and Evaluate tables can tell it from other metrics
+        self.__name__ = f"jaccard_{field}"
+
+    def __call__(self, example, pred, trace=None) -> float | bool:
+        gold = self.codec.encode(getattr(example, self.field))
+        # a missing or malformed prediction predicts nothing: partial credit 0 unless gold is empty too
+        predicted = self.codec.encode(getattr(pred, self.field, None))
+        score = jaccard(gold, predicted)
+        return score if trace is None else score == 1.0
+
+
+def _ratio(numerator: np.ndarray, denominator: np.ndarray) -> np.ndarray:
+    return np.divide(numerator, denominator, out=np.zeros(np.shape(numerator), dtype=float), where=denominator > 0)
+
+
+def multilabel_report(gold: np.ndarray, predicted: np.ndarray, labels: Iterable[str]) -> dict[str, Any]:
+    """Set-level and per-label scores of two arrays of masks encoded by a ``LabelCodec`` over `labels`."""
+    labels = tuple(labels)
+    n_labels = len(labels)
+    shifts = np.arange(n_labels + 1, dtype=np.uint64)
+    gold_bits = ((np.asarray(gold, dtype=np.uint64)[:, None] >> shifts) & np.uint64(1)).astype(bool)
+    pred_bits = ((np.asarray(predicted, dtype=np.uint64)[:, None] >> shifts) & np.uint64(1)).astype(bool)
+
+    intersection = (gold_bits & pred_bits).sum(axis=1)
+    union = (gold_bits | pred_bits).sum(axis=1)
+    per_example = np.where(union == 0, 1.0, _ratio(intersection, union))
+
+    tp = (gold_bits & pred_bits).sum(axis=0)
+    fp = (~gold_bits & pred_bits).sum(axis=0)
+    fn = (gold_bits & ~pred_bits).sum(axis=0)
+    precision = _ratio(tp[:n_labels], tp[:n_labels] + fp[:n_labels])
+    recall = _ratio(tp[:n_labels], tp[:n_labels] + fn[:n_labels])
+    f1 = _ratio(2 * precision * recall, precision + recall)
+    # invented labels are false positives for the micro scores; they have no column of their own
+    micro_precision = float(_ratio(tp.sum(), tp.sum() + fp.sum()))
+    micro_recall = float(_ratio(tp.sum(), tp.sum() + fn.sum()))
+    seen = (tp + fp + fn)[:n_labels] > 0
+
+    low, high = mean_interval(per_example)
+    return {
+        "n": len(per_example),
+        "jaccard": round(float(per_example.mean()), 4) if len(per_example) else 0.0,
+        "jaccard_ci95": (round(low, 4), round(high, 4)),
+        "exact_match": round(float((np.asarray(gold) == np.asarray(predicted)).mean()), 4) if len(per_example) else 0.0,
+        "hamming_loss": round(float((gold_bits ^ pred_bits)[:, :n_labels].mean()), 4) if len(per_example) else 0.0,
+        "invented_rate": round(float(pred_bits[:, n_labels].mean()), 4) if len(per_example) else 0.0,
+        "micro": {"precision": round(micro_precision, 4), "recall": round(micro_recall, 4),
+                  "f1": round(float(_ratio(2 * micro_precision * micro_recall, micro_precision + micro_recall)), 4)},
+        # labels that appear in neither gold nor predictions would only pull the average to 0
+        "macro": {"precision": round(float(precision[seen].mean()), 4) if seen.any() else 0.0,
+                  "recall": round(float(recall[seen].mean()), 4) if seen.any() else 0.0,
+                  "f1": round(float(f1[seen].mean()), 4) if seen.any() else 0.0},
+        "per_label": {
+            label: {"precision": round(float(precision[i]), 3), "recall": round(float(recall[i]), 3),
+                    "f1": round(float(f1[i]), 3), "support": int(tp[i] + fn[i]), "predicted": int(tp[i] + fp[i])}
+            for i, label in enumerate(labels)
+        },
+    }
+
+
+def format_multilabel_report(report: dict[str, Any]) -> str:
+    lines = [
+        f"Jaccard {report['jaccard']:.3f} (95% CI {report['jaccard_ci95'][0]:.3f}-{report['jaccard_ci95'][1]:.3f}), "
+        f"exact match {report['exact_match']:.1%}, Hamming loss {report['hamming_loss']:.3f}, "
+        f"invented labels in {report['invented_rate']:.1%} of predictions, n={report['n']}"
+        + (f" ({report['failed']} failed)" if report.get("failed") else ""),
+        f"micro P/R/F1 {report['micro']['precision']:.3f}/{report['micro']['recall']:.3f}/{report['micro']['f1']:.3f}, "
+        f"macro P/R/F1 {report['macro']['precision']:.3f}/{report['macro']['recall']:.3f}/{report['macro']['f1']:.3f}",
+    ]
+    width = max(len(label) for label in report["per_label"]) + 2
+    lines.append("label".ljust(width) + "".join(column.rjust(11) for column in ("precision", "recall", "f1", "support", "predicted")))
+    for label, stats in report["per_label"].items():
+        lines.append(label.ljust(width) + "".join(f"{stats[column]:>11}" for column in ("precision", "recall", "f1", "support", "predicted")))
+    return "\n".join(lines)
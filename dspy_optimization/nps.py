@@ -0,0 +1,165 @@
+"""NPS topic classifier used by maintwo.py, plus a bulk runner for nightly comment dumps.
+
+Usage:
+    python -m dspy_optimization.nps data/nps_comments.json nps_topics.jsonl --program dspy/nps_topic_miprov2.json
+
+The output file doubles as the checkpoint: re-running the same command after a crash
+continues after the last record that was written, and retries the records whose LM call failed.
+"""
+import argparse
+import contextvars
+import json
+import os
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Literal, get_args
+
+import dspy
+
+from dspy_optimization.records import iter_records
+
+NPSTopicLabel = Literal['Slow or Unreliable Shipping', 'Inaccurate Product Descriptions or Photos', 'Limited Size or Shade Availability',
+                        'Unresponsive or Generic Customer Support', 'Website or App Bugs', 'Confusing Loyalty or Discount Systems',
+                        'Complicated Returns or Exchanges', 'Customs and Import Charges', 'Difficult Product Discovery',
+                        'Damaged or Incorrect Items']
+
+NPS_TOPICS: tuple[str, ...] = get_args(NPSTopicLabel)
+
+
+class NPSTopic(dspy.Signature):
+    """Classify NPS topics"""
+
+    comment: str = dspy.InputField()
+    answer: List[NPSTopicLabel] = dspy.OutputField()
+
+
+def __getattr__(name: str):
+    # built on first use, so importing NPSTopic (server.py) does not load numpy via multilabel
+    if name == "topic_jaccard":
+        from dspy_optimization.multilabel import JaccardMetric
+
+        # graded: predicting two of a comment's three topics scores 2/3 instead of 0
+        metric = globals()["topic_jaccard"] = JaccardMetric("answer", NPS_TOPICS)
+        return metric
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def _resume_state(output_path: str) -> tuple[int, set[int]]:
+    """Index to continue from and the indices whose last attempt failed.
+
+    A half-written last line left by a crash is dropped.
+    """
+    if not os.path.exists(output_path):
+        return 0, set()
+    next_index = 0
+    failed = set()
+    good_bytes = 0
+    with open(output_path, "rb") as f:
+        for line in f:
+            if not line.endswith(b"\n"):
+                break
+            try:
+                result = json.loads(line)
+            except ValueError:
+                break
+            index = result["index"]
+            next_index = max(next_index, index + 1)
+            if "error" in result:
+                failed.add(index)
+            else:
+                failed.discard(index)
+            good_bytes += len(line)
+    if good_bytes != os.path.getsize(output_path):
+        with open(output_path, "r+b") as f:
+            f.truncate(good_bytes)
+    return next_index, failed
+
+
+def classify_file(
+    program: dspy.Module,
+    input_path: str,
+    output_path: str,
+    num_workers: int = 8,
+    max_pending: int | None = None,
+    progress_every: int = 1000,
+) -> dict[str, int | float]:
+    """Stream records from `input_path` through `program` and append results to `output_path` as JSONL.
+
+    At most `max_pending` records are in flight at once; reading the input pauses until the
+    oldest one finishes. Results are written in input order with their input index. A failed
+    call is written with an "error" field; resuming skips every index up to the last one
+    written except those, and appends their retry, so the last line for an index wins.
+    """
+    max_pending = max_pending or num_workers * 4
+    next_index, retry = _resume_state(output_path)
+    skipped = next_index - len(retry)
+    stats = {"skipped": skipped, "classified": 0, "failed": 0}
+    start = time.perf_counter()
+
+    def classify(index, record):
+        result = {"index": index, "comment": record.get("comment")}
+        try:
+            result["answer"] = program(comment=record["comment"]).answer
+        except Exception as e:
+            result["answer"] = None
+            result["error"] = f"{type(e).__name__}: {e}"
+        return result
+
+    with open(output_path, "a", encoding="utf-8") as out, ThreadPoolExecutor(max_workers=num_workers) as pool:
+        pending = deque()
+
+        def write_oldest():
+            result = pending.popleft().result()
+            out.write(json.dumps(result, ensure_ascii=False) + "\n")
+            out.flush()
+            stats["failed" if "error" in result else "classified"] += 1
+            written = stats["classified"] + stats["failed"]
+            if progress_every and written % progress_every == 0:
+                rate = written / (time.perf_counter() - start)
+                print(f"{skipped + written} records done ({rate:.1f}/s, {stats['failed']} failed)")
+
+        for index, record in enumerate(iter_records(input_path)):
+            if index < next_index and index not in retry:
+                continue
+            if len(pending) >= max_pending:
+                write_oldest()
+            pending.append(pool.submit(contextvars.copy_context().run, classify, index, record))
+        while pending:
+            write_oldest()
+
+    stats["elapsed_s"] = time.perf_counter() - start
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Classify NPS comments in bulk.")
+    parser.add_argument("input", help="JSON array or JSONL file with a 'comment' field per record")
+    parser.add_argument("output", help="JSONL file to append results to (also used to resume)")
+    parser.add_argument("--program", help="saved (optimized) NPS program to load")
+    parser.add_argument("--model", default="ollama_chat/llama3.2:1b")
+    parser.add_argument("--api-base", default="http://host.docker.internal:11434")
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument("--max-pending", type=int)
+    args = parser.parse_args()
+
+    from dspy_optimization.cache import install_cache
+    from dspy_optimization.structured import StructuredOutputAdapter
+
+    llm = dspy.LM(args.model, api_base=args.api_base, api_key='')
+    adapter = StructuredOutputAdapter()
+    dspy.settings.configure(lm=llm, adapter=adapter)
+    install_cache()
+
+    nps_topic_model = dspy.ChainOfThought(NPSTopic)
+    if args.program:
+        nps_topic_model.load(args.program)
+
+    stats = classify_file(nps_topic_model, args.input, args.output,
+                          num_workers=args.workers, max_pending=args.max_pending)
+    stats["structured_outputs"] = adapter.stats()
+    print(json.dumps(stats))
+
+
+if __name__ == "__main__":
+    main()
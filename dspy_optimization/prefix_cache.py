@@ -0,0 +1,324 @@
+"""Shared-prefix prompt caching: keep each program's static preamble warm in the serving backend.
+
+``RouteTicket``, ``QualifySalesLead`` and ``NPSTopic`` send the same long system message
+(field descriptions, instructions) and the same demos on every call; only the final user
+message changes. Backends can skip prefilling a prefix they have seen recently (KV-cache reuse
+in Ollama and llama.cpp, prompt caching at Anthropic/OpenAI), which is most of the
+time-to-first-token for the few-shot-heavy optimized programs. ``PrefixCachingLM`` wraps an LM
+so requests keep that prefix stable and the backend can reuse it:
+
+* messages are ordered static first: system messages (merged into one) lead, then the demos,
+  and the per-request turn comes last. dspy's chat and JSON adapters already render in that
+  order, so this only matters for adapters or callers that put a system note mid-conversation;
+* the static prefix (everything before the last user turn) is hashed and tagged for the
+  backend: Anthropic gets a ``cache_control`` breakpoint on its last message; a llama.cpp
+  server gets ``cache_prompt`` and an ``id_slot`` pinned per prefix, so programs served from
+  one process do not evict each other's KV cache; Ollama requests carry ``keep_alive`` (and an
+  optional fixed ``num_ctx``) because an unloaded or reloaded model loses its cache. OpenAI and
+  Azure cache prefixes of 1024+ tokens on their own;
+* each call is classified as a predicted prefix hit or miss (the prefix is still held by its
+  slot, in one of the `slots` most recent prefixes, or used within `ttl_s`), and where the
+  backend reports cached prompt tokens those are counted too. Calls the response cache answers
+  never reach the backend, so they do not take a slot or count as hits or misses.
+
+    llm = PrefixCachingLM(dspy.LM("ollama_chat/llama3.2:1b", api_base=...), slots=4)
+    dspy.settings.configure(lm=llm)
+    ...
+    print(llm.report())   # prefix cache: 3 prefixes, 97.5% predicted hits over 400 calls, ...
+"""
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any
+
+import dspy
+import orjson
+from dspy.clients import lm as dspy_lm
+
+from dspy_optimization.prompt_budget import message_tokens
+
+BACKENDS = ("none", "openai", "anthropic", "ollama", "llama.cpp")
+# below these prefix lengths the providers do not cache at all
+_MIN_PREFIX_TOKENS = {"openai": 1024, "anthropic": 1024}
+# how long the providers keep an unused prefix (at least)
+_PROVIDER_TTL_S = {"openai": 300.0, "anthropic": 300.0}
+# prefixes remembered for providers, which have no slots to bound them
+_MAX_TRACKED = 1024
+# the completion functions whose names dspy.LM's response cache puts in its keys
+_COMPLETIONS = {"chat": "litellm_completion", "text": "litellm_text_completion",
+                "responses": "litellm_responses_completion"}
+
+
+def detect_backend(model: str) -> str:
+    """Backend of a litellm model name; a llama.cpp server speaks the OpenAI API, so it has to be named explicitly."""
+    provider = model.split("/", 1)[0]
+    if provider in ("ollama", "ollama_chat"):
+        return "ollama"
+    if provider == "anthropic" or "claude" in model:
+        return "anthropic"
+    if provider in ("openai", "azure"):
+        return "openai"
+    return "none"
+
+
+def order_static_first(messages: list[dict[str, Any]]) -> list[dict[str, Any]]:
+    """System messages first (merged into one when they are plain text), the other turns in their order."""
+    system = [m for m in messages if m["role"] == "system"]
+    if all(m["role"] == "system" for m in messages[:len(system)]):
+        return messages
+    if not all(isinstance(m["content"], str) for m in system):
+        return system + [m for m in messages if m["role"] != "system"]
+    merged = {"role": "system", "content": "\n\n".join(m["content"] for m in system)}
+    return [merged] + [m for m in messages if m["role"] != "system"]
+
+
+def split_static_prefix(messages: list[dict[str, Any]]) -> int:
+    """Number of leading messages shared by every call of a program: all but the final user turn."""
+    for index in range(len(messages) - 1, -1, -1):
+        if messages[index]["role"] == "user":
+            return index
+    return sum(1 for m in messages if m["role"] == "system")
+
+
+def reported_cached_tokens(response) -> int | None:
+    """Cached prompt tokens as reported by the backend, or None when it does not report them (Ollama)."""
+    usage = getattr(response, "usage", None)
+    if not usage:
+        return None
+    get = usage.get if isinstance(usage, dict) else lambda key: getattr(usage, key, None)
+    details = get("prompt_tokens_details")
+    cached = details.get("cached_tokens") if isinstance(details, dict) else getattr(details, "cached_tokens", None)
+    if cached is None:
+        cached = get("cache_read_input_tokens")
+    if cached is None:
+        # llama.cpp's server adds its own timings, with the number of prompt tokens taken from the cache
+        timings = getattr(response, "timings", None)
+        cached = timings.get("cache_n") if isinstance(timings, dict) else None
+    return cached
+
+
+def _prompt_tokens(response) -> int:
+    usage = getattr(response, "usage", None) or {}
+    value = usage.get("prompt_tokens") if isinstance(usage, dict) else getattr(usage, "prompt_tokens", None)
+    return value or 0
+
+
+def _label(static: list[dict[str, Any]]) -> str:
+    # the last line of dspy's system message is the task instruction, which names the program well enough
+    text = next((m["content"] for m in static if m["role"] == "system" and isinstance(m["content"], str)), "")
+    lines = [line.strip() for line in text.splitlines() if line.strip()]
+    return lines[-1][:48] if lines else "(no system message)"
+
+
+class PrefixTracker:
+    """Which static prefixes the backend holds, and the hit statistics; shared by an LM and its copies."""
+
+    def __init__(self, backend: str, slots: int | None = 4, ttl_s: float | None = None):
+        self.backend = backend
+        self.slots = slots
+        self.ttl_s = ttl_s if ttl_s is not None else _PROVIDER_TTL_S.get(backend)
+        self.min_tokens = _MIN_PREFIX_TOKENS.get(backend, 0)
+        self._lock = threading.Lock()
+        # prefix key -> (slot, last used); most recently used last
+        self._warm: OrderedDict[str, tuple[int, float]] = OrderedDict()
+        self._prefixes: dict[str, dict[str, Any]] = {}
+        self._stats = {"calls": 0, "hits": 0, "response_cache_hits": 0, "prompt_tokens": 0,
+                       "cached_tokens": 0, "reported_calls": 0, "hit_latency_s": 0.0, "miss_latency_s": 0.0}
+
+    def prefix(self, static: list[dict[str, Any]], model: str) -> tuple[str, int]:
+        """Key and token count of a static prefix."""
+        key = hashlib.sha256(orjson.dumps([model, static])).hexdigest()[:24]
+        with self._lock:
+            known = self._prefixes.get(key)
+        if known is None:
+            known = {"label": _label(static), "tokens": message_tokens(static) if static else 0,
+                     "calls": 0, "hits": 0}
+            with self._lock:
+                known = self._prefixes.setdefault(key, known)
+        return key, known["tokens"]
+
+    def claim(self, key: str) -> tuple[int, bool]:
+        """(slot, predicted hit) for a call about to send prefix `key`; marks the prefix as most recently used."""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._warm.get(key)
+            cacheable = self._prefixes[key]["tokens"] >= self.min_tokens
+            hit = cacheable and entry is not None and (self.ttl_s is None or now - entry[1] <= self.ttl_s)
+            if entry is not None:
+                slot = entry[0]
+            elif len(self._warm) < (self.slots or _MAX_TRACKED):
+                slot = len(self._warm)
+            else:
+                # the least recently used prefix loses its slot (and its KV cache) to this one
+                _, (slot, _) = self._warm.popitem(last=False)
+            self._warm[key] = (slot, now)
+            self._warm.move_to_end(key)
+            return slot, hit
+
+    def record(self, key: str, hit: bool, response, latency_s: float, cache_hit: bool = False) -> None:
+        cached = reported_cached_tokens(response)
+        with self._lock:
+            if cache_hit or getattr(response, "cache_hit", False):
+                # answered from the response cache; the backend never saw it
+                self._stats["response_cache_hits"] += 1
+                return
+            self._stats["calls"] += 1
+            self._stats["hits"] += int(hit)
+            self._stats["hit_latency_s" if hit else "miss_latency_s"] += latency_s
+            self._prefixes[key]["calls"] += 1
+            self._prefixes[key]["hits"] += int(hit)
+            if cached is not None:
+                self._stats["reported_calls"] += 1
+                self._stats["cached_tokens"] += cached
+                self._stats["prompt_tokens"] += _prompt_tokens(response)
+
+    def stats(self) -> dict[str, Any]:
+        with self._lock:
+            s = dict(self._stats)
+            prefixes = {key: dict(p) for key, p in self._prefixes.items()}
+        misses = s["calls"] - s["hits"]
+        s["backend"] = self.backend
+        s["prefixes"] = prefixes
+        s["hit_rate"] = s["hits"] / s["calls"] if s["calls"] else 0.0
+        s["reported_hit_rate"] = s["cached_tokens"] / s["prompt_tokens"] if s["prompt_tokens"] else None
+        s["mean_hit_latency_s"] = s["hit_latency_s"] / s["hits"] if s["hits"] else None
+        s["mean_miss_latency_s"] = s["miss_latency_s"] / misses if misses else None
+        return s
+
+
+class PrefixCachingLM(dspy.BaseLM):
+    def __init__(self, lm: dspy.LM, backend: str | None = None, slots: int | None = None, ttl_s: float | None = None,
+                 keep_alive: str | None = "30m", num_ctx: int | None = None, tracker: PrefixTracker | None = None):
+        super().__init__(model=lm.model, model_type=lm.model_type, cache=lm.cache)
+        self.kwargs = lm.kwargs
+        self.lm = lm
+        if hasattr(lm, "num_retries"):
+            # lets ThrottledLM turn off the wrapped LM's own retries through this wrapper
+            self.num_retries = lm.num_retries
+        backend = backend or detect_backend(lm.model)
+        if backend not in BACKENDS:
+            raise ValueError(f"unknown prefix-cache backend {backend!r}; expected one of {BACKENDS}")
+        if slots is None and backend in ("ollama", "llama.cpp"):
+            # one KV cache per parallel sequence of the local server
+            slots = int(os.getenv("OLLAMA_NUM_PARALLEL", "4")) if backend == "ollama" else 4
+        self.keep_alive = keep_alive
+        self.num_ctx = num_ctx
+        self.tracker = tracker or PrefixTracker(backend, slots, ttl_s)
+
+    @property
+    def backend(self) -> str:
+        return self.tracker.backend
+
+    def _prepare(self, messages, kwargs) -> tuple[list[dict[str, Any]] | None, dict[str, Any], str | None]:
+        if messages is None:
+            return messages, kwargs, None
+        messages = order_static_first(messages)
+        boundary = split_static_prefix(messages)
+        static = messages[:boundary]
+        key, tokens = self.tracker.prefix(static, self.model)
+        kwargs = dict(kwargs)
+        if self.backend == "anthropic" and static and tokens >= self.tracker.min_tokens:
+            last = static[-1]
+            content = last["content"]
+            blocks = [{"type": "text", "text": content}] if isinstance(content, str) else [dict(b) for b in content]
+            blocks[-1]["cache_control"] = {"type": "ephemeral"}
+            messages = [*static[:-1], {**last, "content": blocks}, *messages[boundary:]]
+        elif self.backend == "llama.cpp":
+            kwargs["extra_body"] = {**kwargs.get("extra_body", {}), "cache_prompt": True}
+        elif self.backend == "ollama":
+            if self.keep_alive is not None:
+                kwargs.setdefault("keep_alive", self.keep_alive)
+            if self.num_ctx is not None:
+                # a different num_ctx makes Ollama reload the model, and the KV cache with it
+                kwargs.setdefault("num_ctx", self.num_ctx)
+        return messages, kwargs, key
+
+    def _claim(self, key: str, kwargs: dict[str, Any]) -> tuple[dict[str, Any], bool]:
+        """Takes the prefix's slot for a call that will reach the backend; returns its kwargs and the predicted hit."""
+        slot, hit = self.tracker.claim(key)
+        if self.backend == "llama.cpp":
+            # the response cache ignores id_slot, so slot assignment does not change cache keys
+            kwargs = {**kwargs, "extra_body": {**kwargs["extra_body"], "id_slot": slot}}
+        return kwargs, hit
+
+    def _cached_response(self, messages, kwargs, asynchronous: bool = False):
+        """The response cache's answer to this call, looked up with the key ``dspy.LM`` would use, or None."""
+        lm = self.lm
+        if not isinstance(lm, dspy.LM) or not kwargs.get("cache", lm.cache) or lm.model_type not in _COMPLETIONS:
+            return None
+        if lm.use_developer_role and lm.model_type == "responses":
+            messages = [{**m, "role": "developer"} if m.get("role") == "system" else m for m in messages]
+        params = {**lm.kwargs, **{k: v for k, v in kwargs.items() if k != "cache"}}
+        if params.get("rollout_id") is None:
+            params.pop("rollout_id", None)
+        completion = getattr(dspy_lm, ("a" if asynchronous else "") + _COMPLETIONS[lm.model_type])
+        request = dict(model=lm.model, messages=messages, **params,
+                       _fn_identifier=f"{completion.__module__}.{completion.__qualname__}")
+        response = dspy.cache.get(request, ["api_key", "api_base", "base_url"])
+        if response is not None:
+            lm._check_truncation(response)
+        return response
+
+    def forward(self, prompt=None, messages=None, **kwargs):
+        messages, kwargs, key = self._prepare(messages, kwargs)
+        if key is None:
+            return self.lm.forward(prompt=prompt, messages=messages, **kwargs)
+        # a call answered by the response cache never reaches the backend, so it must not move the prefix's slot
+        response = self._cached_response(messages, kwargs)
+        if response is not None:
+            self.tracker.record(key, False, response, 0.0, cache_hit=True)
+            return response
+        kwargs, hit = self._claim(key, kwargs)
+        started = time.perf_counter()
+        response = self.lm.forward(prompt=prompt, messages=messages, **kwargs)
+        self.tracker.record(key, hit, response, time.perf_counter() - started)
+        return response
+
+    async def aforward(self, prompt=None, messages=None, **kwargs):
+        messages, kwargs, key = self._prepare(messages, kwargs)
+        if key is None:
+            return await self.lm.aforward(prompt=prompt, messages=messages, **kwargs)
+        response = self._cached_response(messages, kwargs, asynchronous=True)
+        if response is not None:
+            self.tracker.record(key, False, response, 0.0, cache_hit=True)
+            return response
+        kwargs, hit = self._claim(key, kwargs)
+        started = time.perf_counter()
+        response = await self.lm.aforward(prompt=prompt, messages=messages, **kwargs)
+        self.tracker.record(key, hit, response, time.perf_counter() - started)
+        return response
+
+    def copy(self, **kwargs) -> "PrefixCachingLM":
+        # copies (rollouts, other temperatures) hit the same server, so they share the tracker
+        return PrefixCachingLM(self.lm.copy(**kwargs), keep_alive=self.keep_alive, num_ctx=self.num_ctx,
+                               tracker=self.tracker)
+
+    def __deepcopy__(self, memo):
+        return self.copy()
+
+    def dump_state(self):
+        return self.lm.dump_state()
+
+    def wrapper_config(self) -> dict[str, Any]:
+        """Arguments besides the wrapped LM, to wrap an equal LM elsewhere (distributed workers)."""
+        return {"backend": self.backend, "slots": self.tracker.slots, "ttl_s": self.tracker.ttl_s,
+                "keep_alive": self.keep_alive, "num_ctx": self.num_ctx}
+
+    def stats(self) -> dict[str, Any]:
+        return self.tracker.stats()
+
+    def report(self) -> str:
+        s = self.stats()
+        line = (f"Prefix cache ({s['backend']}): {len(s['prefixes'])} prefixes, {s['hit_rate']:.1%} predicted hits "
+                f"over {s['calls']} LM calls ({s['response_cache_hits']} answered by the response cache)")
+        if s["reported_hit_rate"] is not None:
+            line += f", backend reports {s['reported_hit_rate']:.1%} of prompt tokens cached"
+        if s["mean_hit_latency_s"] is not None and s["mean_miss_latency_s"] is not None:
+            line += f"; mean latency {s['mean_hit_latency_s'] * 1000:.0f} ms on hits vs {s['mean_miss_latency_s'] * 1000:.0f} ms on misses"
+        lines = [line]
+        for prefix in sorted(s["prefixes"].values(), key=lambda p: -p["calls"])[:10]:
+            rate = prefix["hits"] / prefix["calls"] if prefix["calls"] else 0.0
+            lines.append(f"  {prefix['label']:<50}{prefix['tokens']:>7} tokens{prefix['calls']:>7} calls{rate:>8.1%} hits")
+        return "\n".join(lines)
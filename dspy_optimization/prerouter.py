@@ -0,0 +1,166 @@
+"""Local pre-router that answers obvious tickets without calling the LM.
+
+``CascadeTicketRouter`` puts a TF-IDF + softmax-regression classifier (plain numpy) in front of
+an LM router. When the classifier's top probability reaches `threshold` its label is returned
+directly; otherwise the LM router runs, and its answer is logged so the classifier can be
+retrained on real traffic (``retrain()``). A `shadow_rate` fraction of short-circuited tickets
+is also sent to the LM to keep measuring how often the two agree.
+"""
+import math
+import random
+import re
+import threading
+from collections import Counter
+
+import dspy
+import numpy as np
+
+_TOKEN = re.compile(r"[a-z0-9]+")
+
+
+class TfidfClassifier:
+    def __init__(self, max_features: int = 5000, l2: float = 1e-3, learning_rate: float = 1.0, epochs: int = 300,
+                 batch_size: int = 512, seed: int = 0):
+        self.max_features = max_features
+        self.l2 = l2
+        self.learning_rate = learning_rate
+        self.epochs = epochs
+        self.batch_size = batch_size
+        self.seed = seed
+        self.vocabulary: dict[str, int] = {}
+        self.idf = np.zeros(0, dtype=np.float32)
+        self.labels: list[str] = []
+        self.weights = np.zeros((0, 0), dtype=np.float32)
+        self.bias = np.zeros(0, dtype=np.float32)
+
+    @staticmethod
+    def _terms(text: str) -> list[str]:
+        words = _TOKEN.findall(text.lower())
+        return words + [f"{a} {b}" for a, b in zip(words, words[1:])]
+
+    def transform(self, texts: list[str]) -> np.ndarray:
+        matrix = np.zeros((len(texts), len(self.vocabulary)), dtype=np.float32)
+        for row, text in enumerate(texts):
+            for term, count in Counter(self._terms(text)).items():
+                column = self.vocabulary.get(term)
+                if column is not None:
+                    matrix[row, column] = 1.0 + math.log(count)
+        matrix *= self.idf
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        return matrix / np.where(norms == 0, 1.0, norms)
+
+    def fit(self, texts: list[str], labels: list[str]) -> "TfidfClassifier":
+        document_frequency = Counter(term for text in texts for term in set(self._terms(text)))
+        terms = [term for term, _ in document_frequency.most_common(self.max_features)]
+        self.vocabulary = {term: i for i, term in enumerate(terms)}
+        n = len(texts)
+        self.idf = np.asarray([math.log((1 + n) / (1 + document_frequency[t])) + 1 for t in terms], dtype=np.float32)
+        self.labels = sorted(set(labels))
+        targets = np.eye(len(self.labels), dtype=np.float32)[[self.labels.index(label) for label in labels]]
+
+        features = self.transform(texts)
+        self.weights = np.zeros((features.shape[1], len(self.labels)), dtype=np.float32)
+        self.bias = np.zeros(len(self.labels), dtype=np.float32)
+        rng = np.random.default_rng(self.seed)
+        for _ in range(self.epochs):
+            order = rng.permutation(n)
+            for start in range(0, n, self.batch_size):
+                batch = order[start:start + self.batch_size]
+                error = self._softmax(features[batch] @ self.weights + self.bias) - targets[batch]
+                self.weights -= self.learning_rate * (features[batch].T @ error / len(batch) + self.l2 * self.weights)
+                self.bias -= self.learning_rate * error.mean(axis=0)
+        return self
+
+    @staticmethod
+    def _softmax(logits: np.ndarray) -> np.ndarray:
+        exp = np.exp(logits - logits.max(axis=1, keepdims=True))
+        return exp / exp.sum(axis=1, keepdims=True)
+
+    def predict_proba(self, texts: list[str]) -> np.ndarray:
+        return self._softmax(self.transform(texts) @ self.weights + self.bias)
+
+    def predict(self, text: str) -> tuple[str, float]:
+        probabilities = self.predict_proba([text])[0]
+        best = int(probabilities.argmax())
+        return self.labels[best], float(probabilities[best])
+
+    def save(self, path: str) -> None:
+        np.savez(path, weights=self.weights, bias=self.bias, idf=self.idf,
+                 terms=np.asarray(list(self.vocabulary), dtype=object), labels=np.asarray(self.labels, dtype=object))
+
+    @classmethod
+    def load(cls, path: str) -> "TfidfClassifier":
+        stored = np.load(path, allow_pickle=True)
+        classifier = cls()
+        classifier.weights, classifier.bias, classifier.idf = stored["weights"], stored["bias"], stored["idf"]
+        classifier.vocabulary = {term: i for i, term in enumerate(stored["terms"].tolist())}
+        classifier.labels = stored["labels"].tolist()
+        return classifier
+
+
+class CascadeTicketRouter(dspy.Module):
+    def __init__(self, router: dspy.Module, classifier: TfidfClassifier, threshold: float = 0.8,
+                 shadow_rate: float = 0.0, seed: int = 0):
+        super().__init__()
+        self.router = router
+        self.classifier = classifier
+        self.threshold = threshold
+        self.shadow_rate = shadow_rate
+        self.logged: list[tuple[str, str]] = []
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self._stats = {"calls": 0, "short_circuited": 0, "lm_calls": 0,
+                       "fallback_agreed": 0, "shadow_calls": 0, "shadow_agreed": 0}
+
+    @classmethod
+    def train(cls, router: dspy.Module, trainset: list[dspy.Example], **kwargs) -> "CascadeTicketRouter":
+        classifier = TfidfClassifier().fit([ex.ticket_text for ex in trainset], [ex.team for ex in trainset])
+        return cls(router, classifier, **kwargs)
+
+    def _record(self, ticket_text: str, lm_team: str, local_team: str, shadow: bool):
+        agreed = int(lm_team.strip().lower() == local_team.lower())
+        with self._lock:
+            self._stats["lm_calls"] += 1
+            self._stats["shadow_agreed" if shadow else "fallback_agreed"] += agreed
+            self._stats["shadow_calls"] += int(shadow)
+            self.logged.append((ticket_text, lm_team.strip()))
+
+    def forward(self, ticket_text):
+        team, confidence = self.classifier.predict(ticket_text)
+        with self._lock:
+            self._stats["calls"] += 1
+            confident = confidence >= self.threshold
+            shadow = confident and self._rng.random() < self.shadow_rate
+            if confident:
+                self._stats["short_circuited"] += 1
+
+        if confident and not shadow:
+            return dspy.Prediction(team=team, reasoning=f"Local pre-router ({confidence:.0%} confident).",
+                                   routed_by="prerouter", confidence=confidence)
+
+        prediction = self.router(ticket_text=ticket_text)
+        self._record(ticket_text, prediction.team, team, shadow)
+        if shadow:
+            # answer stays the local one; the LM call only measures agreement
+            return dspy.Prediction(team=team, reasoning=f"Local pre-router ({confidence:.0%} confident).",
+                                   routed_by="prerouter", confidence=confidence)
+        prediction.routed_by = "lm"
+        return prediction
+
+    def retrain(self, trainset: list[dspy.Example]) -> None:
+        """Refit the classifier on `trainset` plus every ticket the LM has labelled so far."""
+        with self._lock:
+            logged = list(self.logged)
+        texts = [ex.ticket_text for ex in trainset] + [text for text, _ in logged]
+        labels = [ex.team for ex in trainset] + [team for _, team in logged]
+        self.classifier = TfidfClassifier().fit(texts, labels)
+
+    def stats(self) -> dict[str, float]:
+        with self._lock:
+            s = dict(self._stats)
+        s["short_circuit_rate"] = s["short_circuited"] / s["calls"] if s["calls"] else 0.0
+        fallbacks = s["lm_calls"] - s["shadow_calls"]
+        # shadow agreement estimates how often short-circuited answers match what the LM would have said
+        s["shadow_agreement"] = s["shadow_agreed"] / s["shadow_calls"] if s["shadow_calls"] else None
+        s["fallback_agreement"] = s["fallback_agreed"] / fallbacks if fallbacks else None
+        return s
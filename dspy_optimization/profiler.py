@@ -0,0 +1,286 @@
+"""Per-call latency, token and cache profile of every module call, to find the slow stage of a pipeline.
+
+``CallProfiler`` is a dspy callback. For each module call (``Predict``, ``ChainOfThought`` and the
+programs around them) it records a ``CallRecord``:
+
+* the module path, e.g. ``BusinessAnalysisPipeline.generate_strategy.predict``;
+* total time, split into prompt formatting, queueing, network and parsing. Queueing is the time
+  spent waiting for admission or backing off in ``ThrottledLM``, reported via ``note_queue_wait``;
+* prompt and completion tokens, and how many of its LM calls were cache hits.
+
+Records go into a fixed-size ring buffer that writers fill without taking a lock, so the
+profiler can stay installed under load. ``summary()`` gives latency percentiles per path, and
+for the slowest calls (the tail) which stage their time went to. ``histogram()`` buckets any
+stage. ``write_flamegraph()`` writes collapsed stacks (``path;stage microseconds``) for
+flamegraph.pl or speedscope.
+
+    profiler = install_profiler()
+    pipeline(**inputs)
+    print(profiler.report())
+    profiler.write_flamegraph("dspy/business_pipeline.folded")
+"""
+import itertools
+import math
+import threading
+import time
+from collections import defaultdict
+from contextvars import ContextVar
+from typing import Any, NamedTuple
+
+import dspy
+from dspy.utils.callback import BaseCallback
+
+STAGES = ("format", "queue", "network", "parse", "other")
+# histogram upper bounds: 1 ms doubling up to ~65 s
+HISTOGRAM_BOUNDS = tuple(0.001 * 2 ** k for k in range(17))
+
+# (call_id, path, root name, {id(submodule): relative path}) of the module calls open in this context
+_module_stack: ContextVar[tuple] = ContextVar("dspy_optimization_module_stack", default=())
+_lm_call: ContextVar[dict[str, float] | None] = ContextVar("dspy_optimization_lm_call", default=None)
+
+
+def note_queue_wait(seconds: float) -> None:
+    """Attribute `seconds` of the current LM call to queueing rather than the network (no-op when not profiled)."""
+    state = _lm_call.get()
+    if state is not None:
+        state["queue"] += seconds
+
+
+class CallRecord(NamedTuple):
+    path: str
+    leaf: bool
+    started: float
+    total_s: float
+    format_s: float
+    queue_s: float
+    network_s: float
+    parse_s: float
+    lm_calls: int
+    cache_hits: int
+    prompt_tokens: int
+    completion_tokens: int
+    error: str | None
+
+    @property
+    def other_s(self) -> float:
+        return max(0.0, self.total_s - self.format_s - self.queue_s - self.network_s - self.parse_s)
+
+    def stage(self, name: str) -> float:
+        return self.total_s if name == "total" else getattr(self, f"{name}_s")
+
+
+class RingBuffer:
+    """The latest `capacity` items. Appending is one step of an ``itertools.count`` and one list store,
+    both atomic under the GIL, so concurrent writers need no lock."""
+
+    def __init__(self, capacity: int = 10_000):
+        self.capacity = capacity
+        self._slots: list[tuple[int, Any] | None] = [None] * capacity
+        self._cursor = itertools.count()
+
+    def append(self, item: Any) -> None:
+        seq = next(self._cursor)
+        self._slots[seq % self.capacity] = (seq, item)
+
+    def snapshot(self) -> list[Any]:
+        return [item for _, item in sorted(slot for slot in list(self._slots) if slot is not None)]
+
+    def written(self) -> int:
+        return max((slot[0] + 1 for slot in list(self._slots) if slot is not None), default=0)
+
+
+def _percentile(values: list[float], q: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[max(0, min(len(ordered) - 1, math.ceil(q / 100 * len(ordered)) - 1))]
+
+
+class CallProfiler(BaseCallback):
+    def __init__(self, capacity: int = 10_000):
+        self.buffer = RingBuffer(capacity)
+        self._open: dict[str, dict[str, Any]] = {}
+        self._marks: dict[str, tuple] = {}
+        self._names: dict[int, tuple[Any, dict[int, str]]] = {}
+        self._rollup_lock = threading.Lock()
+
+    # path resolution
+
+    def _sub_paths(self, root) -> dict[int, str]:
+        cached = self._names.get(id(root))
+        if cached is None or cached[0] is not root:
+            if len(self._names) > 256:
+                # optimizers deep-copy programs all the time; do not keep every copy alive
+                self._names.clear()
+            names = {id(module): name.removeprefix("self.") for name, module in root.named_sub_modules() if name != "self"}
+            cached = self._names[id(root)] = (root, names)
+        return cached[1]
+
+    def _path(self, instance, stack: tuple) -> tuple[str, str, dict[int, str]]:
+        if not stack:
+            root = type(instance).__name__
+            return root, root, self._sub_paths(instance) if hasattr(instance, "named_sub_modules") else {}
+        _, parent_path, root, names = stack[-1]
+        relative = names.get(id(instance))
+        return (f"{root}.{relative}" if relative else f"{parent_path}.{type(instance).__name__}"), root, names
+
+    def _innermost(self) -> dict[str, Any] | None:
+        stack = _module_stack.get()
+        return self._open.get(stack[-1][0]) if stack else None
+
+    # module calls
+
+    def on_module_start(self, call_id, instance, inputs):
+        stack = _module_stack.get()
+        path, root, names = self._path(instance, stack)
+        self._open[call_id] = {
+            "path": path, "leaf": isinstance(instance, dspy.Predict), "parent": stack, "start": time.perf_counter(),
+            "format": 0.0, "queue": 0.0, "network": 0.0, "parse": 0.0,
+            "lm_calls": 0, "cache_hits": 0, "prompt_tokens": 0, "completion_tokens": 0,
+        }
+        _module_stack.set((*stack, (call_id, path, root, names)))
+
+    def on_module_end(self, call_id, outputs, exception=None):
+        state = self._open.pop(call_id, None)
+        if state is None:
+            return
+        _module_stack.set(state["parent"])
+        parent = self._open.get(state["parent"][-1][0]) if state["parent"] else None
+        if parent is not None:
+            # LM calls and tokens count for every enclosing module; branches may finish on different threads
+            with self._rollup_lock:
+                for key in ("lm_calls", "cache_hits", "prompt_tokens", "completion_tokens"):
+                    parent[key] += state[key]
+        self.buffer.append(CallRecord(
+            state["path"], state["leaf"], state["start"], time.perf_counter() - state["start"],
+            state["format"], state["queue"], state["network"], state["parse"],
+            state["lm_calls"], state["cache_hits"], state["prompt_tokens"], state["completion_tokens"],
+            type(exception).__name__ if exception is not None else None,
+        ))
+
+    # stages within a module call
+
+    def _start_stage(self, call_id):
+        state = self._innermost()
+        if state is not None:
+            self._marks[call_id] = (state, time.perf_counter())
+
+    def _end_stage(self, call_id, stage: str):
+        mark = self._marks.pop(call_id, None)
+        if mark is not None:
+            state, started = mark
+            state[stage] += time.perf_counter() - started
+
+    def on_adapter_format_start(self, call_id, instance, inputs):
+        self._start_stage(call_id)
+
+    def on_adapter_format_end(self, call_id, outputs, exception=None):
+        self._end_stage(call_id, "format")
+
+    def on_adapter_parse_start(self, call_id, instance, inputs):
+        self._start_stage(call_id)
+
+    def on_adapter_parse_end(self, call_id, outputs, exception=None):
+        self._end_stage(call_id, "parse")
+
+    def on_lm_start(self, call_id, instance, inputs):
+        state = self._innermost()
+        if state is None:
+            return
+        lm_state = {"queue": 0.0}
+        _lm_call.set(lm_state)
+        self._marks[call_id] = (state, time.perf_counter(), lm_state, inputs.get("messages"), instance)
+
+    def on_lm_end(self, call_id, outputs, exception=None):
+        mark = self._marks.pop(call_id, None)
+        if mark is None:
+            return
+        _lm_call.set(None)
+        state, started, lm_state, messages, lm = mark
+        elapsed = time.perf_counter() - started
+        state["queue"] += lm_state["queue"]
+        state["network"] += max(0.0, elapsed - lm_state["queue"])
+        state["lm_calls"] += 1
+        # the history entry of this call is the one holding the very messages list it was given
+        for entry in reversed(getattr(lm, "history", [])[-64:]):
+            if messages is not None and entry.get("messages") is messages:
+                usage = entry.get("usage") or {}
+                state["prompt_tokens"] += usage.get("prompt_tokens") or 0
+                state["completion_tokens"] += usage.get("completion_tokens") or 0
+                state["cache_hits"] += int(bool(getattr(entry.get("response"), "cache_hit", False)))
+                break
+
+    # reports
+
+    def records(self) -> list[CallRecord]:
+        return self.buffer.snapshot()
+
+    def summary(self, tail_quantile: float = 95) -> dict[str, dict[str, Any]]:
+        """Per module path: latency percentiles, mean stage times, and where the time of calls above `tail_quantile` went."""
+        by_path: dict[str, list[CallRecord]] = defaultdict(list)
+        for record in self.records():
+            by_path[record.path].append(record)
+        summary = {}
+        for path, records in sorted(by_path.items()):
+            totals = [r.total_s for r in records]
+            cutoff = _percentile(totals, tail_quantile)
+            tail = [r for r in records if r.total_s >= cutoff]
+            tail_stages = {stage: sum(r.stage(stage) for r in tail) / len(tail) for stage in STAGES}
+            lm_calls = sum(r.lm_calls for r in records)
+            summary[path] = {
+                "calls": len(records),
+                "errors": sum(r.error is not None for r in records),
+                "p50_s": _percentile(totals, 50),
+                "p95_s": _percentile(totals, 95),
+                "p99_s": _percentile(totals, 99),
+                "mean_stage_s": {stage: sum(r.stage(stage) for r in records) / len(records) for stage in STAGES},
+                "tail_stage_s": tail_stages,
+                "tail_culprit": max(tail_stages, key=tail_stages.get) if records[0].leaf else None,
+                "lm_calls": lm_calls,
+                "cache_hit_rate": sum(r.cache_hits for r in records) / lm_calls if lm_calls else 0.0,
+                "prompt_tokens": sum(r.prompt_tokens for r in records),
+                "completion_tokens": sum(r.completion_tokens for r in records),
+            }
+        return summary
+
+    def histogram(self, path: str, stage: str = "total") -> list[tuple[float, int]]:
+        """(upper bound in seconds, count) per bucket of `stage` for calls of `path`; the last bound is inf."""
+        counts = [0] * (len(HISTOGRAM_BOUNDS) + 1)
+        for record in self.records():
+            if record.path == path:
+                value = record.stage(stage)
+                counts[next((i for i, bound in enumerate(HISTOGRAM_BOUNDS) if value <= bound), len(HISTOGRAM_BOUNDS))] += 1
+        return list(zip([*HISTOGRAM_BOUNDS, math.inf], counts))
+
+    def collapsed_stacks(self) -> list[str]:
+        """``Root;sub;predict;stage microseconds`` lines, summed over the buffered calls of every predictor."""
+        totals: dict[str, float] = defaultdict(float)
+        for record in self.records():
+            if record.leaf:
+                frames = record.path.replace(".", ";")
+                for stage in STAGES:
+                    totals[f"{frames};{stage}"] += record.stage(stage)
+        return [f"{stack} {round(seconds * 1e6)}" for stack, seconds in sorted(totals.items()) if seconds > 0]
+
+    def write_flamegraph(self, path: str) -> None:
+        with open(path, "w", encoding="utf-8") as f:
+            f.write("\n".join(self.collapsed_stacks()) + "\n")
+
+    def report(self) -> str:
+        header = (f"{'module':<52}{'calls':>7}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}"
+                  f"{'cache':>7}{'tokens in/out':>16}  tail (p95+) mostly")
+        lines = [header]
+        for path, s in self.summary().items():
+            culprit = s["tail_culprit"]
+            tail = f"{culprit} ({s['tail_stage_s'][culprit] * 1000:.0f} ms)" if culprit else ""
+            lines.append(f"{path[-51:]:<52}{s['calls']:>7}{s['p50_s'] * 1000:>9.0f}{s['p95_s'] * 1000:>9.0f}"
+                         f"{s['p99_s'] * 1000:>9.0f}{s['cache_hit_rate']:>7.0%}"
+                         f"{s['prompt_tokens']:>9}/{s['completion_tokens']:<6}  {tail}")
+        return "\n".join(lines)
+
+
+def install_profiler(capacity: int = 10_000) -> CallProfiler:
+    """Add a ``CallProfiler`` to the configured dspy callbacks and return it."""
+    profiler = CallProfiler(capacity)
+    dspy.settings.configure(callbacks=[*dspy.settings.callbacks, profiler])
+    return profiler
@@ -0,0 +1,231 @@
+"""Where the prompt tokens go, and how to spend fewer of them without losing accuracy.
+
+``profile_prompt`` renders one predictor's prompt with an adapter and attributes its tokens to
+the instructions, the field descriptions, the demos, the serialized inputs and the adapter's
+own structure (field headers, type hints, the ``Literal`` options of ``NPSTopic``, JSON
+schemas). It does so by re-rendering with each part removed, so the numbers match what the
+adapter really sends. ``profile_program`` does this for every predictor of a program, with the
+inputs each one actually received in one traced run, for ChatAdapter and JSONAdapter.
+
+``PromptCompactor`` then tries compaction steps one at a time (compact serialization of
+upstream predictions, dropping field descriptions, trimming demos) and keeps a step only if it
+lowers the tokens per call while the metric stays within `tolerance` of the baseline.
+
+    python -m dspy_optimization.prompt_budget business_pipeline          # offline, against the mock LM
+
+    report = PromptCompactor(metric, devset).run(program)
+    compacted = report["program"]
+"""
+import argparse
+import json
+import threading
+from typing import Any, Callable
+
+import dspy
+from dspy.utils.callback import BaseCallback
+
+from dspy_optimization.mock_lm import count_tokens as _approx_tokens
+
+SECTIONS = ("instructions", "field_descriptions", "demos", "inputs", "structure")
+
+_encoding = None
+
+
+def count_tokens(text: str) -> int:
+    """Tokens under the GPT-4o encoding when tiktoken is available, else ~4 characters per token."""
+    global _encoding
+    if _encoding is None:
+        try:
+            import tiktoken
+
+            _encoding = tiktoken.get_encoding("o200k_base")
+        except Exception:
+            _encoding = False
+    return len(_encoding.encode(text)) if _encoding else _approx_tokens(text)
+
+
+def message_tokens(messages: list[dict[str, Any]]) -> int:
+    return sum(count_tokens(m["content"] if isinstance(m["content"], str) else json.dumps(m["content"])) for m in messages)
+
+
+def _without_descriptions(signature):
+    for name in list(signature.fields):
+        # dspy treats a desc of "${name}" as "no description" and leaves it out of the prompt
+        signature = signature.with_updated_fields(name, desc=f"${{{name}}}")
+    return signature
+
+
+def profile_prompt(signature, demos: list, inputs: dict[str, Any], adapter=None) -> dict[str, int]:
+    """Prompt tokens of one call, split into ``SECTIONS`` plus the ``total``."""
+    adapter = adapter or dspy.ChatAdapter()
+
+    def tokens(sig, demo_list, values):
+        return message_tokens(adapter.format(sig, demo_list, values))
+
+    total = tokens(signature, demos, inputs)
+    no_demos = tokens(signature, [], inputs)
+    profile = {
+        "demos": total - no_demos,
+        "instructions": no_demos - tokens(signature.with_instructions(""), [], inputs),
+        "field_descriptions": no_demos - tokens(_without_descriptions(signature), [], inputs),
+        "inputs": no_demos - tokens(signature, [], {name: "" for name in inputs}),
+    }
+    profile["structure"] = total - sum(profile.values())
+    profile["total"] = total
+    return profile
+
+
+def trace_inputs(program: dspy.Module, **inputs) -> list[tuple[str, Any, dict[str, Any]]]:
+    """Run `program` once and return (predictor name, predictor, inputs) for every predictor call."""
+    names = {id(predictor): name for name, predictor in program.named_predictors()}
+    with dspy.context(trace=[]):
+        program(**inputs)
+        trace = list(dspy.settings.trace)
+    return [(names.get(id(predictor), type(predictor).__name__), predictor, call_inputs)
+            for predictor, call_inputs, _ in trace]
+
+
+def profile_program(program: dspy.Module, adapters: dict[str, Any] | None = None, **inputs) -> dict[str, dict[str, dict[str, int]]]:
+    """``{predictor: {adapter: profile}}`` for one traced run of `program` on `inputs`."""
+    adapters = adapters or {"chat": dspy.ChatAdapter(), "json": dspy.JSONAdapter()}
+    report = {}
+    for name, predictor, call_inputs in trace_inputs(program, **inputs):
+        report[name] = {
+            adapter_name: profile_prompt(predictor.signature, predictor.demos, call_inputs, adapter)
+            for adapter_name, adapter in adapters.items()
+        }
+    return report
+
+
+def format_profile(report: dict[str, dict[str, dict[str, int]]]) -> str:
+    header = f"{'predictor':<28}{'adapter':<8}" + "".join(f"{s:>20}" for s in SECTIONS) + f"{'total':>8}"
+    lines = [header]
+    for name, by_adapter in report.items():
+        for adapter_name, profile in by_adapter.items():
+            total = profile["total"] or 1
+            cells = "".join(f"{profile[s]:>12} ({profile[s] / total:>4.0%})" for s in SECTIONS)
+            lines.append(f"{name[:27]:<28}{adapter_name:<8}{cells}{profile['total']:>8}")
+    return "\n".join(lines)
+
+
+class PromptTokenCounter(BaseCallback):
+    """Counts the prompt tokens of every adapter-formatted call, cache hits included."""
+
+    def __init__(self):
+        self.calls = 0
+        self.tokens = 0
+        self._lock = threading.Lock()
+
+    def on_adapter_format_end(self, call_id, outputs, exception=None):
+        if outputs:
+            tokens = message_tokens(outputs)
+            with self._lock:
+                self.calls += 1
+                self.tokens += tokens
+
+    @property
+    def tokens_per_call(self) -> float:
+        return self.tokens / self.calls if self.calls else 0.0
+
+
+def compact_inputs(program: dspy.Module) -> dspy.Module:
+    """Pass upstream predictions downstream as compact JSON (programs exposing ``compact_inputs``)."""
+    program.compact_inputs = True
+    return program
+
+
+def drop_field_descriptions(predictor_name: str) -> Callable[[dspy.Module], dspy.Module]:
+    def step(program):
+        predictor = dict(program.named_predictors())[predictor_name]
+        predictor.signature = _without_descriptions(predictor.signature)
+        return program
+    return step
+
+
+def trim_demos(predictor_name: str, max_demos: int) -> Callable[[dspy.Module], dspy.Module]:
+    def step(program):
+        predictor = dict(program.named_predictors())[predictor_name]
+        predictor.demos = predictor.demos[:max_demos]
+        return program
+    return step
+
+
+def default_steps(program: dspy.Module) -> dict[str, Callable[[dspy.Module], dspy.Module]]:
+    steps = {}
+    if hasattr(program, "compact_inputs") and not program.compact_inputs:
+        steps["compact upstream predictions"] = compact_inputs
+    for name, predictor in program.named_predictors():
+        steps[f"{name}: drop field descriptions"] = drop_field_descriptions(name)
+        if len(predictor.demos) > 1:
+            steps[f"{name}: keep {len(predictor.demos) // 2} demos"] = trim_demos(name, len(predictor.demos) // 2)
+    return steps
+
+
+class PromptCompactor:
+    def __init__(self, metric: Callable, devset: list[dspy.Example], tolerance: float = 0.0, num_threads: int = 4):
+        self.metric = metric
+        self.devset = devset
+        self.tolerance = tolerance
+        self.num_threads = num_threads
+
+    def measure(self, program: dspy.Module) -> tuple[float, float]:
+        """(metric score, prompt tokens per LM call) over the devset."""
+        counter = PromptTokenCounter()
+        evaluate = dspy.Evaluate(devset=self.devset, metric=self.metric, num_threads=self.num_threads, display_progress=False)
+        with dspy.context(callbacks=[*dspy.settings.callbacks, counter]):
+            result = evaluate(program)
+        return float(result.score), counter.tokens_per_call
+
+    def run(self, program: dspy.Module, steps: dict[str, Callable[[dspy.Module], dspy.Module]] | None = None) -> dict[str, Any]:
+        """Apply each step greedily; a step is kept only if tokens drop and the score stays within `tolerance`."""
+        steps = steps if steps is not None else default_steps(program)
+        baseline_score, baseline_tokens = self.measure(program)
+        current, current_tokens = program, baseline_tokens
+        history = []
+        for name, step in steps.items():
+            candidate = step(current.deepcopy())
+            score, tokens = self.measure(candidate)
+            accepted = tokens < current_tokens and score >= baseline_score - self.tolerance
+            history.append({"step": name, "score": score, "tokens_per_call": round(tokens, 1), "accepted": accepted})
+            if accepted:
+                current, current_tokens = candidate, tokens
+        return {
+            "program": current,
+            "baseline": {"score": baseline_score, "tokens_per_call": round(baseline_tokens, 1)},
+            "compacted": {"tokens_per_call": round(current_tokens, 1),
+                          "saved": round(1 - current_tokens / baseline_tokens, 3) if baseline_tokens else 0.0},
+            "steps": history,
+        }
+
+
+def main():
+    from dspy_optimization.loadtest import PROGRAMS
+    from dspy_optimization.mock_lm import MockLMServer
+
+    parser = argparse.ArgumentParser(description="Attribute each predictor's prompt tokens to its parts, per adapter.")
+    parser.add_argument("program", choices=sorted(PROGRAMS))
+    parser.add_argument("--load", help="saved program state (demos and instructions) to profile")
+    parser.add_argument("--api-base", help="real endpoint for the traced run; a local mock LM is used when omitted")
+    parser.add_argument("--model", default="openai/mock-lm")
+    parser.add_argument("--compact-inputs", action="store_true", help="profile with compact upstream predictions")
+    args = parser.parse_args()
+
+    make_program, make_adapter, make_inputs = PROGRAMS[args.program]
+    program = make_program()
+    if args.load:
+        program.load(args.load)
+    if args.compact_inputs:
+        compact_inputs(program)
+
+    mock = MockLMServer(port=0).start() if args.api_base is None else None
+    try:
+        dspy.settings.configure(lm=dspy.LM(args.model, api_base=args.api_base or mock.url, api_key="mock", cache=False),
+                                adapter=make_adapter())
+        print(format_profile(profile_program(program, **make_inputs()[0])))
+    finally:
+        if mock:
+            mock.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,185 @@
+"""Racing evaluation for optimizer trials.
+
+Most MIPROv2 trials lose by a wide margin, yet each one is scored on the whole (mini)batch.
+``RacingEvaluate`` scores a candidate on growing slices of the devset and stops as soon as it
+can no longer beat the best score seen so far on the same examples:
+
+* exactly, when even a perfect score on the remaining examples would not catch up, or
+* statistically, when the Hoeffding upper confidence bound of its running mean falls below
+  the incumbent. The test runs after every rung but the last, each at `delta` divided by the
+  number of tests, so by a union bound the probability of wrongly dropping a candidate whose
+  score on the whole devset beats the incumbent is at most `delta` per evaluation.
+
+Incumbents are kept per set of examples, so only evaluations of a devset some earlier program
+was fully scored on are raced. In MIPROv2 that is the full-valset evaluations; its random
+minibatches are never compared with scores from other minibatches and always run in full, so
+the per-candidate minibatch averages that decide what gets a full evaluation are unchanged. A
+stopped evaluation reports the mean of the examples it ran, which is always below the
+incumbent, so it cannot replace the best program.
+
+``RacingMIPROv2`` is ``dspy.MIPROv2`` with every evaluation it runs going through ``RacingEvaluate``.
+Given a ``CheckpointStore`` it also replays stored per-example scores and bootstrapped demos, and
+given a ``DistributedExecutor`` it scores rungs and bootstraps demos on worker processes.
+"""
+import math
+import random
+import threading
+from contextlib import ExitStack, contextmanager
+
+import dspy
+from dspy.evaluate import Evaluate
+from dspy.evaluate.evaluate import EvaluationResult
+from dspy.teleprompt import mipro_optimizer_v2
+
+from dspy_optimization.checkpoint import (CheckpointedEvaluate, CheckpointStore, checkpointed_bootstrapping, content_key,
+                                          example_key)
+from dspy_optimization.distributed import DistributedEvaluate, DistributedExecutor, distributed_bootstrapping
+
+
+class RacingEvaluate(Evaluate):
+    def __init__(
+        self,
+        *,
+        delta: float = 0.05,
+        eta: int = 2,
+        min_rung_size: int = 8,
+        seed: int = 0,
+        stats: dict[str, int] | None = None,
+        incumbents: dict[str, float] | None = None,
+        **kwargs,
+    ):
+        """
+        Args:
+            delta: Allowed probability, per evaluation, of dropping a candidate that would have won.
+            eta: Growth factor between rungs; the first rung is 1/eta^k of the devset.
+            min_rung_size: Smallest slice a candidate is scored on before it can be dropped.
+            seed: Seed for shuffling the devset before slicing.
+            stats: Shared counters, so several evaluators can report one total.
+            incumbents: Best completed score (0-1) per set of examples, shared the same way.
+        """
+        super().__init__(**kwargs)
+        self.delta = delta
+        self.eta = eta
+        self.min_rung_size = min_rung_size
+        self.rng = random.Random(seed)
+        self.stats = stats if stats is not None else {"calls": 0, "pruned": 0, "examples_scored": 0, "examples_skipped": 0}
+        self.incumbents = incumbents if incumbents is not None else {}
+        self._lock = threading.Lock()
+
+    def _rungs(self, n: int) -> list[int]:
+        sizes = [n]
+        while sizes[-1] // self.eta >= self.min_rung_size:
+            sizes.append(sizes[-1] // self.eta)
+        return sorted(sizes)
+
+    def _dominated(self, total: float, seen: int, n: int, incumbent: float, delta: float) -> bool:
+        if (total + (n - seen)) / n < incumbent:
+            return True
+        bound = math.sqrt(math.log(1 / delta) / (2 * seen))
+        return total / seen + bound < incumbent
+
+    def __call__(self, program, metric=None, devset=None, **kwargs):
+        devset = list(devset if devset is not None else self.devset)
+        n = len(devset)
+        # a score only says something about a candidate compared with the incumbent's on the same examples
+        devset_key = content_key(sorted(example_key(example) for example in devset))
+        with self._lock:
+            incumbent = self.incumbents.get(devset_key)
+            self.stats["calls"] += 1
+        if incumbent is None or n < 2 * self.min_rung_size:
+            result = super().__call__(program, metric=metric, devset=devset, **kwargs)
+            self._record(devset_key, n, n, result.results)
+            return result
+
+        order = self.rng.sample(devset, n)
+        rungs = self._rungs(n)
+        # union bound over the tests after each rung but the last
+        delta = self.delta / max(1, len(rungs) - 1)
+        results, seen = [], 0
+        for size in rungs:
+            chunk = super().__call__(program, metric=metric, devset=order[seen:size], **kwargs)
+            results.extend(chunk.results)
+            seen = size
+            total = sum(float(score) for _, _, score in results)
+            if seen < n and self._dominated(total, seen, n, incumbent, delta):
+                with self._lock:
+                    self.stats["pruned"] += 1
+                break
+
+        self._record(devset_key, seen, n, results)
+        score = round(100 * sum(float(score) for _, _, score in results) / seen, 2)
+        return EvaluationResult(score=score, results=results)
+
+    def _record(self, devset_key: str, seen: int, n: int, results) -> None:
+        with self._lock:
+            self.stats["examples_scored"] += seen
+            self.stats["examples_skipped"] += n - seen
+            if seen == n and n:
+                mean = sum(float(score) for _, _, score in results) / n
+                self.incumbents[devset_key] = max(mean, self.incumbents.get(devset_key, float("-inf")))
+
+
+class CheckpointedRacingEvaluate(RacingEvaluate, CheckpointedEvaluate):
+    """Racing where each rung only runs the examples the store has no score for."""
+
+
+class DistributedRacingEvaluate(RacingEvaluate, DistributedEvaluate):
+    """Racing where each rung is scored on the executor's workers."""
+
+
+class CheckpointedDistributedRacingEvaluate(RacingEvaluate, CheckpointedEvaluate, DistributedEvaluate):
+    """Racing where each rung sends only the examples the store has no score for to the workers."""
+
+
+class RacingMIPROv2(dspy.MIPROv2):
+    """``dspy.MIPROv2`` whose trial evaluations race against the best program found so far."""
+
+    def __init__(self, *args, delta: float = 0.05, eta: int = 2, min_rung_size: int = 8,
+                 checkpoint: CheckpointStore | None = None, executor: DistributedExecutor | None = None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.checkpoint = checkpoint
+        self.executor = executor
+        self.racing_kwargs = {"delta": delta, "eta": eta, "min_rung_size": min_rung_size}
+        self.racing_stats = {"calls": 0, "pruned": 0, "examples_scored": 0, "examples_skipped": 0}
+
+    @contextmanager
+    def _racing(self):
+        incumbents = {}
+
+        def make_evaluate(**kwargs):
+            if self.checkpoint is not None:
+                kwargs["store"] = self.checkpoint
+            if self.executor is not None:
+                kwargs["executor"] = self.executor
+            evaluate_cls = {
+                (False, False): RacingEvaluate,
+                (True, False): CheckpointedRacingEvaluate,
+                (False, True): DistributedRacingEvaluate,
+                (True, True): CheckpointedDistributedRacingEvaluate,
+            }[(self.checkpoint is not None, self.executor is not None)]
+            return evaluate_cls(stats=self.racing_stats, incumbents=incumbents, seed=self.seed,
+                                **self.racing_kwargs, **kwargs)
+
+        # MIPROv2 builds its Evaluate inside compile(), so swap the name it looks up for the duration of the run
+        original = mipro_optimizer_v2.Evaluate
+        mipro_optimizer_v2.Evaluate = make_evaluate
+        try:
+            yield
+        finally:
+            mipro_optimizer_v2.Evaluate = original
+
+    def compile(self, student, **kwargs):
+        with ExitStack() as stack:
+            stack.enter_context(self._racing())
+            if self.executor is not None:
+                stack.enter_context(distributed_bootstrapping(self.executor, store=self.checkpoint))
+            elif self.checkpoint is not None:
+                stack.enter_context(checkpointed_bootstrapping(self.checkpoint))
+            return super().compile(student, **kwargs)
+
+    def report(self) -> str:
+        s = self.racing_stats
+        total = s["examples_scored"] + s["examples_skipped"]
+        saved = s["examples_skipped"] / total if total else 0.0
+        return (f"Racing: {s['pruned']}/{s['calls']} evaluations stopped early, "
+                f"{s['examples_skipped']} of {total} example scores skipped ({saved:.0%})")
@@ -0,0 +1,394 @@
+"""Client-side admission control and retries for ``dspy.LM`` traffic.
+
+With many optimizer threads against one deployment, 429s and timeouts trigger per-thread
+retries that pile on top of the overload. ``ThrottledLM`` routes every call of a wrapped LM
+through the ``AdaptiveLimiter`` of its deployment (model + endpoint), which
+
+* admits requests through a token bucket (`max_rps`, `burst`) and a concurrency limit;
+* adapts both AIMD-style: additive increase on fast successes, multiplicative decrease on
+  429s, timeouts and (optionally) latency above `latency_target_s`;
+* retries transient failures itself with full-jitter exponential backoff (or the server's
+  ``Retry-After``), but only while the retry budget (a fraction of first attempts) lasts, and
+  turns off the wrapped LM's own retries so they do not multiply;
+* serves waiting callers by priority, so interactive (``SERVING``) calls overtake queued
+  ``OPTIMIZER`` calls on the same deployment;
+* hands back the token of a call answered from the LM response cache, which never reached the
+  deployment, and leaves it out of the AIMD adaptation.
+
+    scheduler = LMScheduler(max_rps=10, max_concurrency=16)
+    llm = scheduler.wrap(dspy.LM(...), priority=OPTIMIZER)
+    serving_llm = scheduler.wrap(llm.lm, priority=SERVING)   # same deployment, same limiter
+    with scheduler.watch(interval_s=10):                     # prints live queue depth
+        optimizer.compile(...)
+"""
+import asyncio
+import heapq
+import itertools
+import os
+import random
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any
+
+import dspy
+
+from dspy_optimization.profiler import note_queue_wait
+
+SERVING = 0
+OPTIMIZER = 1
+PRIORITY_NAMES = {SERVING: "serving", OPTIMIZER: "optimizer"}
+
+_RETRYABLE_STATUS = {408, 409, 500, 502, 503, 504}
+
+
+def classify_error(error: Exception) -> str:
+    """"throttled" (429), "transient" (timeouts, 5xx, connection errors) or "fatal"."""
+    status = getattr(error, "status_code", None)
+    if status == 429 or type(error).__name__ == "RateLimitError":
+        return "throttled"
+    if status in _RETRYABLE_STATUS or isinstance(error, (TimeoutError, ConnectionError)):
+        return "transient"
+    if type(error).__name__ in ("Timeout", "APIConnectionError", "ServiceUnavailableError", "InternalServerError"):
+        return "transient"
+    return "fatal"
+
+
+def retry_after(error: Exception) -> float | None:
+    """Seconds requested by the server's ``Retry-After`` header, if the error carries one."""
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None) or {}
+    try:
+        return float(headers.get("retry-after") or headers.get("Retry-After"))
+    except (TypeError, ValueError):
+        return None
+
+
+class AdaptiveLimiter:
+    """Token bucket + concurrency limit for one deployment, adapted with AIMD."""
+
+    def __init__(
+        self,
+        max_rps: float | None = None,
+        burst: int | None = None,
+        max_concurrency: int = 16,
+        min_concurrency: int = 1,
+        latency_target_s: float | None = None,
+        decrease_factor: float = 0.5,
+        decrease_cooldown_s: float = 1.0,
+        retry_budget: float = 0.2,
+        min_retry_tokens: float = 10.0,
+        max_retry_tokens: float = 100.0,
+    ):
+        self.max_rps = max_rps
+        self.burst = burst or max(1, int(max_rps or 1))
+        self.max_concurrency = max_concurrency
+        self.min_concurrency = min_concurrency
+        self.latency_target_s = latency_target_s
+        self.decrease_factor = decrease_factor
+        self.decrease_cooldown_s = decrease_cooldown_s
+        self.retry_budget = retry_budget
+        self.min_retry_tokens = min_retry_tokens
+        self.max_retry_tokens = max_retry_tokens
+
+        self.limit = float(max_concurrency)
+        self.rate = max_rps
+        self._tokens = float(self.burst)
+        self._refilled_at = time.monotonic()
+        self._retry_tokens = min_retry_tokens
+        self._last_decrease = 0.0
+        self.in_flight = 0
+        self._waiters: list[tuple[int, int]] = []
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+        # ticket -> (loop, future) of a waiting aacquire(), woken alongside the condition
+        self._async_waiters: dict[tuple[int, int], tuple[asyncio.AbstractEventLoop, asyncio.Future]] = {}
+        self._stats = {"admitted": 0, "cached": 0, "throttled": 0, "transient": 0, "retries": 0, "budget_exhausted": 0}
+
+    def config(self) -> dict[str, Any]:
+        """Constructor arguments of this limiter, to build an equal one elsewhere (distributed workers)."""
+        return {"max_rps": self.max_rps, "burst": self.burst, "max_concurrency": self.max_concurrency,
+                "min_concurrency": self.min_concurrency, "latency_target_s": self.latency_target_s,
+                "decrease_factor": self.decrease_factor, "decrease_cooldown_s": self.decrease_cooldown_s,
+                "retry_budget": self.retry_budget, "min_retry_tokens": self.min_retry_tokens,
+                "max_retry_tokens": self.max_retry_tokens}
+
+    def _refill(self, now: float):
+        if self.rate is not None:
+            self._tokens = min(self.burst, self._tokens + (now - self._refilled_at) * self.rate)
+        self._refilled_at = now
+
+    @staticmethod
+    def _wake(future: asyncio.Future):
+        if not future.done():
+            future.set_result(None)
+
+    def _notify_all(self):
+        self._cond.notify_all()
+        for loop, future in self._async_waiters.values():
+            loop.call_soon_threadsafe(self._wake, future)
+        self._async_waiters.clear()
+
+    def _try_admit(self, ticket: tuple[int, int]) -> tuple[bool, float | None]:
+        """Admit `ticket` if it is first in line and both limits allow; else how long to wait (None: until notified)."""
+        if self._waiters[0] != ticket or self.in_flight >= max(self.min_concurrency, int(self.limit)):
+            return False, None
+        self._refill(time.monotonic())
+        if self.rate is not None and self._tokens < 1:
+            return False, (1 - self._tokens) / self.rate
+        if self.rate is not None:
+            self._tokens -= 1
+        heapq.heappop(self._waiters)
+        self.in_flight += 1
+        self._stats["admitted"] += 1
+        self._notify_all()
+        return True, None
+
+    def acquire(self, priority: int = OPTIMIZER) -> None:
+        """Block until this caller is the highest-priority waiter and both limits admit it."""
+        with self._cond:
+            ticket = (priority, next(self._seq))
+            heapq.heappush(self._waiters, ticket)
+            while True:
+                admitted, timeout = self._try_admit(ticket)
+                if admitted:
+                    return
+                self._cond.wait(timeout)
+
+    async def aacquire(self, priority: int = OPTIMIZER) -> None:
+        """``acquire`` for coroutines: waits on the event loop instead of holding a thread."""
+        loop = asyncio.get_running_loop()
+        with self._cond:
+            ticket = (priority, next(self._seq))
+            heapq.heappush(self._waiters, ticket)
+        try:
+            while True:
+                with self._cond:
+                    admitted, timeout = self._try_admit(ticket)
+                    if admitted:
+                        return
+                    woken = loop.create_future()
+                    self._async_waiters[ticket] = (loop, woken)
+                try:
+                    await asyncio.wait_for(woken, timeout)
+                except asyncio.TimeoutError:
+                    pass
+        except asyncio.CancelledError:
+            with self._cond:
+                self._async_waiters.pop(ticket, None)
+                self._waiters.remove(ticket)
+                heapq.heapify(self._waiters)
+                # the caller behind this one may be first in line now
+                self._notify_all()
+            raise
+
+    def release(self, latency_s: float, outcome: str = "ok") -> None:
+        """Record the outcome of an admitted call ("ok", "cached", "throttled", "transient", "fatal" or "cancelled") and adapt."""
+        with self._cond:
+            self.in_flight -= 1
+            now = time.monotonic()
+            if outcome == "cached":
+                # served from the response cache: the deployment saw nothing, so the token is not spent
+                # and the near-zero latency says nothing about its capacity
+                self._stats["cached"] += 1
+                if self.rate is not None:
+                    self._tokens = min(self.burst, self._tokens + 1)
+                self._notify_all()
+                return
+            if outcome in ("throttled", "transient"):
+                self._stats[outcome] += 1
+            slow = self.latency_target_s is not None and latency_s > self.latency_target_s
+            if outcome in ("throttled", "transient") or (outcome == "ok" and slow):
+                # one decrease per cooldown: a burst of failures from the same overload counts once
+                if now - self._last_decrease >= self.decrease_cooldown_s:
+                    self._last_decrease = now
+                    self.limit = max(self.min_concurrency, self.limit * self.decrease_factor)
+                    if self.rate is not None:
+                        self.rate = max(0.1, self.rate * self.decrease_factor)
+            elif outcome == "ok":
+                # each successful first attempt or retry earns a fraction of a retry
+                self.limit = min(self.max_concurrency, self.limit + 1 / self.limit)
+                if self.rate is not None:
+                    self.rate = min(self.max_rps, self.rate + self.max_rps / 100)
+                self._retry_tokens = min(self._retry_tokens + self.retry_budget, self.max_retry_tokens)
+            self._notify_all()
+
+    def try_retry(self) -> bool:
+        """Spend one retry from the budget; False once retries would exceed it."""
+        with self._cond:
+            if self._retry_tokens < 1:
+                self._stats["budget_exhausted"] += 1
+                return False
+            self._retry_tokens -= 1
+            self._stats["retries"] += 1
+            return True
+
+    def queue_depth(self) -> dict[str, int]:
+        with self._cond:
+            depth = {name: 0 for name in PRIORITY_NAMES.values()}
+            for priority, _ in self._waiters:
+                name = PRIORITY_NAMES.get(priority, str(priority))
+                depth[name] = depth.get(name, 0) + 1
+            return depth
+
+    def stats(self) -> dict[str, Any]:
+        with self._cond:
+            s = dict(self._stats)
+            s.update(in_flight=self.in_flight, concurrency_limit=round(self.limit, 2),
+                     rps=round(self.rate, 2) if self.rate is not None else None, queued=len(self._waiters))
+        s["queue_depth"] = self.queue_depth()
+        return s
+
+
+class ThrottledLM(dspy.BaseLM):
+    def __init__(self, lm: dspy.LM, limiter: AdaptiveLimiter, priority: int = OPTIMIZER, max_retries: int = 5,
+                 backoff_base_s: float = 0.5, backoff_max_s: float = 30.0):
+        # retries happen here, against the budget, instead of inside litellm
+        inner = lm.copy(num_retries=0) if hasattr(lm, "num_retries") else lm
+        super().__init__(model=lm.model, model_type=lm.model_type, cache=lm.cache)
+        self.kwargs = inner.kwargs
+        self.lm = inner
+        self.limiter = limiter
+        self.priority = priority
+        self.max_retries = max_retries
+        self.backoff_base_s = backoff_base_s
+        self.backoff_max_s = backoff_max_s
+
+    def _backoff(self, attempt: int, error: Exception) -> float:
+        requested = retry_after(error)
+        if requested is not None:
+            return min(requested, self.backoff_max_s)
+        return random.uniform(0, min(self.backoff_max_s, self.backoff_base_s * 2**attempt))
+
+    def _should_retry(self, attempt: int, outcome: str) -> bool:
+        return outcome != "fatal" and attempt < self.max_retries and self.limiter.try_retry()
+
+    @staticmethod
+    def _outcome(response) -> str:
+        return "cached" if getattr(response, "cache_hit", False) else "ok"
+
+    def forward(self, prompt=None, messages=None, **kwargs):
+        for attempt in itertools.count():
+            queued = time.monotonic()
+            self.limiter.acquire(self.priority)
+            started = time.monotonic()
+            note_queue_wait(started - queued)
+            try:
+                response = self.lm.forward(prompt=prompt, messages=messages, **kwargs)
+            except Exception as e:
+                outcome = classify_error(e)
+                self.limiter.release(time.monotonic() - started, outcome)
+                if not self._should_retry(attempt, outcome):
+                    raise
+                backoff = self._backoff(attempt, e)
+                note_queue_wait(backoff)
+                time.sleep(backoff)
+                continue
+            self.limiter.release(time.monotonic() - started, self._outcome(response))
+            return response
+
+    async def aforward(self, prompt=None, messages=None, **kwargs):
+        for attempt in itertools.count():
+            queued = time.monotonic()
+            await self.limiter.aacquire(self.priority)
+            started = time.monotonic()
+            note_queue_wait(started - queued)
+            try:
+                response = await self.lm.aforward(prompt=prompt, messages=messages, **kwargs)
+            except asyncio.CancelledError:
+                self.limiter.release(time.monotonic() - started, "cancelled")
+                raise
+            except Exception as e:
+                outcome = classify_error(e)
+                self.limiter.release(time.monotonic() - started, outcome)
+                if not self._should_retry(attempt, outcome):
+                    raise
+                backoff = self._backoff(attempt, e)
+                note_queue_wait(backoff)
+                await asyncio.sleep(backoff)
+                continue
+            self.limiter.release(time.monotonic() - started, self._outcome(response))
+            return response
+
+    def copy(self, **kwargs) -> "ThrottledLM":
+        return ThrottledLM(self.lm.copy(**kwargs), self.limiter, self.priority, self.max_retries,
+                           self.backoff_base_s, self.backoff_max_s)
+
+    def __deepcopy__(self, memo):
+        # copies keep sharing the deployment's limiter
+        return self.copy()
+
+    def dump_state(self):
+        return self.lm.dump_state()
+
+    def wrapper_config(self) -> dict[str, Any]:
+        """Arguments besides the wrapped LM, with the limiter's settings in place of the limiter."""
+        return {"limiter": self.limiter.config(), "priority": self.priority, "max_retries": self.max_retries,
+                "backoff_base_s": self.backoff_base_s, "backoff_max_s": self.backoff_max_s}
+
+
+class LMScheduler:
+    """One ``AdaptiveLimiter`` per deployment; every LM wrapped for the same deployment shares it."""
+
+    def __init__(self, **limiter_defaults):
+        self.limiter_defaults = limiter_defaults
+        self.limiters: dict[str, AdaptiveLimiter] = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def deployment(lm) -> str:
+        return f"{lm.model}@{lm.kwargs.get('api_base') or getattr(lm, 'api_base', None) or 'default'}"
+
+    def limiter(self, lm, **overrides) -> AdaptiveLimiter:
+        key = self.deployment(lm)
+        with self._lock:
+            if key not in self.limiters:
+                self.limiters[key] = AdaptiveLimiter(**{**self.limiter_defaults, **overrides})
+            return self.limiters[key]
+
+    def wrap(self, lm: dspy.LM, priority: int = OPTIMIZER, **kwargs) -> ThrottledLM:
+        return ThrottledLM(lm, self.limiter(lm), priority, **kwargs)
+
+    def stats(self) -> dict[str, dict[str, Any]]:
+        with self._lock:
+            limiters = dict(self.limiters)
+        return {key: limiter.stats() for key, limiter in limiters.items()}
+
+    def report(self) -> str:
+        lines = []
+        for key, s in self.stats().items():
+            queued = ", ".join(f"{name} {count}" for name, count in s["queue_depth"].items())
+            lines.append(
+                f"{key}: {s['in_flight']} in flight (limit {s['concurrency_limit']}, rps {s['rps']}), queued: {queued}; "
+                f"{s['admitted']} admitted ({s['cached']} from cache), {s['throttled']} throttled, {s['transient']} transient errors, "
+                f"{s['retries']} retries, {s['budget_exhausted']} over retry budget"
+            )
+        return "\n".join(lines) or "LM scheduler: no traffic"
+
+    @contextmanager
+    def watch(self, interval_s: float = 10.0, log=print):
+        """Log ``report()`` every `interval_s` seconds while the block runs."""
+        stop = threading.Event()
+
+        def loop():
+            while not stop.wait(interval_s):
+                log(self.report())
+
+        thread = threading.Thread(target=loop, name="lm-scheduler-watch", daemon=True)
+        thread.start()
+        try:
+            yield self
+        finally:
+            stop.set()
+            thread.join()
+
+
+def scheduler_from_env() -> LMScheduler:
+    """Scheduler configured from `LM_MAX_RPS`, `LM_MAX_CONCURRENCY` and `LM_LATENCY_TARGET_S`."""
+    max_rps = os.getenv("LM_MAX_RPS")
+    latency_target = os.getenv("LM_LATENCY_TARGET_S")
+    return LMScheduler(
+        max_rps=float(max_rps) if max_rps else None,
+        max_concurrency=int(os.getenv("LM_MAX_CONCURRENCY", "16")),
+        latency_target_s=float(latency_target) if latency_target else None,
+    )
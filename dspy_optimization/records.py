@@ -0,0 +1,57 @@
+import json
+from typing import Any, Iterator
+
+_CHUNK_SIZE = 1 << 16
+
+
+def iter_records(path: str) -> Iterator[dict[str, Any]]:
+    """Yield records one by one from a JSON array file or a JSONL file.
+
+    The file is read in fixed-size chunks, so memory stays flat no matter how large the dump is.
+    """
+    with open(path, "r", encoding="utf-8") as f:
+        head = f.read(_CHUNK_SIZE)
+        stripped = head.lstrip()
+        if stripped.startswith("["):
+            yield from _iter_json_array(f, stripped[1:])
+        else:
+            yield from _iter_jsonl(f, head)
+
+
+def _iter_jsonl(f, head: str) -> Iterator[dict[str, Any]]:
+    buffer = head
+    while True:
+        *lines, buffer = buffer.split("\n")
+        for line in lines:
+            if line.strip():
+                yield json.loads(line)
+        chunk = f.read(_CHUNK_SIZE)
+        if not chunk:
+            break
+        buffer += chunk
+    if buffer.strip():
+        yield json.loads(buffer)
+
+
+def _iter_json_array(f, buffer: str) -> Iterator[dict[str, Any]]:
+    decoder = json.JSONDecoder()
+    pos = 0
+    eof = False
+    while True:
+        # skip separators between array items
+        while pos < len(buffer) and buffer[pos] in " \t\r\n,":
+            pos += 1
+        if pos < len(buffer) and buffer[pos] == "]":
+            return
+        try:
+            record, end = decoder.raw_decode(buffer, pos)
+        except json.JSONDecodeError:
+            if eof:
+                raise
+            chunk = f.read(_CHUNK_SIZE)
+            eof = not chunk
+            buffer = buffer[pos:] + chunk
+            pos = 0
+            continue
+        yield record
+        pos = end
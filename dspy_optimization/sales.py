@@ -0,0 +1,77 @@
+"""Sales-lead qualification program and data used by dspy/4.copro_example.py."""
+import dspy
+
+# 🔥 PROBLEM: Sales Email Qualification - Complex Multi-Factor Analysis
+class QualifySalesLead(dspy.Signature):
+    """Analyze sales emails and predict deal success probability."""
+    email_conversation = dspy.InputField(desc="Email exchange between sales and prospect")
+    company_tier = dspy.OutputField(desc="Startup, SMB, Mid-Market, Enterprise")
+    decision_maker_engaged = dspy.OutputField(desc="yes, no, or partially")
+    budget_alignment = dspy.OutputField(desc="below, within, or above our pricing")
+    urgency_level = dspy.OutputField(desc="low, medium, high, critical")
+    deal_stage = dspy.OutputField(desc="Discovery, Demo, Proposal, Negotiation, Closed-Won, Closed-Lost")
+    confidence_score = dspy.OutputField(desc="0-100% probability of closing")
+    next_best_action = dspy.OutputField(desc="Specific recommended sales action")
+    reasoning = dspy.OutputField(desc="Step-by-step analysis of all factors")
+
+class SalesQualifier(dspy.Module):
+    def __init__(self):
+        super().__init__()
+        self.qualify = dspy.ChainOfThought(QualifySalesLead)
+    
+    def forward(self, email_conversation):
+        return self.qualify(email_conversation=email_conversation)
+
+    async def aforward(self, email_conversation):
+        return await self.qualify.acall(email_conversation=email_conversation)
+
+# 🎯 TRAINING DATA: Real-world sales scenarios
+trainset = [
+    dspy.Example(
+        email_conversation="""
+        Prospect: "We're a 50-person startup looking to scale. Can you send pricing?"
+        Sales: "Sure! Our growth plan is $299/month. Would you like a demo?"
+        Prospect: "That's higher than expected. We'll discuss internally."
+        """,
+        company_tier="Startup",
+        decision_maker_engaged="partially", 
+        budget_alignment="below",
+        urgency_level="low",
+        deal_stage="Discovery",
+        confidence_score="25%",
+        next_best_action="Send case studies showing ROI for similar startups",
+        reasoning="Startup with budget concerns, no decision maker engaged, early stage discussion"
+    ).with_inputs('email_conversation'),
+    
+    dspy.Example(
+        email_conversation="""
+        Prospect: "I'm the CTO at 500-employee company. We need this implemented before Q4."
+        Sales: "Understood. Our enterprise plan starts at $5K/month. Available for technical deep dive?"
+        Prospect: "Yes, bring your solutions architect. We have budget approved."
+        """,
+        company_tier="Mid-Market",
+        decision_maker_engaged="yes",
+        budget_alignment="within", 
+        urgency_level="high",
+        deal_stage="Demo",
+        confidence_score="75%",
+        next_best_action="Schedule technical deep dive with solutions architect",
+        reasoning="CTO engaged, budget approved, timeline urgency, mid-market company"
+    ).with_inputs('email_conversation'),
+    
+    dspy.Example(
+        email_conversation="""
+        Prospect: "We're evaluating vendors for $500K annual contract. Send security docs."
+        Sales: "Here's our SOC2 compliance. When can we discuss your requirements?"
+        Prospect: "Our procurement team will review. We're deciding in 30 days."
+        """,
+        company_tier="Enterprise", 
+        decision_maker_engaged="partially",
+        budget_alignment="above",
+        urgency_level="medium",
+        deal_stage="Proposal",
+        confidence_score="60%",
+        next_best_action="Engage procurement team directly with compliance documentation",
+        reasoning="Large contract, procurement process, security focus, longer sales cycle"
+    ).with_inputs('email_conversation'),
+]
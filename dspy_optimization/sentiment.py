@@ -0,0 +1,11 @@
+"""Sentiment classifier used by dspy/1.main.py."""
+import dspy
+
+
+class SentimentClassifier(dspy.Signature):
+    """Classify the sentiment of a text."""
+
+    text: str = dspy.InputField(desc="input text to classify sentiment")
+    sentiment: int = dspy.OutputField(
+        desc="sentiment, the higher the more positive", ge=0, le=10
+    )
@@ -0,0 +1,473 @@
+"""Serve the optimized programs over HTTP from a single asyncio process.
+
+The example scripts optimize, print and exit. This entry point loads what they saved
+(``dspy/optimized_ticket_router.json``, ``dspy/sales_qualifier_copro.json`` and
+``dspy/nps_topic_miprov2.json``) and serves them:
+
+* every program has its own concurrency limit and a bounded wait queue; when the queue is full
+  requests are rejected at once with 503 and ``Retry-After`` instead of piling up;
+* every request has a deadline (``timeout_s``, capped by ``--max-timeout-s``) covering queueing
+  and execution. When it passes, or the client disconnects, the program's task is cancelled,
+  and with it the in-flight LM HTTP request (programs run through ``acall``);
+* ``/health`` is the liveness probe; ``/ready`` only turns 200 once all programs are loaded
+  and turns 503 again while draining on SIGTERM;
+* ``/metrics`` exposes request counts, latency histograms, in-flight/queued gauges and LM token
+  counts in the Prometheus text format.
+
+    python -m dspy_optimization.server --port 8000                 # Azure settings from the environment
+    python -m dspy_optimization.server --mock --allow-unoptimized  # offline, against an in-process mock LM
+    curl -s localhost:8000/v1/programs/ticket_router -d '{"inputs": {"ticket_text": "Site is down"}, "timeout_s": 5}'
+
+Load-test it with ``python -m dspy_optimization.loadtest ticket_router --http``.
+"""
+import argparse
+import asyncio
+import bisect
+import json
+import os
+import signal
+import threading
+import time
+from collections import defaultdict
+from typing import Any, Callable
+
+import dspy
+
+from dspy_optimization import sales, tickets
+from dspy_optimization.cache import install_cache
+from dspy_optimization.mock_lm import MockLMServer
+from dspy_optimization.nps import NPSTopic
+from dspy_optimization.prefix_cache import BACKENDS, PrefixCachingLM
+from dspy_optimization.ratelimit import SERVING, scheduler_from_env
+from dspy_optimization.structured import StructuredOutputAdapter
+
+# name -> (program factory, adapter factory, state saved by the optimizer script)
+SERVED_PROGRAMS: dict[str, tuple[Callable[[], dspy.Module], Callable[[], Any], str]] = {
+    "ticket_router": (tickets.TicketRouter, dspy.ChatAdapter, "dspy/optimized_ticket_router.json"),
+    "sales_qualifier": (sales.SalesQualifier, dspy.ChatAdapter, "dspy/sales_qualifier_copro.json"),
+    "nps_classifier": (lambda: dspy.ChainOfThought(NPSTopic), StructuredOutputAdapter, "dspy/nps_topic_miprov2.json"),
+}
+
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+MAX_BODY_BYTES = 1 << 20
+_DISCONNECT_POLL_S = 0.1
+_REASONS = {200: "OK", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed", 413: "Payload Too Large",
+            500: "Internal Server Error", 503: "Service Unavailable", 504: "Gateway Timeout"}
+_HELP = {
+    "dspy_requests_total": ("counter", "Program requests by response code (499: client went away)."),
+    "dspy_request_duration_seconds": ("histogram", "Time from request to response, queueing included."),
+    "dspy_lm_tokens_total": ("counter", "LM tokens spent by program requests (cache hits spend none)."),
+    "dspy_requests_in_flight": ("gauge", "Requests holding one of the program's concurrency slots."),
+    "dspy_requests_queued": ("gauge", "Requests waiting for a concurrency slot."),
+    "dspy_ready": ("gauge", "1 when all programs are loaded and the server is not draining."),
+}
+
+
+class Overloaded(Exception):
+    pass
+
+
+class Histogram:
+    def __init__(self, buckets: tuple[float, ...] = LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+def _label_value(value: Any) -> str:
+    # the exposition format escapes backslash, double quote and line feed in label values
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(labels: tuple[tuple[str, Any], ...]) -> str:
+    return "{" + ",".join(f'{k}="{_label_value(v)}"' for k, v in labels) + "}" if labels else ""
+
+
+class Metrics:
+    """Counters, histograms and gauges in the Prometheus text format; only used from the event loop."""
+
+    def __init__(self):
+        self.counters: dict[str, dict[tuple, float]] = defaultdict(lambda: defaultdict(float))
+        self.histograms: dict[str, dict[tuple, Histogram]] = defaultdict(dict)
+
+    def inc(self, name: str, value: float = 1, **labels):
+        self.counters[name][tuple(labels.items())] += value
+
+    def observe(self, name: str, value: float, **labels):
+        key = tuple(labels.items())
+        if key not in self.histograms[name]:
+            self.histograms[name][key] = Histogram()
+        self.histograms[name][key].observe(value)
+
+    def render(self, gauges: dict[str, dict[tuple, float]]) -> str:
+        lines = []
+        for name, series in [*self.counters.items(), *gauges.items()]:
+            lines += [f"# HELP {name} {_HELP[name][1]}", f"# TYPE {name} {_HELP[name][0]}"]
+            lines += [f"{name}{_labels(labels)} {value:g}" for labels, value in sorted(series.items())]
+        for name, series in self.histograms.items():
+            lines += [f"# HELP {name} {_HELP[name][1]}", f"# TYPE {name} histogram"]
+            for labels, histogram in sorted(series.items()):
+                cumulative = 0
+                for bound, count in zip([*histogram.buckets, "+Inf"], histogram.counts):
+                    cumulative += count
+                    lines.append(f"{name}_bucket{_labels((*labels, ('le', bound)))} {cumulative}")
+                lines.append(f"{name}_sum{_labels(labels)} {histogram.sum:.6f}")
+                lines.append(f"{name}_count{_labels(labels)} {histogram.count}")
+        return "\n".join(lines) + "\n"
+
+    def snapshot(self) -> dict[str, dict[str, float]]:
+        """Counters as ``{name: {"label=value,...": value}}``, for JSON reports."""
+        return {name: {",".join(f"{k}={v}" for k, v in labels): value for labels, value in sorted(series.items())}
+                for name, series in self.counters.items()}
+
+
+class ServedProgram:
+    def __init__(self, name: str, program: dspy.Module, adapter=None, max_concurrency: int = 8,
+                 max_queue: int = 64, source: str | None = None):
+        self.name = name
+        self.program = program
+        self.adapter = adapter
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.source = source
+        # the first predictor sees the program's own inputs in all served programs
+        self.input_fields = list(next(iter(program.named_predictors()))[1].signature.input_fields)
+        self.in_flight = 0
+        self.queued = 0
+        self._slots = asyncio.Semaphore(max_concurrency)
+        # modules without aforward run in a worker thread, where a cancelled request cannot stop the LM call
+        native = getattr(type(program), "aforward", None) not in (None, getattr(dspy.Module, "aforward", None))
+        self._acall = program.acall if native else dspy.asyncify(program)
+
+    async def __call__(self, **inputs) -> dspy.Prediction:
+        if self.queued >= self.max_queue:
+            raise Overloaded(f"{self.name}: {self.queued} requests already waiting")
+        self.queued += 1
+        try:
+            await self._slots.acquire()
+        finally:
+            self.queued -= 1
+        self.in_flight += 1
+        try:
+            with dspy.context(adapter=self.adapter, track_usage=True):
+                return await self._acall(**inputs)
+        finally:
+            self.in_flight -= 1
+            self._slots.release()
+
+    def describe(self) -> dict[str, Any]:
+        return {"inputs": self.input_fields, "source": self.source, "max_concurrency": self.max_concurrency,
+                "max_queue": self.max_queue}
+
+
+def load_programs(names: list[str] | None = None, max_concurrency: int = 8, max_queue: int = 64,
+                  allow_unoptimized: bool = False) -> dict[str, ServedProgram]:
+    """Build and load every served program; a missing saved state is an error unless `allow_unoptimized`."""
+    served = {}
+    for name in names or SERVED_PROGRAMS:
+        make_program, make_adapter, path = SERVED_PROGRAMS[name]
+        program = make_program()
+        if os.path.exists(path):
+            program.load(path)
+        elif allow_unoptimized:
+            path = None
+        else:
+            raise FileNotFoundError(f"{path} not found: run the optimizer for {name} first, or pass --allow-unoptimized")
+        served[name] = ServedProgram(name, program, make_adapter(), max_concurrency, max_queue, source=path)
+    return served
+
+
+class ProgramServer:
+    def __init__(self, load: Callable[[], dict[str, ServedProgram]], host: str = "127.0.0.1", port: int = 8000,
+                 default_timeout_s: float = 30.0, max_timeout_s: float = 120.0, drain_timeout_s: float = 30.0):
+        """
+        Args:
+            load: Builds the served programs; runs in a worker thread after the port is open, so
+                ``/health`` answers while ``/ready`` still reports 503.
+            default_timeout_s: Deadline of requests that do not send ``timeout_s``.
+            drain_timeout_s: On shutdown, how long in-flight requests may take before they are cancelled.
+        """
+        self.load = load
+        self.host = host
+        self.port = port
+        self.default_timeout_s = default_timeout_s
+        self.max_timeout_s = max_timeout_s
+        self.drain_timeout_s = drain_timeout_s
+        self.programs: dict[str, ServedProgram] = {}
+        self.metrics = Metrics()
+        self.ready = False
+        self.draining = False
+        self._server: asyncio.Server | None = None
+        self._requests: set[asyncio.Task] = set()
+        self._connections: set[asyncio.StreamWriter] = set()
+        self._stopping: asyncio.Event | None = None
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._thread: threading.Thread | None = None
+        self._started = threading.Event()
+
+    @property
+    def url(self) -> str:
+        return f"http://{self.host}:{self.port}"
+
+    # lifecycle
+
+    async def serve(self, install_signal_handlers: bool = False):
+        self._loop = asyncio.get_running_loop()
+        self._stopping = asyncio.Event()
+        self._server = await asyncio.start_server(self._handle, self.host, self.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+        if install_signal_handlers:
+            for sig in (signal.SIGTERM, signal.SIGINT):
+                self._loop.add_signal_handler(sig, self._stopping.set)
+        self._started.set()
+        try:
+            self.programs = await asyncio.to_thread(self.load)
+            self.ready = True
+            await self._stopping.wait()
+        finally:
+            await self._drain()
+
+    async def _drain(self):
+        self.ready = False
+        self.draining = True
+        self._server.close()
+        if self._requests:
+            _, pending = await asyncio.wait(set(self._requests), timeout=self.drain_timeout_s)
+            for task in pending:
+                task.cancel()
+            await asyncio.gather(*pending, return_exceptions=True)
+        for writer in list(self._connections):
+            writer.close()
+        await self._server.wait_closed()
+
+    def shutdown(self):
+        """Stop accepting requests and drain; safe to call from any thread."""
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(self._stopping.set)
+
+    def start(self) -> "ProgramServer":
+        """Serve from a daemon thread with its own event loop, for benchmarks and load tests."""
+        self._thread = threading.Thread(target=asyncio.run, args=(self.serve(),), name="program-server", daemon=True)
+        self._thread.start()
+        self._started.wait()
+        return self
+
+    def wait_ready(self, timeout_s: float = 60.0) -> bool:
+        deadline = time.monotonic() + timeout_s
+        while not self.ready and time.monotonic() < deadline:
+            if self._thread is not None and not self._thread.is_alive():
+                return False
+            time.sleep(0.05)
+        return self.ready
+
+    def stop(self):
+        self.shutdown()
+        if self._thread is not None:
+            self._thread.join()
+
+    # HTTP
+
+    async def _read_request(self, reader: asyncio.StreamReader) -> tuple[str, str, dict[str, str], bytes] | None:
+        try:
+            head = await reader.readuntil(b"\r\n\r\n")
+        except asyncio.IncompleteReadError as e:
+            if e.partial.strip():
+                raise ValueError("truncated request head")
+            return None
+        request_line, *header_lines = head.decode("latin-1").rstrip("\r\n").split("\r\n")
+        method, target, _ = request_line.split(" ", 2)
+        headers = {}
+        for line in header_lines:
+            name, _, value = line.partition(":")
+            headers[name.strip().lower()] = value.strip()
+        length = int(headers.get("content-length", 0))
+        if length > MAX_BODY_BYTES:
+            raise OverflowError(f"body of {length} bytes")
+        body = await reader.readexactly(length) if length else b""
+        return method, target.split("?", 1)[0], headers, body
+
+    async def _write(self, writer: asyncio.StreamWriter, status: int, payload: Any, keep_alive: bool):
+        if isinstance(payload, str):
+            data, content_type = payload.encode(), "text/plain; version=0.0.4; charset=utf-8"
+        else:
+            data, content_type = json.dumps(payload, ensure_ascii=False, default=str).encode(), "application/json"
+        head = [f"HTTP/1.1 {status} {_REASONS.get(status, '')}", f"Content-Type: {content_type}",
+                f"Content-Length: {len(data)}", f"Connection: {'keep-alive' if keep_alive else 'close'}"]
+        if status == 503:
+            head.append("Retry-After: 1")
+        writer.write(("\r\n".join(head) + "\r\n\r\n").encode() + data)
+        await writer.drain()
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self._connections.add(writer)
+        try:
+            while not self.draining:
+                try:
+                    request = await self._read_request(reader)
+                except OverflowError as e:
+                    await self._write(writer, 413, {"error": str(e)}, keep_alive=False)
+                    return
+                except (ValueError, asyncio.LimitOverrunError, asyncio.IncompleteReadError) as e:
+                    await self._write(writer, 400, {"error": f"malformed request: {e}"}, keep_alive=False)
+                    return
+                if request is None:
+                    return
+                method, path, headers, body = request
+                response = await self._route(method, path, body, reader)
+                if response is None:
+                    # the client went away; there is nobody to answer
+                    return
+                keep_alive = headers.get("connection", "").lower() != "close" and not self.draining
+                await self._write(writer, *response, keep_alive=keep_alive)
+                if not keep_alive:
+                    return
+        except ConnectionError:
+            pass
+        finally:
+            self._connections.discard(writer)
+            writer.close()
+
+    async def _route(self, method: str, path: str, body: bytes, reader: asyncio.StreamReader) -> tuple[int, Any] | None:
+        if path == "/health":
+            return 200, {"status": "ok"}
+        if path == "/ready":
+            return (200 if self.ready else 503), {"ready": self.ready, "draining": self.draining,
+                                                  "programs": sorted(self.programs)}
+        if path == "/metrics":
+            return 200, self.metrics.render(self._gauges())
+        if path.rstrip("/") == "/v1/programs":
+            return 200, {name: served.describe() for name, served in self.programs.items()}
+        if path.startswith("/v1/programs/"):
+            served = self.programs.get(path.removeprefix("/v1/programs/").rstrip("/"))
+            if served is None:
+                return (404 if self.ready else 503), {"error": f"no program at {path}"}
+            if method != "POST":
+                return 405, {"error": "use POST"}
+            task = asyncio.ensure_future(self._predict(served, body, reader))
+            self._requests.add(task)
+            task.add_done_callback(self._requests.discard)
+            return await task
+        return 404, {"error": f"no route for {path}"}
+
+    def _gauges(self) -> dict[str, dict[tuple, float]]:
+        return {
+            "dspy_requests_in_flight": {(("program", name),): s.in_flight for name, s in self.programs.items()},
+            "dspy_requests_queued": {(("program", name),): s.queued for name, s in self.programs.items()},
+            "dspy_ready": {(): float(self.ready)},
+        }
+
+    # program calls
+
+    @staticmethod
+    async def _client_gone(reader: asyncio.StreamReader):
+        # EOF is recorded on the reader even while nobody reads from it
+        while not (reader.at_eof() or reader.exception() is not None):
+            await asyncio.sleep(_DISCONNECT_POLL_S)
+
+    async def _predict(self, served: ServedProgram, body: bytes, reader: asyncio.StreamReader) -> tuple[int, Any] | None:
+        try:
+            request = json.loads(body or b"{}")
+            inputs = request["inputs"]
+            if not isinstance(inputs, dict):
+                raise TypeError(f"inputs must be an object, got {type(inputs).__name__}")
+            missing = [name for name in served.input_fields if name not in inputs]
+            timeout_s = min(float(request.get("timeout_s", self.default_timeout_s)), self.max_timeout_s)
+        except (ValueError, KeyError, TypeError) as e:
+            return 400, {"error": f"expected {{\"inputs\": {{...}}, \"timeout_s\": ...}}: {e}"}
+        if missing:
+            return 400, {"error": f"missing inputs: {', '.join(missing)}"}
+        if self.draining:
+            return 503, {"error": "draining"}
+
+        started = time.perf_counter()
+        call = asyncio.ensure_future(self._run(served, inputs, timeout_s))
+        gone = asyncio.ensure_future(self._client_gone(reader))
+        try:
+            await asyncio.wait({call, gone}, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            gone.cancel()
+            if not call.done():
+                call.cancel()
+                await asyncio.gather(call, return_exceptions=True)
+        response = call.result() if not call.cancelled() else None
+
+        self.metrics.inc("dspy_requests_total", program=served.name, code=response[0] if response else 499)
+        self.metrics.observe("dspy_request_duration_seconds", time.perf_counter() - started, program=served.name)
+        return response
+
+    async def _run(self, served: ServedProgram, inputs: dict[str, Any], timeout_s: float) -> tuple[int, Any]:
+        started = time.perf_counter()
+        try:
+            async with asyncio.timeout(timeout_s):
+                prediction = await served(**inputs)
+        except TimeoutError:
+            return 504, {"error": f"deadline of {timeout_s:g}s exceeded"}
+        except Overloaded as e:
+            return 503, {"error": str(e)}
+        except Exception as e:
+            return 500, {"error": f"{type(e).__name__}: {e}"}
+
+        usage = prediction.get_lm_usage() or {}
+        for model_usage in usage.values():
+            for kind in ("prompt", "completion"):
+                self.metrics.inc("dspy_lm_tokens_total", model_usage.get(f"{kind}_tokens") or 0, program=served.name, type=kind)
+        return 200, {"program": served.name, "outputs": dict(prediction.items()), "usage": usage,
+                     "latency_ms": round(1000 * (time.perf_counter() - started), 1)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve the optimized programs over HTTP.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--programs", nargs="+", choices=sorted(SERVED_PROGRAMS), help="serve only these programs")
+    parser.add_argument("--allow-unoptimized", action="store_true", help="serve zero-shot programs whose saved state is missing")
+    parser.add_argument("--max-concurrency", type=int, default=8, help="concurrent requests per program")
+    parser.add_argument("--max-queue", type=int, default=64, help="requests per program waiting for a slot before 503s")
+    parser.add_argument("--timeout-s", type=float, default=30.0, help="deadline of requests that do not set timeout_s")
+    parser.add_argument("--max-timeout-s", type=float, default=120.0)
+    parser.add_argument("--model", default=f"azure/{os.getenv('AZURE_OPENAI_MODEL')}")
+    parser.add_argument("--api-base", default=os.getenv("AZURE_OPENAI_ENDPOINT"))
+    parser.add_argument("--mock", action="store_true", help="answer from an in-process mock LM instead of --model")
+    parser.add_argument("--mock-latency-ms", type=float, default=200.0)
+    parser.add_argument("--prefix-cache", choices=["auto", *BACKENDS], default="auto",
+                        help="backend to tag shared prompt prefixes for (auto: from the model name; llama.cpp must be named)")
+    parser.add_argument("--prefix-slots", type=int, help="KV-cache slots of a local server (default: OLLAMA_NUM_PARALLEL or 4)")
+    args = parser.parse_args()
+
+    mock = None
+    if args.mock:
+        mock = MockLMServer(port=0, latency_ms=args.mock_latency_ms).start()
+        llm = dspy.LM("openai/mock-lm", api_base=mock.url, api_key="mock", cache=False)
+    else:
+        llm = dspy.LM(args.model, api_base=args.api_base, api_key=os.getenv("AZURE_OPENAI_API_KEY"),
+                      api_version=os.getenv("AZURE_OPENAI_API_VERSION"))
+        install_cache()
+    # serving traffic overtakes optimizer runs on the same deployment (LM_MAX_RPS, LM_MAX_CONCURRENCY)
+    lm_scheduler = scheduler_from_env()
+    # the three programs share one backend: each keeps its instructions and demos in a cache slot of its own
+    prefix_lm = PrefixCachingLM(llm, backend=None if args.prefix_cache == "auto" else args.prefix_cache,
+                                slots=args.prefix_slots)
+    dspy.settings.configure(lm=lm_scheduler.wrap(prefix_lm, priority=SERVING))
+
+    server = ProgramServer(
+        lambda: load_programs(args.programs, args.max_concurrency, args.max_queue, args.allow_unoptimized),
+        args.host, args.port, default_timeout_s=args.timeout_s, max_timeout_s=args.max_timeout_s,
+    )
+    print(f"Serving on {server.url} (ready at {server.url}/ready, metrics at {server.url}/metrics)")
+    try:
+        asyncio.run(server.serve(install_signal_handlers=True))
+    finally:
+        print(lm_scheduler.report())
+        print(prefix_lm.report())
+        if mock:
+            mock.stop()
+
+
+if __name__ == "__main__":
+    main()
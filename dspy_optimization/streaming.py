@@ -0,0 +1,105 @@
+"""Emit each output field of a program as soon as it is complete in the LM's token stream.
+
+``SalesQualifier`` produces eight output fields; called normally, nothing is readable until the
+whole completion has arrived. ``FieldStreamer`` runs the program through ``dspy.streamify`` with
+one stream listener per string output field and yields a ``FieldUpdate`` the moment a field's
+text is closed (the next field starts, or the listener reports its last chunk), followed by the
+final ``dspy.Prediction``. Fields the stream did not carry (cache hits, non-string fields) are
+emitted from the final prediction.
+
+``ChainOfThought`` generates `reasoning` first, so the structured fields would only start after
+it. With ``answer_first=True`` the streamer works on a copy of the program whose signatures put
+`reasoning` last: `company_tier`, `deal_stage`, ... arrive after a few tokens and the reasoning
+streams in behind them.
+
+    streamer = FieldStreamer(optimized_qualifier, answer_first=True)
+    for update in streamer.stream(email_conversation=email):
+        if isinstance(update, FieldUpdate):
+            crm.update(update.name, update.value)       # acted on while reasoning is still generating
+"""
+import time
+from typing import AsyncIterator, Iterator
+
+import dspy
+from dspy.streaming import StreamListener, StreamResponse
+
+
+class FieldUpdate:
+    def __init__(self, predictor: str, name: str, value, elapsed_s: float, streamed: bool):
+        self.predictor = predictor
+        self.name = name
+        self.value = value
+        self.elapsed_s = elapsed_s
+        self.streamed = streamed
+
+    def __repr__(self):
+        return f"FieldUpdate({self.name}={self.value!r}, {self.elapsed_s * 1000:.0f} ms)"
+
+
+def _reasoning_last(signature):
+    fields = list(signature.output_fields)
+    if "reasoning" not in fields or fields[-1] == "reasoning":
+        return signature
+    reasoning = signature.output_fields["reasoning"]
+    return signature.delete("reasoning").append("reasoning", reasoning, type_=reasoning.annotation)
+
+
+class FieldStreamer:
+    def __init__(self, program: dspy.Module, answer_first: bool = False):
+        self.program = program.deepcopy() if answer_first else program
+        if answer_first:
+            for _, predictor in self.program.named_predictors():
+                predictor.signature = _reasoning_last(predictor.signature)
+
+    def _listeners(self) -> list[StreamListener]:
+        # listeners are single-use, so every call gets fresh ones
+        return [
+            StreamListener(signature_field_name=field, predict=predictor, predict_name=name)
+            for name, predictor in self.program.named_predictors()
+            for field, info in predictor.signature.output_fields.items()
+            if info.annotation is str
+        ]
+
+    def _updates(self, item, state: dict) -> list:
+        started, buffers, done = state["started"], state["buffers"], state["done"]
+        updates = []
+
+        def close(key):
+            if key not in done:
+                done.add(key)
+                updates.append(FieldUpdate(key[0], key[1], buffers[key].strip(), time.perf_counter() - started, True))
+
+        if isinstance(item, StreamResponse):
+            key = (item.predict_name, item.signature_field_name)
+            if state["current"] not in (None, key):
+                close(state["current"])
+            state["current"] = key
+            buffers[key] = buffers.get(key, "") + item.chunk
+            if getattr(item, "is_last_chunk", False):
+                close(key)
+        elif isinstance(item, dspy.Prediction):
+            if state["current"] is not None:
+                close(state["current"])
+            predictors = [name for name, _ in self.program.named_predictors()]
+            for field, value in item.items():
+                if not any((name, field) in done for name in predictors):
+                    updates.append(FieldUpdate(predictors[-1], field, value, time.perf_counter() - started, False))
+            updates.append(item)
+        return updates
+
+    @staticmethod
+    def _state() -> dict:
+        return {"started": time.perf_counter(), "buffers": {}, "done": set(), "current": None}
+
+    def stream(self, **inputs) -> Iterator["FieldUpdate | dspy.Prediction"]:
+        streaming_program = dspy.streamify(self.program, stream_listeners=self._listeners(), async_streaming=False)
+        state = self._state()
+        for item in streaming_program(**inputs):
+            yield from self._updates(item, state)
+
+    async def astream(self, **inputs) -> AsyncIterator["FieldUpdate | dspy.Prediction"]:
+        streaming_program = dspy.streamify(self.program, stream_listeners=self._listeners())
+        state = self._state()
+        async for item in streaming_program(**inputs):
+            for update in self._updates(item, state):
+                yield update
@@ -0,0 +1,163 @@
+"""Native structured outputs for dspy signatures, validated locally.
+
+``JSONAdapter`` asks for JSON and parses it afterwards; when the reply does not parse (a label
+outside ``NPSTopicLabel``, a sentiment of 11 when the field says ``le=10``) the call fails or
+falls back to another adapter, which is a second LM round trip for that request.
+``StructuredOutputAdapter`` instead compiles the signature's output fields, including their
+``Literal`` options and ``ge``/``le`` style constraints, into a JSON-schema ``response_format``
+(what ``traditional/1.main.py`` does with a pydantic model), so backends with constrained
+decoding (OpenAI/Azure structured outputs, Ollama ``format``) can only produce valid replies.
+Replies are validated against the same schema locally with pydantic, without another call.
+A reply with text around the JSON, or JSON that needs repair, is extracted the way
+``JSONAdapter`` does it and then validated the same way.
+
+Backends without schema support get plain JSON mode and the same local validation. Only when
+validation fails does the adapter fall back to a normal ``JSONAdapter`` call, and it counts
+how often that happens:
+
+    adapter = StructuredOutputAdapter()
+    dspy.configure(adapter=adapter)
+    ...
+    print(adapter.report())      # structured outputs: 0.0% parse failures, 0.0% fallbacks over 120 calls
+"""
+import threading
+from typing import Annotated, Any
+
+import dspy
+import litellm
+import pydantic
+from dspy.adapters.base import Adapter
+from dspy.utils.exceptions import AdapterParseError
+
+# providers whose chat endpoint accepts a JSON schema even where litellm's capability table lags behind
+_SCHEMA_PROVIDERS = ("ollama", "ollama_chat", "hosted_vllm")
+
+
+def output_model(signature) -> type[pydantic.BaseModel]:
+    """Pydantic model of the signature's outputs: same types, descriptions and value constraints."""
+    fields = {}
+    for name, info in signature.output_fields.items():
+        annotation = Annotated[(info.annotation, *info.metadata)] if info.metadata else info.annotation
+        desc = (info.json_schema_extra or {}).get("desc")
+        description = None if desc in (None, f"${{{name}}}") else desc
+        fields[name] = (annotation, pydantic.Field(description=description))
+    return pydantic.create_model(f"{signature.__name__}Output", __config__=pydantic.ConfigDict(extra="forbid"), **fields)
+
+
+def _strict(schema: Any) -> Any:
+    """Every object closed and fully required, as OpenAI's strict mode expects."""
+    if isinstance(schema, dict):
+        schema = {k: _strict(v) for k, v in schema.items() if k != "default"}
+        if schema.get("type") == "object" and "properties" in schema:
+            schema["additionalProperties"] = False
+            schema["required"] = list(schema["properties"])
+        return schema
+    if isinstance(schema, list):
+        return [_strict(item) for item in schema]
+    return schema
+
+
+class StructuredOutputAdapter(dspy.JSONAdapter):
+    def __init__(self, native: bool | None = None, fallback: bool = True, **kwargs):
+        """
+        Args:
+            native: Force (True) or disable (False) the JSON-schema request; by default it is used
+                when the model supports it.
+            fallback: On a reply that fails local validation, retry once through ``JSONAdapter``
+                instead of raising.
+        """
+        super().__init__(**kwargs)
+        self.native = native
+        self.fallback = fallback
+        # a plain JSONAdapter for fallback calls: calling JSONAdapter.__call__ on self would parse with self.parse
+        self._json_adapter = dspy.JSONAdapter(**kwargs)
+        self._models: dict[Any, type[pydantic.BaseModel]] = {}
+        self._lock = threading.Lock()
+        self._stats = {"calls": 0, "native": 0, "parse_failures": 0, "fallbacks": 0}
+
+    def _count(self, stat: str):
+        with self._lock:
+            self._stats[stat] += 1
+
+    def model_for(self, signature) -> type[pydantic.BaseModel]:
+        with self._lock:
+            if signature not in self._models:
+                self._models[signature] = output_model(signature)
+            return self._models[signature]
+
+    def response_format(self, signature) -> dict[str, Any]:
+        return {
+            "type": "json_schema",
+            "json_schema": {
+                "name": f"{signature.__name__}Output"[:64],
+                "strict": True,
+                "schema": _strict(self.model_for(signature).model_json_schema()),
+            },
+        }
+
+    def supports_schema(self, lm) -> bool:
+        if self.native is not None:
+            return self.native
+        provider = lm.model.split("/", 1)[0]
+        if provider in _SCHEMA_PROVIDERS:
+            return True
+        try:
+            return litellm.supports_response_schema(model=lm.model, custom_llm_provider=provider)
+        except Exception:
+            return False
+
+    def parse(self, signature, completion: str) -> dict[str, Any]:
+        model = self.model_for(signature)
+        text = completion.strip().removeprefix("```json").removeprefix("```").removesuffix("```")
+        try:
+            validated = model.model_validate_json(text)
+        except (ValueError, pydantic.ValidationError):
+            # text around the JSON or JSON needing repair: extract it like JSONAdapter, then validate the same way
+            try:
+                validated = model.model_validate(self._json_adapter.parse(signature, completion))
+            except (AdapterParseError, ValueError, pydantic.ValidationError) as e:
+                raise AdapterParseError(adapter_name="StructuredOutputAdapter", signature=signature,
+                                        lm_response=completion, message=str(e)) from e
+        return {name: getattr(validated, name) for name in signature.output_fields}
+
+    def _request_kwargs(self, lm, lm_kwargs, signature) -> dict[str, Any]:
+        self._count("calls")
+        if self.supports_schema(lm):
+            self._count("native")
+            return {**lm_kwargs, "response_format": self.response_format(signature)}
+        return {**lm_kwargs, "response_format": {"type": "json_object"}}
+
+    def _fallback(self, error: Exception):
+        self._count("parse_failures")
+        if not self.fallback:
+            raise error
+        self._count("fallbacks")
+
+    def __call__(self, lm, lm_kwargs, signature, demos, inputs):
+        request_kwargs = self._request_kwargs(lm, lm_kwargs, signature)
+        try:
+            # the base Adapter call: format, one LM call, parse; no adapter-level retries of its own
+            return Adapter.__call__(self, lm, request_kwargs, signature, demos, inputs)
+        except AdapterParseError as e:
+            self._fallback(e)
+        return self._json_adapter(lm, lm_kwargs, signature, demos, inputs)
+
+    async def acall(self, lm, lm_kwargs, signature, demos, inputs):
+        request_kwargs = self._request_kwargs(lm, lm_kwargs, signature)
+        try:
+            return await Adapter.acall(self, lm, request_kwargs, signature, demos, inputs)
+        except AdapterParseError as e:
+            self._fallback(e)
+        return await self._json_adapter.acall(lm, lm_kwargs, signature, demos, inputs)
+
+    def stats(self) -> dict[str, int | float]:
+        with self._lock:
+            s = dict(self._stats)
+        s["parse_failure_rate"] = s["parse_failures"] / s["calls"] if s["calls"] else 0.0
+        s["fallback_rate"] = s["fallbacks"] / s["calls"] if s["calls"] else 0.0
+        return s
+
+    def report(self) -> str:
+        s = self.stats()
+        return (f"Structured outputs: {s['parse_failure_rate']:.1%} parse failures, {s['fallback_rate']:.1%} fallbacks "
+                f"over {s['calls']} calls ({s['native']} with a JSON-schema response_format)")
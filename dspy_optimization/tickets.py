@@ -0,0 +1,71 @@
+"""Support-ticket routing program and data used by dspy/3.bootstrap_example.py."""
+import dspy
+
+# Define signature
+class RouteTicket(dspy.Signature):
+    """Route support tickets to appropriate teams."""
+    ticket_text = dspy.InputField(desc="Customer support ticket content")
+    team = dspy.OutputField(desc="One of: Billing, Technical, Sales, Urgent, General")
+
+# Training Data (20 examples)
+trainset = [
+    dspy.Example(ticket_text="I was double charged this month, need refund", team="Billing").with_inputs('ticket_text'),
+    dspy.Example(ticket_text="API giving 500 errors since morning", team="Technical").with_inputs('ticket_text'),
+    dspy.Example(ticket_text="Website completely down, customers complaining", team="Urgent").with_inputs('ticket_text'),
+    dspy.Example(ticket_text="Want to upgrade to enterprise plan", team="Sales").with_inputs('ticket_text'),
+    dspy.Example(ticket_text="Where to download invoice?", team="Billing").with_inputs('ticket_text'),
+    dspy.Example(ticket_text="Database connection timeout errors", team="Technical").with_inputs('ticket_text'),
+    dspy.Example(ticket_text="Payment failed but money deducted", team="Billing").with_inputs('ticket_text'),
+    dspy.Example(ticket_text="Can't login, password reset not working", team="Urgent").with_inputs('ticket_text'),
+    dspy.Example(ticket_text="Need pricing for 100 users", team="Sales").with_inputs('ticket_text'),
+    dspy.Example(ticket_text="How to export user data?", team="General").with_inputs('ticket_text'),
+    dspy.Example(ticket_text="Subscription cancelled but still charged", team="Billing").with_inputs('ticket_text'),
+    dspy.Example(ticket_text="Mobile app crashing on iOS", team="Technical").with_inputs('ticket_text'),
+    dspy.Example(ticket_text="Server not responding, complete outage", team="Urgent").with_inputs('ticket_text'),
+    dspy.Example(ticket_text="Interested in API partnership", team="Sales").with_inputs('ticket_text'),
+    dspy.Example(ticket_text="Where is my order confirmation?", team="General").with_inputs('ticket_text'),
+    dspy.Example(ticket_text="Tax ID missing from invoice", team="Billing").with_inputs('ticket_text'),
+    dspy.Example(ticket_text="Slow response times from API", team="Technical").with_inputs('ticket_text'),
+    dspy.Example(ticket_text="Security breach suspected", team="Urgent").with_inputs('ticket_text'),
+    dspy.Example(ticket_text="Volume discount for startup?", team="Sales").with_inputs('ticket_text'),
+    dspy.Example(ticket_text="How to change company address?", team="General").with_inputs('ticket_text'),
+]
+
+# Test Data (10 examples)
+testset = [
+    dspy.Example(ticket_text="Credit card declined but it should work", team="Billing").with_inputs('ticket_text'),
+    dspy.Example(ticket_text="SSL certificate expired error", team="Technical").with_inputs('ticket_text'),
+    dspy.Example(ticket_text="All services down across regions", team="Urgent").with_inputs('ticket_text'),
+    dspy.Example(ticket_text="Want to discuss custom solution", team="Sales").with_inputs('ticket_text'),
+    dspy.Example(ticket_text="Where to find documentation?", team="General").with_inputs('ticket_text'),
+    dspy.Example(ticket_text="Invoice amount doesn't match agreement", team="Billing").with_inputs('ticket_text'),
+    dspy.Example(ticket_text="Database backup failing", team="Technical").with_inputs('ticket_text'),
+    dspy.Example(ticket_text="Unauthorized charges on my account", team="Billing").with_inputs('ticket_text'),
+    dspy.Example(ticket_text="Can't process any payments", team="Urgent").with_inputs('ticket_text'),
+    dspy.Example(ticket_text="Feature comparison between plans", team="Sales").with_inputs('ticket_text'),
+]
+
+# Build the program
+class TicketRouter(dspy.Module):
+    def __init__(self):
+        super().__init__()
+        self.router = dspy.ChainOfThought(RouteTicket)
+    
+    def forward(self, ticket_text):
+        return self.router(ticket_text=ticket_text)
+
+    async def aforward(self, ticket_text):
+        return await self.router.acall(ticket_text=ticket_text)
+
+def exact_match(example, pred, trace=None):
+    return example.team.lower() == pred.team.lower()
+
+def business_critical_match(example, pred, trace=None):
+    """Urgent tickets must be correctly identified"""
+    if example.team == "Urgent":
+        return pred.team == "Urgent"
+    return example.team.lower() == pred.team.lower()
+
+def team_wise_accuracy(example, pred, trace=None):
+    """Returns team name if correct, else 'wrong' for analysis"""
+    return example.team if example.team.lower() == pred.team.lower() else "wrong"
@@ -0,0 +1,77 @@
+"""MLflow tracing for the example scripts, without paying for it at import time.
+
+``DSPY_TRACING`` selects the mode:
+
+* ``off``: mlflow is never imported.
+* ``lazy`` (default): mlflow is imported and autolog is enabled on the first dspy module or
+  evaluation call made from the main thread, so scripts that never call a program never pay
+  for it.
+* ``on``: set up immediately, as the scripts used to do.
+
+Either way, traces are handed to mlflow's background exporter (``MLFLOW_ENABLE_ASYNC_TRACE_LOGGING``)
+so logging them does not block the request path. An unreachable tracking server disables tracing
+with a warning instead of stalling the first call.
+"""
+import os
+import threading
+
+import dspy
+from dspy.utils.callback import BaseCallback
+
+DEFAULT_TRACKING_URI = "http://127.0.0.1:5000"
+
+
+def _enable(experiment: str, tracking_uri: str) -> bool:
+    os.environ.setdefault("MLFLOW_ENABLE_ASYNC_TRACE_LOGGING", "true")
+    # fail fast instead of retrying for minutes when no tracking server is running
+    os.environ.setdefault("MLFLOW_HTTP_REQUEST_MAX_RETRIES", "0")
+    os.environ.setdefault("MLFLOW_HTTP_REQUEST_TIMEOUT", "5")
+    import mlflow
+
+    try:
+        mlflow.set_tracking_uri(tracking_uri)
+        mlflow.set_experiment(experiment)
+    except Exception as e:
+        print(f"MLflow tracing disabled, tracking server at {tracking_uri} is not usable: {e}")
+        return False
+    mlflow.dspy.autolog()
+    return True
+
+
+class LazyTracing(BaseCallback):
+    """Enables MLflow autolog on the first module/evaluate call seen on the main thread."""
+
+    def __init__(self, experiment: str, tracking_uri: str):
+        self.experiment = experiment
+        self.tracking_uri = tracking_uri
+        self.done = False
+        self._lock = threading.Lock()
+
+    def _maybe_enable(self):
+        # dspy only lets the thread that configured settings change them, and autolog registers a callback
+        if self.done or threading.current_thread() is not threading.main_thread():
+            return
+        with self._lock:
+            if not self.done:
+                self.done = True
+                _enable(self.experiment, self.tracking_uri)
+
+    def on_module_start(self, call_id, instance, inputs):
+        self._maybe_enable()
+
+    def on_evaluate_start(self, call_id, instance, inputs):
+        self._maybe_enable()
+
+
+def setup_tracing(experiment: str, mode: str | None = None, tracking_uri: str | None = None) -> None:
+    """Configure MLflow tracing for a script according to `mode` (default: ``DSPY_TRACING`` or "lazy")."""
+    mode = (mode or os.getenv("DSPY_TRACING", "lazy")).lower()
+    tracking_uri = tracking_uri or os.getenv("MLFLOW_TRACKING_URI", DEFAULT_TRACKING_URI)
+    if mode == "off":
+        return
+    if mode == "on":
+        _enable(experiment, tracking_uri)
+    elif mode == "lazy":
+        dspy.settings.configure(callbacks=[*dspy.settings.callbacks, LazyTracing(experiment, tracking_uri)])
+    else:
+        raise ValueError(f"DSPY_TRACING must be one of off, lazy, on; got {mode!r}")
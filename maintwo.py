@@ -1,48 +1,49 @@
 import dspy
 import os
-import json
-from typing import Literal, List
-import mlflow
-import random
 
-
-mlflow.dspy.autolog()
-mlflow.set_tracking_uri("http://127.0.0.1:5000")
-# Create a unique name for your experiment.
-mlflow.set_experiment("DSPyToday")
+from dspy_optimization.artifact import export_artifact
+from dspy_optimization.cache import install_cache
+from dspy_optimization.checkpoint import CheckpointStore
+from dspy_optimization.coalesce import CoalescingLM
+from dspy_optimization.dataset import ColumnarDataset
+from dspy_optimization.distributed import DistributedEvaluate, executor_from_env
+from dspy_optimization.evaluation import PredictionSet
+from dspy_optimization.multilabel import format_multilabel_report
+from dspy_optimization.nps import NPS_TOPICS, NPSTopic, topic_jaccard
+from dspy_optimization.prefix_cache import PrefixCachingLM
+from dspy_optimization.racing import RacingMIPROv2
+from dspy_optimization.structured import StructuredOutputAdapter
+from dspy_optimization.ratelimit import OPTIMIZER, scheduler_from_env
+from dspy_optimization.tracing import setup_tracing
+
+
+# MLflow tracing, DSPY_TRACING=off|lazy|on (lazy: mlflow is imported on the first program call)
+setup_tracing("DSPyToday")
 
 key = os.getenv("AZURE_OPENAI_API_KEY")
 # llm = dspy.LM(model=f"azure/{os.getenv('AZURE_OPENAI_MODEL')}", api_key=key, api_base=os.getenv("AZURE_OPENAI_ENDPOINT"), api_version=os.getenv("AZURE_OPENAI_API_VERSION"))
 llm = dspy.LM('ollama_chat/llama3.2:1b', api_base='http://host.docker.internal:11434', api_key='')
+# the NPSTopic instructions and demos stay in Ollama's KV cache: model kept loaded, one slot per OLLAMA_NUM_PARALLEL
+prefix_lm = PrefixCachingLM(llm, keep_alive="30m")
+# 24 optimizer threads: throttled per deployment and identical prompts sent once; Ollama batches the rest itself
+lm_scheduler = scheduler_from_env()
+llm = CoalescingLM(lm_scheduler.wrap(prefix_lm, priority=OPTIMIZER))
 
 dspy.settings.configure(lm=llm, trace=[])
-# updating config
-dspy.configure_cache(enable_memory_cache=False, enable_disk_cache=False)
-
-dspy.configure(adapter=dspy.JSONAdapter())
-
-with open('data/nps_comments.json', 'r') as f:
-    nps_data = json.loads(f.read())
-    
-topics = set()
+# shared on-disk cache: re-running after a metric tweak replays earlier trials from disk
+lm_cache = install_cache()
 
-for rec in nps_data: 
-    for t in rec['topics']: 
-        topics.add(t)
+# List[NPSTopicLabel] is sent as a JSON schema (Ollama `format`), so replies can only contain known topics
+adapter = StructuredOutputAdapter()
+dspy.configure(adapter=adapter)
 
-print(list(topics))
+# comments and topic bitsets in numpy columns, memory-mapped from data/.nps_comments.columns after the first run
+nps_data = ColumnarDataset.from_file('data/nps_comments.json', cache_dir='data/.nps_comments.columns')
+print(nps_data.report())
+print(list(nps_data.labels))
 
 
 
-class NPSTopic(dspy.Signature):
-    """Classify NPS topics"""
-
-    comment: str = dspy.InputField()
-    answer: List[Literal['Slow or Unreliable Shipping', 'Inaccurate Product Descriptions or Photos', 'Limited Size or Shade Availability', 
-                    'Unresponsive or Generic Customer Support', 'Website or App Bugs', 'Confusing Loyalty or Discount Systems', 
-                    'Complicated Returns or Exchanges', 'Customs and Import Charges', 'Difficult Product Discovery', 
-                    'Damaged or Incorrect Items']] = dspy.OutputField()
-
 #print(nps_data[0])
 nps_topic_model = dspy.ChainOfThought(NPSTopic)
 
@@ -51,48 +52,49 @@ print("*************** response: ********************", response)
 
 dspy.inspect_history(n = 1)
 
-trainset = []
-valset = []
-for rec in nps_data: 
-    if random.random() <= 0.5:
-        trainset.append(
-            dspy.Example(
-                comment = rec['comment'],
-                answer = rec['topics']
-            ).with_inputs('comment')
-        )
-    else: 
-        valset.append(
-            dspy.Example(
-                comment = rec['comment'],
-                answer = rec['topics']
-            ).with_inputs('comment')
-        )
-        
-def list_exact_match(example, pred, trace=None):
-    """Custom metric for comparing lists of topics"""
-    try:
-        pred_answer = pred.answer
-        expected_answer = example.answer
-        
-        # Convert to sets for order-independent comparison
-        if isinstance(pred_answer, list) and isinstance(expected_answer, list):
-            return set(pred_answer) == set(expected_answer)
-        else:
-            return pred_answer == expected_answer
-    except Exception as e:
-        print(f"Error in metric: {e}")
-        return False
-    
-tp = dspy.MIPROv2(metric=list_exact_match, auto="light", num_threads=24)
-
-opt_nps_topic_model =  tp.compile(
-    nps_topic_model, 
-    trainset=trainset, 
-    valset=valset,
-    requires_permission_to_run = False, provide_traceback=True)
+# the same split on every run (stratified by topic combination), so checkpoints and cached trials replay;
+# the views build each dspy.Example only when the optimizer reads it
+trainset, valset = nps_data.split(val_fraction=0.5, seed=0)
+
+# full-valset evaluations of candidates that clearly lose to the best program so far stop after a few slices
+# per-example scores and bootstrapped demos are checkpointed (per model and adapter): a re-run after a crash
+# replays everything it has seen; on a slightly larger nps_comments.json only the new comments are bootstrapped,
+# but candidates built from the new demo sets are scored again
+checkpoint = CheckpointStore("dspy/checkpoints/nps_topic_miprov2.jsonl")
+# topic_jaccard gives partial credit per comment (exact matches only when accepting bootstrapped demos),
+# a smoother signal than all-or-nothing set equality
+# DSPY_WORKERS=8 scores trials and bootstraps demos in 8 worker processes instead of threads of this one;
+# DSPY_BROKER=host:port uses a broker that workers on other machines are attached to
+executor = executor_from_env()
+tp = RacingMIPROv2(metric=topic_jaccard, auto="light", num_threads=24, checkpoint=checkpoint, executor=executor)
+
+with lm_cache.pinned(), lm_scheduler.watch(interval_s=10):
+    opt_nps_topic_model =  tp.compile(
+        nps_topic_model, 
+        trainset=trainset, 
+        valset=valset,
+        requires_permission_to_run = False, provide_traceback=True)
+
+# reload with `python -m dspy_optimization.nps <comments> <output> --program dspy/nps_topic_miprov2.json` for bulk runs
+opt_nps_topic_model.save("dspy/nps_topic_miprov2.json")
+export_artifact(opt_nps_topic_model, "dspy/nps_topic_miprov2.artifact.json")
+
+# Jaccard, micro/macro F1 and per-topic precision/recall on the valset, scored in one numpy pass
+val_evaluation = DistributedEvaluate(executor=executor, devset=valset, metric=topic_jaccard, num_threads=24,
+                                     display_progress=True)(opt_nps_topic_model)
+print(format_multilabel_report(PredictionSet.from_evaluation(val_evaluation).multilabel("answer", NPS_TOPICS)))
 
 opt_nps_topic_model(comment = "Absolutely frustrated! Every time I find something I love, it's sold out in my size. What's the point of having a wishlist if nothing is ever available?"
 )
 
-dspy.inspect_history(n = 1)
\ No newline at end of file
+dspy.inspect_history(n = 1)
+print(lm_cache.report())
+print(llm.report())
+print(prefix_lm.report())
+print(lm_scheduler.report())
+print(tp.report())
+print(checkpoint.report())
+print(adapter.report())
+if executor is not None:
+    print(executor.report())
+    executor.close()
@@ -0,0 +1,66 @@
+import subprocess
+import sys
+from pathlib import Path
+
+import dspy
+import openai
+import pytest
+
+from dspy_optimization.artifact import ArtifactParseError, export_artifact, load_artifact, openai_completer
+from dspy_optimization.mock_lm import MockLMServer
+from dspy_optimization.nps import NPS_TOPICS, NPSTopic
+from dspy_optimization.sentiment import SentimentClassifier
+from dspy_optimization.structured import StructuredOutputAdapter
+
+
+def _export(tmp_path, signature, adapter):
+    path = tmp_path / "program.artifact.json"
+    export_artifact(dspy.Predict(signature), str(path), adapter=adapter)
+    return load_artifact(str(path))
+
+
+def test_chat_adapter_round_trip(tmp_path):
+    program = _export(tmp_path, SentimentClassifier, dspy.ChatAdapter())
+    sent = {}
+
+    def complete(messages, **lm_kwargs):
+        sent.update(lm_kwargs, messages=messages)
+        return "[[ ## sentiment ## ]]\n8\n\n[[ ## completed ## ]]"
+
+    assert program(complete, text="Love it").sentiment == 8
+    assert "Love it" in sent["messages"][-1]["content"]
+    assert "response_format" not in sent
+
+
+def test_structured_adapter_sends_its_schema_and_extracts_the_json(tmp_path):
+    program = _export(tmp_path, SentimentClassifier, StructuredOutputAdapter())
+    sent = {}
+
+    def complete(messages, **lm_kwargs):
+        sent.update(lm_kwargs)
+        return 'Sure! Here is the result: {"sentiment": 7}'
+
+    assert program(complete, text="Fine").sentiment == 7
+    schema = sent["response_format"]["json_schema"]["schema"]
+    assert schema["properties"]["sentiment"]["maximum"] == 10
+
+    with pytest.raises(ArtifactParseError):
+        program(lambda messages, **kw: "no idea", text="Fine")
+
+
+def test_structured_nps_artifact_against_the_mock_lm(tmp_path):
+    program = _export(tmp_path, NPSTopic, StructuredOutputAdapter())
+    with MockLMServer(port=0) as mock:
+        complete = openai_completer(openai.OpenAI(base_url=mock.url, api_key="mock"), "mock-lm")
+        topics = program(complete, comment="Parcel arrived two weeks late and the box was crushed.").answer
+    assert topics and set(topics) <= set(NPS_TOPICS)
+
+
+def test_loading_an_artifact_does_not_import_dspy(tmp_path):
+    path = tmp_path / "program.artifact.json"
+    export_artifact(dspy.Predict(SentimentClassifier), str(path), adapter=StructuredOutputAdapter())
+    code = (f"import sys; from dspy_optimization.artifact import load_artifact; load_artifact({str(path)!r}); "
+            "print('dspy' in sys.modules)")
+    out = subprocess.run([sys.executable, "-c", code], cwd=Path(__file__).parents[1],
+                         capture_output=True, text=True, check=True).stdout
+    assert out.strip() == "False"
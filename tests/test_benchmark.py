@@ -0,0 +1,19 @@
+import dspy
+from dspy.utils.exceptions import AdapterParseError
+
+from dspy_optimization.benchmark import BaselineParseError, summarize
+
+
+def test_only_parse_errors_count_as_parse_failures():
+    ok = {"latency": 0.1, "result": {"prompt_tokens": 10, "completion_tokens": 5}}
+    records = [
+        ok,
+        {"latency": 0.2, "error": AdapterParseError("JSONAdapter", dspy.Signature("text -> sentiment"), "{}")},
+        {"latency": 0.2, "error": BaselineParseError("no parsed output")},
+        {"latency": 0.2, "error": ValueError("bad request")},
+    ]
+
+    stats = summarize(records, duration=1.0)
+
+    assert stats["parse_failure_rate"] == 0.5
+    assert stats["error_rate"] == 0.25
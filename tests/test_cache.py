@@ -0,0 +1,43 @@
+import functools
+
+from dspy_optimization.cache import LMResponseCache
+
+
+def _request(content: str, **params):
+    return {"model": "openai/mock-lm", "messages": [{"role": "user", "content": content}], **params}
+
+
+def test_whitespace_only_differences_hit_and_api_key_is_ignored(tmp_path):
+    cache = LMResponseCache(directory=str(tmp_path))
+    cache.put(_request("Route this ticket.  \r\n", api_key="a"), "reply")
+
+    assert cache.get(_request("Route this ticket.", api_key="b")) == "reply"
+    assert cache.get(_request("Route another ticket.")) is None
+    assert cache.stats()["memory_hits"] == 1
+
+
+def test_expired_entries_miss_unless_pinned(tmp_path):
+    cache = LMResponseCache(directory=str(tmp_path), ttl_seconds=0)
+    cache.put(_request("hi"), "reply")
+
+    assert cache.get(_request("hi")) is None
+    with cache.pinned():
+        assert cache.get(_request("hi")) == "reply"
+
+
+def test_unpicklable_reply_stays_in_memory_without_failing_the_call(tmp_path):
+    cache = LMResponseCache(directory=str(tmp_path))
+    reply = lambda: None  # noqa: E731 - pickle rejects lambdas
+    cache.put(_request("hi"), reply)
+
+    assert cache.get(_request("hi")) is reply
+    cache.reset_memory_cache()
+    assert cache.get(_request("hi")) is None
+
+
+def test_partial_in_the_request_is_keyed_by_repr(tmp_path):
+    cache = LMResponseCache(directory=str(tmp_path))
+    request = _request("hi", tool=functools.partial(print, end=""))
+    cache.put(request, "reply")
+
+    assert cache.get(request) == "reply"
@@ -0,0 +1,103 @@
+import dspy
+
+from dspy_optimization.checkpoint import (CheckpointedBootstrapFewShot, CheckpointedEvaluate, CheckpointStore,
+                                          metric_key, program_fingerprint)
+
+
+class Router(dspy.Module):
+    def __init__(self):
+        super().__init__()
+        self.route = dspy.Predict("text -> label")
+
+    def forward(self, text):
+        return self.route(text=text)
+
+
+class Upper(dspy.Module):
+    """Labels a text by upper-casing it, without an LM; records every text it runs on."""
+
+    def __init__(self, fail_on=()):
+        super().__init__()
+        self.fail_on = set(fail_on)
+        self.calls = []
+
+    def forward(self, text):
+        self.calls.append(text)
+        if text in self.fail_on:
+            raise ConnectionError("LM unreachable")
+        return dspy.Prediction(label=text.upper())
+
+
+def exact_match(example, prediction, trace=None):
+    return float(example.label == prediction.label)
+
+
+def _examples(*texts):
+    return [dspy.Example(text=text, label=text.upper()).with_inputs("text") for text in texts]
+
+
+def test_store_replays_records_and_drops_a_torn_last_line(tmp_path):
+    path = tmp_path / "run.jsonl"
+    store = CheckpointStore(str(path))
+    store.put("score", "a", 1.0)
+    store.put("score", "b", 0.0)
+    with open(path, "a", encoding="utf-8") as f:
+        f.write('{"kind": "score", "key": "c", "val')
+
+    resumed = CheckpointStore(str(path))
+    assert resumed.items("score") == {"a": 1.0, "b": 0.0}
+    assert resumed.stats["loaded"] == 2
+    assert path.read_text(encoding="utf-8").endswith("\n")
+
+
+def test_resumed_evaluation_only_runs_what_is_missing(tmp_path):
+    path = str(tmp_path / "run.jsonl")
+    devset = _examples("a", "b", "c", "d")
+
+    crashed = Upper(fail_on={"c"})
+    CheckpointedEvaluate(store=CheckpointStore(path), devset=devset, metric=exact_match, num_threads=1)(crashed)
+    assert sorted(crashed.calls) == ["a", "b", "c", "d"]
+
+    # the failed call is not stored, so the resumed run retries it and nothing else
+    resumed = Upper()
+    result = CheckpointedEvaluate(store=CheckpointStore(path), devset=devset, metric=exact_match, num_threads=1)(resumed)
+    assert resumed.calls == ["c"]
+    assert result.score == 100.0
+    # replayed examples come back with their stored predictions, not empty ones
+    assert [prediction.label for _, prediction, _ in result.results] == ["A", "B", "C", "D"]
+
+    # a grown devset pays only for the new example
+    grown = Upper()
+    CheckpointedEvaluate(store=CheckpointStore(path), devset=devset + _examples("e"), metric=exact_match,
+                         num_threads=1)(grown)
+    assert grown.calls == ["e"]
+
+
+def test_bootstrap_keys_survive_a_grown_trainset(tmp_path):
+    store = CheckpointStore(str(tmp_path / "run.jsonl"))
+    trainset = _examples("a", "b", "c", "d")
+
+    def prepared(examples):
+        bootstrapper = CheckpointedBootstrapFewShot(metric=exact_match, store=store, max_labeled_demos=2)
+        bootstrapper.trainset = examples
+        bootstrapper._prepare_student_and_teacher(Router(), None)
+        return bootstrapper
+
+    before, after = prepared(trainset), prepared(trainset + _examples("e", "f", "g"))
+    # the teachers' labeled demos are sampled from different trainsets, but the stored traces still apply
+    assert program_fingerprint(before.teacher) != program_fingerprint(after.teacher)
+    assert before._bootstrap_key(trainset[0], 0) == after._bootstrap_key(trainset[0], 0)
+
+
+def _threshold_metric(threshold):
+    return lambda example, prediction, trace=None: float(len(prediction.label) >= threshold)
+
+
+def test_lambda_metrics_get_distinct_keys():
+    first = lambda example, prediction, trace=None: float(example.label == prediction.label)  # noqa: E731
+    second = lambda example, prediction, trace=None: float(example.label != prediction.label)  # noqa: E731
+
+    assert metric_key(first) != metric_key(second)
+    assert metric_key(_threshold_metric(1)) != metric_key(_threshold_metric(2))
+    assert metric_key(_threshold_metric(1)) == metric_key(_threshold_metric(1))
+    assert metric_key(exact_match) == f"{__name__}.exact_match"
@@ -0,0 +1,75 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from dspy_optimization.coalesce import CoalescingLM
+
+
+class _SlowLM:
+    model = "openai/fake"
+    model_type = "chat"
+    cache = False
+
+    def __init__(self):
+        self.kwargs = {"temperature": 0.0, "max_tokens": 100}
+        self.calls = 0
+
+    def forward(self, prompt=None, messages=None, **kwargs):
+        self.calls += 1
+        time.sleep(0.1)
+        return messages[-1]["content"].upper()
+
+
+def _ask(lm, text):
+    return lm.forward(messages=[{"role": "user", "content": text}])
+
+
+def test_identical_requests_in_flight_are_sent_once():
+    inner = _SlowLM()
+    lm = CoalescingLM(inner)
+    with ThreadPoolExecutor(max_workers=4) as pool:
+        replies = list(pool.map(lambda _: _ask(lm, "hi"), range(4)))
+
+    assert replies == ["HI"] * 4
+    assert inner.calls == 1
+    assert lm.stats()["coalesced"] == 3
+
+
+def test_short_batch_fn_reply_fails_every_caller_instead_of_hanging():
+    lm = CoalescingLM(_SlowLM(), max_batch_size=3, max_wait_ms=200,
+                      batch_fn=lambda requests: [r["messages"][-1]["content"] for r in requests][:1])
+    with ThreadPoolExecutor(max_workers=3) as pool:
+        futures = [pool.submit(_ask, lm, text) for text in ("a", "b", "c")]
+        for future in futures:
+            with pytest.raises(ValueError, match="1 responses for a batch of 3"):
+                future.result(timeout=5)
+
+
+def test_batches_beyond_the_limit_wait_and_grow():
+    running, peak, sizes = 0, 0, []
+    lock = threading.Lock()
+
+    def batch_fn(requests):
+        nonlocal running, peak
+        with lock:
+            running += 1
+            peak = max(peak, running)
+            sizes.append(len(requests))
+        time.sleep(0.2)
+        with lock:
+            running -= 1
+        return [r["messages"][-1]["content"] for r in requests]
+
+    lm = CoalescingLM(_SlowLM(), max_batch_size=8, max_wait_ms=0, max_concurrent_batches=1, batch_fn=batch_fn)
+    with ThreadPoolExecutor(max_workers=6) as pool:
+        first = pool.submit(_ask, lm, "first")
+        time.sleep(0.05)
+        rest = [pool.submit(_ask, lm, str(i)) for i in range(5)]
+        assert first.result(timeout=5) == "first"
+        assert [f.result(timeout=5) for f in rest] == [str(i) for i in range(5)]
+
+    # the five requests sent while the only slot was busy went out together
+    assert peak == 1
+    assert sizes == [1, 5]
@@ -0,0 +1,43 @@
+import dspy
+
+from dspy_optimization.copro import ParallelCOPRO
+
+SCORES = {"Be terse.": 0.5, "Be exact.": 1.0, "Guess.": 0.0}
+
+
+class _Program(dspy.Module):
+    """Answers with its own instruction, so the metric can score instructions without an LM."""
+
+    def __init__(self):
+        super().__init__()
+        self.predict = dspy.Predict("question -> answer")
+
+    def forward(self, question):
+        return dspy.Prediction(answer=self.predict.signature.instructions)
+
+
+def _metric(example, prediction, trace=None):
+    return SCORES.get(prediction.answer, 0.0)
+
+
+def test_compile_picks_the_best_instruction_and_tracks_stats(monkeypatch):
+    rounds = iter([[("Be terse.", "Answer:")], [("Be exact.", "Answer:"), ("Be terse.", "Answer:")]])
+    monkeypatch.setattr(ParallelCOPRO, "_propose", lambda self, generator, n, **inputs: next(rounds))
+    trainset = [dspy.Example(question=f"q{i}").with_inputs("question") for i in range(3)]
+
+    optimizer = ParallelCOPRO(metric=_metric, breadth=2, depth=2, track_stats=True, num_threads=2)
+    compiled = optimizer.compile(_Program(), trainset=trainset)
+
+    assert compiled.predict.signature.instructions == "Be exact."
+    # the repeated "Be terse." proposal is not scored again
+    assert compiled.total_calls == 3
+    assert optimizer.scoring_stats["scored"] == 9
+    assert [c["score"] for c in compiled.candidate_programs] == [100.0, 50.0, 0.0]
+    assert compiled.candidate_programs[0]["depth"] == 1
+    assert compiled.candidate_programs[1]["program"].predict.signature.instructions == "Be terse."
+
+    (best,) = compiled.results_best.values()
+    (latest,) = compiled.results_latest.values()
+    assert best["depth"] == [0, 1] and best["max"] == [50.0, 100.0]
+    assert latest["average"] == [25.0, 100.0]
+    assert list(compiled.results_best) == [id(compiled.predict)]
@@ -0,0 +1,153 @@
+import threading
+import time
+
+import dspy
+import pytest
+
+from dspy_optimization.distributed import Broker, DistributedEvaluate, DistributedExecutor, TaskFailed, Worker
+from dspy_optimization.evaluation import FailedPrediction, PredictionSet
+from dspy_optimization.mock_lm import MockLMServer
+
+
+def _task(task_id: str, blobs=()):
+    return task_id, "evaluate", b"payload", list(blobs)
+
+
+def test_lease_expiry_redispatches_to_another_worker():
+    broker = Broker(lease_s=0.05, max_attempts=3)
+    broker.submit([_task("t1")])
+
+    task_id, _, _, attempts = broker.lease("dead-worker", wait_s=0)
+    assert (task_id, attempts) == ("t1", 1)
+    assert broker.lease("other-worker", wait_s=0) is None
+
+    time.sleep(0.1)
+    task_id, _, _, attempts = broker.lease("other-worker", wait_s=0)
+    assert (task_id, attempts) == ("t1", 2)
+    assert broker.stats()["redispatched"] == 1
+
+    broker.complete("t1", "other-worker", True, 0.5)
+    assert broker.wait(["t1"], timeout_s=0) == {"t1": (True, 0.5)}
+
+
+def test_heartbeat_keeps_the_lease():
+    broker = Broker(lease_s=0.1)
+    broker.submit([_task("t1")])
+    broker.lease("w1", wait_s=0)
+    for _ in range(4):
+        time.sleep(0.05)
+        broker.heartbeat("w1", ["t1"])
+    assert broker.lease("w2", wait_s=0) is None
+    assert broker.stats()["redispatched"] == 0
+
+
+def test_task_lost_on_every_attempt_fails_and_is_retried_on_resubmit():
+    broker = Broker(lease_s=0.02, max_attempts=2)
+    broker.submit([_task("t1")])
+    for worker in ("w1", "w2"):
+        assert broker.lease(worker, wait_s=0)[0] == "t1"
+        time.sleep(0.05)
+
+    ok, value = broker.wait(["t1"], timeout_s=0.1)["t1"]
+    assert not ok and value.startswith("lost 2 times")
+
+    # a lost task is run again rather than replayed as lost
+    assert broker.submit([_task("t1")]) == 1
+    assert broker.lease("w3", wait_s=0)[0] == "t1"
+
+
+def test_duplicate_completion_keeps_the_first_result():
+    broker = Broker(lease_s=0.02)
+    broker.submit([_task("t1")])
+    broker.lease("slow-worker", wait_s=0)
+    time.sleep(0.05)
+    broker.lease("fast-worker", wait_s=0)
+
+    broker.complete("t1", "fast-worker", True, "first")
+    broker.complete("t1", "slow-worker", True, "second")
+
+    assert broker.wait(["t1"], timeout_s=0) == {"t1": (True, "first")}
+    assert broker.stats()["completed"] == 1
+
+
+def test_submitting_a_finished_task_is_deduplicated():
+    broker = Broker()
+    broker.submit([_task("t1")])
+    broker.lease("w1", wait_s=0)
+    broker.complete("t1", "w1", True, 1.0)
+
+    assert broker.submit([_task("t1")]) == 0
+    assert broker.stats()["deduplicated"] == 1
+    assert broker.lease("w1", wait_s=0) is None
+
+
+def test_blobs_of_pending_tasks_are_not_evicted():
+    broker = Broker(lease_s=0.05, max_blobs=1)
+    broker.put_blob("program:a", b"a")
+    broker.submit([_task("t1", ["program:a"])])
+    broker.put_blob("program:b", b"b")
+    time.sleep(0.1)
+    broker.put_blob("program:c", b"c")
+
+    # b went as the least recently used unreferenced blob; a is older, but t1 still needs it,
+    # and c was just put, for a task about to be submitted
+    assert broker.stats()["blobs"] == 2
+    assert not broker.has_blob("program:b")
+
+    broker.lease("w1", wait_s=0)
+    broker.complete("t1", "w1", True, 1.0)
+    assert not broker.has_blob("program:a")
+    assert broker.has_blob("program:c")
+
+
+def test_result_with_failed_calls_is_not_replayed():
+    broker = Broker()
+    broker.submit([_task("t1")])
+    broker.lease("w1", wait_s=0)
+    broker.complete("t1", "w1", True, [(None, 0.0, "Traceback ...")], reusable=False)
+
+    # the submitter still gets it, but the next submit runs the task again
+    assert broker.wait(["t1"], timeout_s=0)["t1"][0]
+    assert broker.submit([_task("t1")]) == 1
+
+
+def _answered(example, prediction, trace=None):
+    return float(bool(prediction.answer))
+
+
+def _evaluate(executor, max_errors):
+    devset = [dspy.Example(question=f"q{i}").with_inputs("question") for i in range(4)]
+    evaluate = DistributedEvaluate(devset=devset, metric=_answered, max_errors=max_errors, executor=executor)
+    return evaluate(dspy.Predict("question -> answer"))
+
+
+def test_examples_failing_on_workers_count_against_max_errors_and_are_retried(monkeypatch, caplog):
+    # the worker rebuilds the LM without its api_key and takes OPENAI_API_KEY from its environment
+    monkeypatch.delenv("OPENAI_API_KEY", raising=False)
+    broker = Broker(lease_s=5.0)
+    executor = DistributedExecutor(broker, "in-process", chunk_size=2)
+    worker = Worker(broker, threads=2)
+    thread = threading.Thread(target=worker.run, daemon=True)
+    thread.start()
+    lm = dspy.LM("openai/mock-lm", api_key="coordinator-only", cache=False, num_retries=0)
+    try:
+        with MockLMServer(port=0) as mock, dspy.context(lm=lm.copy(api_base=mock.url)):
+            with pytest.raises(TaskFailed, match="4 examples failed on the workers"):
+                _evaluate(executor, max_errors=2)
+            assert sum("Traceback" in record.getMessage() for record in caplog.records) == 1
+
+            result = _evaluate(executor, max_errors=10)
+            assert result.score == 0.0
+            assert all(isinstance(prediction, FailedPrediction) and prediction.error for _, prediction, _ in result.results)
+            assert PredictionSet.from_evaluation(result).failed == 4
+
+            # the failed chunks are run again, not replayed from the broker
+            monkeypatch.setenv("OPENAI_API_KEY", "mock")
+            result = _evaluate(executor, max_errors=2)
+    finally:
+        worker.stop()
+        thread.join()
+
+    assert result.score == 100.0
+    assert PredictionSet.from_evaluation(result).failed == 0
+    assert executor.stats()["reused"] == 0
@@ -0,0 +1,23 @@
+import random
+
+import dspy
+import pytest
+
+from dspy_optimization.mock_lm import generate_completion
+
+
+class _Triage(dspy.Signature):
+    ticket: str = dspy.InputField()
+    urgency: int = dspy.OutputField()
+    summary: str = dspy.OutputField()
+
+
+@pytest.mark.parametrize("adapter", [dspy.ChatAdapter(), dspy.JSONAdapter()], ids=["chat", "json"])
+def test_generated_reply_parses_with_the_adapter_that_asked(adapter):
+    messages = adapter.format(_Triage, demos=[], inputs={"ticket": "Checkout is down"})
+
+    reply = generate_completion(messages, json_mode=False, rng=random.Random(0))
+
+    parsed = adapter.parse(_Triage, reply)
+    assert isinstance(parsed["urgency"], int)
+    assert parsed["summary"].startswith("Mock summary")
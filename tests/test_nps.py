@@ -0,0 +1,54 @@
+import json
+import subprocess
+import sys
+from pathlib import Path
+
+from dspy_optimization.nps import classify_file
+
+
+class _Program:
+    def __init__(self, failing: set[str]):
+        self.failing = failing
+        self.calls = []
+
+    def __call__(self, comment):
+        self.calls.append(comment)
+        if comment in self.failing:
+            raise TimeoutError("LM timed out")
+        return type("Prediction", (), {"answer": [comment.upper()]})()
+
+
+def _read(path):
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f]
+
+
+def test_resume_retries_failed_records_and_skips_done_ones(tmp_path):
+    source = tmp_path / "comments.jsonl"
+    source.write_text("".join(json.dumps({"comment": c}) + "\n" for c in "abcd"), encoding="utf-8")
+    output = tmp_path / "topics.jsonl"
+
+    first = _Program(failing={"b"})
+    stats = classify_file(first, str(source), str(output), num_workers=2, progress_every=0)
+    assert (stats["classified"], stats["failed"]) == (3, 1)
+
+    # a crash left half of a line behind
+    with open(output, "a", encoding="utf-8") as f:
+        f.write('{"index": 4, "comm')
+
+    second = _Program(failing=set())
+    stats = classify_file(second, str(source), str(output), num_workers=2, progress_every=0)
+    assert second.calls == ["b"]
+    assert (stats["skipped"], stats["classified"], stats["failed"]) == (3, 1, 0)
+
+    last = {row["index"]: row for row in _read(output)}
+    assert [last[i]["answer"] for i in range(4)] == [["A"], ["B"], ["C"], ["D"]]
+
+
+def test_importing_the_signature_does_not_load_the_helpers():
+    code = ("import sys; from dspy_optimization.nps import NPSTopic; "
+            "print([m for m in ('dspy_optimization.multilabel', 'dspy_optimization.cache', "
+            "'dspy_optimization.structured') if m in sys.modules])")
+    out = subprocess.run([sys.executable, "-c", code], cwd=Path(__file__).parents[1],
+                         capture_output=True, text=True, check=True).stdout
+    assert out.strip() == "[]"
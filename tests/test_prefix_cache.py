@@ -0,0 +1,39 @@
+import asyncio
+
+import dspy
+
+from dspy_optimization.cache import LMResponseCache
+from dspy_optimization.mock_lm import MockLMServer
+from dspy_optimization.prefix_cache import PrefixCachingLM
+
+
+def _messages(program: str, question: str):
+    return [{"role": "system", "content": f"You are the {program} program."},
+            {"role": "user", "content": question}]
+
+
+def _check_cached_calls_keep_the_slot(tmp_path, call):
+    previous = dspy.cache
+    dspy.cache = LMResponseCache(directory=str(tmp_path))
+    try:
+        with MockLMServer(port=0) as mock:
+            lm = PrefixCachingLM(dspy.LM("openai/mock-lm", api_base=mock.url, api_key="mock", cache=True),
+                                 backend="llama.cpp", slots=1)
+            call(lm, _messages("router", "first"))
+            call(lm, _messages("sales", "first"))
+            # answered by the response cache: the router prefix must not take the only slot back
+            call(lm, _messages("router", "first"))
+            call(lm, _messages("sales", "second"))
+    finally:
+        dspy.cache = previous
+
+    stats = lm.stats()
+    assert (stats["calls"], stats["hits"], stats["response_cache_hits"]) == (3, 1, 1)
+
+
+def test_response_cache_hits_do_not_claim_a_slot(tmp_path):
+    _check_cached_calls_keep_the_slot(tmp_path, lambda lm, messages: lm.forward(messages=messages))
+
+
+def test_response_cache_hits_do_not_claim_a_slot_async(tmp_path):
+    _check_cached_calls_keep_the_slot(tmp_path, lambda lm, messages: asyncio.run(lm.aforward(messages=messages)))
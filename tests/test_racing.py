@@ -0,0 +1,60 @@
+import random
+
+import dspy
+
+from dspy_optimization.checkpoint import content_key, example_key
+from dspy_optimization.racing import RacingEvaluate
+
+
+class _Constant(dspy.Module):
+    def __init__(self, answer):
+        super().__init__()
+        self.answer = answer
+
+    def forward(self, question):
+        return dspy.Prediction(answer=self.answer)
+
+
+class _Lookup(dspy.Module):
+    def __init__(self, right):
+        super().__init__()
+        self.right = right
+
+    def forward(self, question):
+        return dspy.Prediction(answer="yes" if question in self.right else "no")
+
+
+def _exact(example, prediction, trace=None):
+    return example.answer == prediction.answer
+
+
+def _evaluate(min_rung_size=8, **kwargs):
+    devset = [dspy.Example(question=f"q{i}", answer="yes").with_inputs("question") for i in range(64)]
+    return RacingEvaluate(devset=devset, metric=_exact, num_threads=1, display_progress=False,
+                          min_rung_size=min_rung_size, **kwargs)
+
+
+def test_losing_candidate_stops_after_the_first_rung_and_cannot_become_incumbent():
+    evaluate = _evaluate()
+    assert evaluate(_Constant("yes")).score == 100.0
+
+    result = evaluate(_Constant("no"))
+    assert result.score == 0.0
+    assert len(result.results) == 8
+    assert evaluate.stats == {"calls": 2, "pruned": 1, "examples_scored": 72, "examples_skipped": 56}
+    assert list(evaluate.incumbents.values()) == [1.0]
+
+
+def test_slow_starter_that_wins_overall_is_not_dropped():
+    evaluate = _evaluate(min_rung_size=16)
+    devset = evaluate.devset
+    evaluate.incumbents[content_key(sorted(example_key(example) for example in devset))] = 0.88
+    # the order RacingEvaluate scores in; 9 of the first 16 right, then everything right: 57/64 = 0.89
+    order = random.Random(0).sample(devset, len(devset))
+    right = {example.question for example in order[:9] + order[16:]}
+
+    result = evaluate(_Lookup(right))
+
+    # with the full delta at each of the two tests, 9/16 + sqrt(ln(1/0.05) / 32) = 0.87 < 0.88 would prune
+    assert evaluate.stats["pruned"] == 0
+    assert result.score == 89.06
@@ -0,0 +1,120 @@
+import asyncio
+import threading
+import time
+
+from dspy_optimization.ratelimit import OPTIMIZER, SERVING, AdaptiveLimiter
+
+
+def _wait_for_queue(limiter: AdaptiveLimiter, depth: int):
+    deadline = time.monotonic() + 5
+    while limiter.stats()["queued"] < depth:
+        assert time.monotonic() < deadline, "waiters never queued"
+        time.sleep(0.01)
+
+
+def test_serving_callers_overtake_queued_optimizer_callers():
+    limiter = AdaptiveLimiter(max_concurrency=1)
+    limiter.acquire(OPTIMIZER)
+    admitted = []
+
+    def caller(name, priority):
+        limiter.acquire(priority)
+        admitted.append(name)
+        limiter.release(0.01)
+
+    threads = []
+    for name, priority in [("optimizer-1", OPTIMIZER), ("optimizer-2", OPTIMIZER), ("serving", SERVING)]:
+        thread = threading.Thread(target=caller, args=(name, priority))
+        thread.start()
+        threads.append(thread)
+        _wait_for_queue(limiter, len(threads))
+    assert limiter.queue_depth() == {"serving": 1, "optimizer": 2}
+
+    limiter.release(0.01)
+    for thread in threads:
+        thread.join(timeout=5)
+
+    # serving first; optimizer calls in arrival order
+    assert admitted == ["serving", "optimizer-1", "optimizer-2"]
+
+
+def test_throttling_halves_the_limit_and_success_grows_it_back():
+    limiter = AdaptiveLimiter(max_concurrency=8, decrease_cooldown_s=0.0)
+    limiter.acquire()
+    limiter.release(0.1, "throttled")
+    assert limiter.limit == 4
+
+    limiter.acquire()
+    limiter.release(0.1)
+    assert limiter.limit == 4.25
+
+
+def test_cached_calls_give_their_token_back_and_do_not_adapt():
+    limiter = AdaptiveLimiter(max_rps=1, max_concurrency=4)
+    limiter.limit = 2.0
+    started = time.monotonic()
+    for _ in range(5):
+        limiter.acquire()
+        limiter.release(0.0, "cached")
+
+    assert time.monotonic() - started < 0.5
+    assert limiter.limit == 2.0 and limiter.rate == 1
+    assert limiter.stats()["cached"] == 5
+
+
+def test_async_waiters_queue_on_the_event_loop_in_priority_order():
+    limiter = AdaptiveLimiter(max_concurrency=1)
+    admitted = []
+
+    async def caller(name, priority):
+        await limiter.aacquire(priority)
+        admitted.append(name)
+        await asyncio.sleep(0.01)
+        limiter.release(0.01)
+
+    async def main():
+        await limiter.aacquire(OPTIMIZER)
+        threads = threading.active_count()
+        tasks = [asyncio.create_task(caller(f"optimizer-{i}", OPTIMIZER)) for i in range(20)]
+        tasks.append(asyncio.create_task(caller("serving", SERVING)))
+        await asyncio.sleep(0.05)
+        # nobody holds a thread while waiting
+        assert threading.active_count() == threads
+        assert limiter.stats()["queued"] == 21
+        limiter.release(0.01)
+        await asyncio.gather(*tasks)
+
+    asyncio.run(main())
+    assert admitted == ["serving"] + [f"optimizer-{i}" for i in range(20)]
+
+
+def test_cancelled_async_waiter_leaves_the_queue():
+    limiter = AdaptiveLimiter(max_concurrency=1)
+
+    async def main():
+        await limiter.aacquire()
+        first = asyncio.create_task(limiter.aacquire())
+        second = asyncio.create_task(limiter.aacquire())
+        await asyncio.sleep(0.01)
+        first.cancel()
+        await asyncio.sleep(0.01)
+        assert limiter.stats()["queued"] == 1
+        limiter.release(0.01)
+        await asyncio.wait_for(second, timeout=1)
+
+    asyncio.run(main())
+    assert limiter.in_flight == 1
+
+
+def test_async_waiter_wakes_when_a_token_refills():
+    limiter = AdaptiveLimiter(max_rps=20, burst=1)
+
+    async def main():
+        await limiter.aacquire()
+        limiter.release(0.0)
+        started = time.monotonic()
+        await asyncio.wait_for(limiter.aacquire(), timeout=1)
+        return time.monotonic() - started
+
+    waited = asyncio.run(main())
+    assert 0.02 < waited < 0.5
@@ -0,0 +1,38 @@
+import json
+import urllib.error
+import urllib.request
+
+import dspy
+import pytest
+
+from dspy_optimization.server import Metrics, ProgramServer, ServedProgram
+
+
+def _post(url, body):
+    request = urllib.request.Request(url, data=json.dumps(body).encode(), method="POST")
+    try:
+        with urllib.request.urlopen(request, timeout=5) as response:
+            return response.status, json.load(response)
+    except urllib.error.HTTPError as e:
+        return e.code, json.load(e)
+
+
+@pytest.mark.parametrize("inputs", [["question"], "question", 3])
+def test_inputs_that_are_not_an_object_are_a_bad_request(inputs):
+    server = ProgramServer(lambda: {"qa": ServedProgram("qa", dspy.Predict("question -> answer"))}, port=0).start()
+    try:
+        assert server.wait_ready(timeout_s=10)
+        status, body = _post(f"{server.url}/v1/programs/qa", {"inputs": inputs})
+    finally:
+        server.stop()
+
+    assert status == 400
+    assert "inputs must be an object" in body["error"]
+
+
+def test_label_values_are_escaped():
+    metrics = Metrics()
+    metrics.inc("dspy_requests_total", program='a\\b"c\nd', code=200)
+
+    line = metrics.render({}).splitlines()[-1]
+    assert line == 'dspy_requests_total{program="a\\\\b\\"c\\nd",code="200"} 1'
@@ -0,0 +1,65 @@
+from types import SimpleNamespace
+
+import dspy
+import pytest
+from dspy.utils.exceptions import AdapterParseError
+
+from dspy_optimization.sentiment import SentimentClassifier
+from dspy_optimization.structured import StructuredOutputAdapter
+
+
+class ScriptedLM(dspy.BaseLM):
+    """Answers with the given replies in order and records the request kwargs."""
+
+    def __init__(self, *replies):
+        super().__init__(model="openai/scripted", cache=False)
+        self.replies = list(replies)
+        self.requests = []
+
+    def forward(self, prompt=None, messages=None, **kwargs):
+        self.requests.append(kwargs)
+        message = SimpleNamespace(content=self.replies.pop(0), tool_calls=None)
+        return SimpleNamespace(choices=[SimpleNamespace(message=message, finish_reason="stop")], usage={},
+                               model=self.model)
+
+
+def _classify(adapter, lm):
+    with dspy.context(lm=lm, adapter=adapter):
+        return dspy.Predict(SentimentClassifier)(text="Great service")
+
+
+def test_schema_is_sent_and_a_valid_reply_takes_one_call():
+    adapter, lm = StructuredOutputAdapter(native=True), ScriptedLM('{"sentiment": 8}')
+
+    assert _classify(adapter, lm).sentiment == 8
+    schema = lm.requests[0]["response_format"]["json_schema"]["schema"]
+    assert schema["properties"]["sentiment"]["maximum"] == 10
+    assert adapter.stats()["fallbacks"] == 0
+
+
+@pytest.mark.parametrize("reply", ['Sure! Here is the result: {"sentiment": 7}',
+                                   '```json\n{"sentiment": 7}\n``` Let me know if you need more.'])
+def test_text_around_the_json_is_extracted_without_a_second_call(reply):
+    adapter, lm = StructuredOutputAdapter(native=True), ScriptedLM(reply)
+
+    assert _classify(adapter, lm).sentiment == 7
+    assert len(lm.requests) == 1
+    assert adapter.stats()["parse_failures"] == 0
+
+
+def test_invalid_reply_falls_back_to_a_plain_json_adapter_call():
+    adapter = StructuredOutputAdapter(native=True)
+    lm = ScriptedLM('{"sentiment": 11}', 'Here you go: {"sentiment": 9}')
+
+    assert _classify(adapter, lm).sentiment == 9
+    assert len(lm.requests) == 2
+    assert lm.requests[1]["response_format"] == {"type": "json_object"}
+    assert adapter.stats()["fallbacks"] == 1
+
+
+def test_without_fallback_an_out_of_range_value_raises():
+    adapter = StructuredOutputAdapter(native=True, fallback=False)
+
+    with pytest.raises(AdapterParseError):
+        _classify(adapter, ScriptedLM('{"sentiment": 11}'))
+    assert adapter.stats()["parse_failures"] == 1